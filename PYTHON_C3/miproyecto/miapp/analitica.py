@@ -0,0 +1,132 @@
+"""Resúmenes de los resultados de los tests para el staff.
+
+``ResumenResultadosTest`` cuenta los resultados por (test, día, categoría
+recomendada, puntuación). De esa tabla salen, con una consulta agrupada cada
+una, la cantidad de resultados por día, la participación de cada categoría y
+la distribución de puntuaciones, sin recorrer ``ResultadoTest``.
+
+Cada resultado nuevo suma 1 a su fila al guardarse, en la misma transacción
+(``registrar_resultado`` la abre). Los resultados anteriores a los resúmenes
+tienen ``resumido=False`` y los suma ``manage.py resumir_resultados`` por
+lotes. Los resultados creados con ``bulk_create()``, que no envía señales,
+deben crearse con ``resumido=False`` para que los sume ese comando.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ResultadoTest, ResumenResultadosTest
+
+
+# ==================== ACTUALIZACIÓN ====================
+
+def sumar(test_id, dia, categoria_id, puntuacion, cantidad=1):
+    """Suma ``cantidad`` (puede ser negativa) a una fila del resumen."""
+    filas = ResumenResultadosTest.objects.filter(
+        test_id=test_id, dia=dia, categoria_id=categoria_id, puntuacion=puntuacion,
+    )
+    if filas.update(total=F('total') + cantidad) or cantidad < 0:
+        return
+    # Primer resultado con esta combinación. ignore_conflicts: si otra
+    # transacción creó la fila al mismo tiempo, igual se suma con el UPDATE
+    ResumenResultadosTest.objects.bulk_create([
+        ResumenResultadosTest(test_id=test_id, dia=dia, categoria_id=categoria_id, puntuacion=puntuacion)
+    ], ignore_conflicts=True)
+    filas.update(total=F('total') + cantidad)
+
+
+def resumir_pendientes(ids):
+    """Suma los resultados ``ids`` que todavía no estén resumidos; devuelve cuántos sumó.
+
+    Hay que llamarla dentro de una transacción: bloquea los resultados para
+    que dos ejecuciones no los sumen dos veces.
+    """
+    pendientes = ResultadoTest.objects.filter(id__in=ids, resumido=False)
+    ids = list(pendientes.select_for_update().values_list('id', flat=True))
+    if not ids:
+        return 0
+    grupos = (
+        ResultadoTest.objects.filter(id__in=ids)
+        .values('test_id', 'categoria_recomendada_id', 'puntuacion_total', dia=TruncDate('completado_en'))
+        .annotate(cantidad=Count('id'))
+        .order_by()
+    )
+    for grupo in grupos:
+        sumar(grupo['test_id'], grupo['dia'], grupo['categoria_recomendada_id'], grupo['puntuacion_total'],
+              grupo['cantidad'])
+    ResultadoTest.objects.filter(id__in=ids).update(resumido=True)
+    return len(ids)
+
+
+def _fila(resultado):
+    return (
+        resultado.test_id,
+        timezone.localdate(resultado.completado_en),
+        resultado.categoria_recomendada_id,
+        resultado.puntuacion_total,
+    )
+
+
+@receiver(post_save, sender=ResultadoTest, dispatch_uid='analitica:resultado:guardado')
+def sumar_resultado(sender, instance, created, raw=False, **kwargs):
+    if created and instance.resumido and not raw:
+        sumar(*_fila(instance))
+
+
+@receiver(post_delete, sender=ResultadoTest, dispatch_uid='analitica:resultado:borrado')
+def restar_resultado(sender, instance, **kwargs):
+    if instance.resumido:
+        sumar(*_fila(instance), cantidad=-1)
+
+
+# ==================== CONSULTA ====================
+
+def resumen_test(test_id, desde, hasta):
+    """Tendencia diaria, categorías y puntuaciones de un test entre dos días (incluidos)."""
+    filas = ResumenResultadosTest.objects.filter(test_id=test_id, dia__range=(desde, hasta))
+
+    por_dia = {
+        fila['dia']: fila
+        for fila in filas.values('dia').annotate(
+            resultados=Sum('total'), puntos=Sum(F('total') * F('puntuacion')),
+        ).order_by()
+    }
+    categorias = list(
+        filas.values('categoria_id', nombre=F('categoria__nombre'), color=F('categoria__color'))
+        .annotate(resultados=Sum('total'))
+        .filter(resultados__gt=0)
+        .order_by('-resultados', 'nombre')
+    )
+    puntuaciones = list(
+        filas.values('puntuacion').annotate(resultados=Sum('total')).filter(resultados__gt=0).order_by('puntuacion')
+    )
+
+    total = sum(categoria['resultados'] for categoria in categorias)
+    maximo_dia = max((fila['resultados'] for fila in por_dia.values()), default=0)
+    maximo_puntuacion = max((fila['resultados'] for fila in puntuaciones), default=0)
+
+    # Todos los días del rango, también los que no tuvieron resultados
+    dias = []
+    dia = desde
+    while dia <= hasta:
+        fila = por_dia.get(dia)
+        resultados = fila['resultados'] if fila else 0
+        dias.append({
+            'dia': dia,
+            'resultados': resultados,
+            'promedio': round(fila['puntos'] / resultados, 1) if resultados else None,
+            'porcentaje_maximo': round(100 * resultados / maximo_dia) if maximo_dia else 0,
+        })
+        dia += timedelta(days=1)
+
+    for categoria in categorias:
+        categoria['porcentaje'] = round(100 * categoria['resultados'] / total, 1)
+    for fila in puntuaciones:
+        fila['porcentaje'] = round(100 * fila['resultados'] / total, 1)
+        fila['porcentaje_maximo'] = round(100 * fila['resultados'] / maximo_puntuacion)
+
+    return {'dias': dias, 'categorias': categorias, 'puntuaciones': puntuaciones, 'total': total}
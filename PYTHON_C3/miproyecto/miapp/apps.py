@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class MiappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'miapp'
+
+    def ready(self):
+        # Conecta las señales que mantienen las estadísticas en caché,
+        # el índice de búsqueda, la popularidad de los hilos, los eventos en
+        # vivo, las métricas de los dashboards, el catálogo de recursos, sus
+        # archivos y derivados, los tests compilados, los resúmenes de sus
+        # resultados y la medición de consultas
+        from . import (  # noqa: F401
+            analitica, archivos, busqueda, catalogo, derivados, estadisticas, evaluacion, eventos,
+            instrumentacion, metricas, popularidad,
+        )
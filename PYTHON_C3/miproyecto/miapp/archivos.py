@@ -0,0 +1,215 @@
+"""Entrega y subida de los archivos de los recursos.
+
+Los archivos de ``Recurso.archivo`` sólo se entregan a usuarios autenticados
+desde la vista ``archivo_recurso``, nunca como /media/ público. La respuesta
+admite ``Range`` (para adelantar videos), ``ETag``/``If-None-Match`` y
+``Last-Modified``. Según ``RECURSOS_ENTREGA``:
+
+- ``'django'``: el archivo se transmite por bloques con ``FileResponse`` (el
+  servidor WSGI puede usar ``sendfile`` a través de ``wsgi.file_wrapper``).
+- ``'x-accel'``: Django sólo comprueba permisos y nginx envía el archivo::
+
+      location /protegido/ {
+          internal;
+          alias /ruta/a/media/;
+      }
+
+- ``'x-sendfile'``: igual, con la cabecera ``X-Sendfile`` (Apache, lighttpd).
+
+Las subidas nunca quedan enteras en memoria: por encima de
+``FILE_UPLOAD_MAX_MEMORY_SIZE`` Django las escribe por bloques en un archivo
+temporal que después se mueve a ``MEDIA_ROOT``. ``LimiteTamanoUploadHandler``
+corta la subida en cuanto un archivo supera ``RECURSOS_ARCHIVO_MAX_BYTES``.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.template.defaultfilters import filesizeformat
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .models import Recurso
+
+# Tamaño de los bloques que se leen del disco al transmitir
+BLOQUE = 64 * 1024
+
+_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+# ==================== ENTREGA ====================
+
+def _etag(estado):
+    return f'"{estado.st_size:x}-{estado.st_mtime_ns:x}"'
+
+
+def _rango(request, tamano, etag, modificado):
+    """Devuelve (inicio, fin) del rango pedido, None para el archivo entero
+    o False si el rango no se puede satisfacer."""
+    cabecera = request.headers.get('Range')
+    if not cabecera or request.method not in ('GET', 'HEAD'):
+        return None
+
+    # If-Range: el rango sólo vale si el archivo no cambió desde que se pidió
+    si_rango = request.headers.get('If-Range')
+    if si_rango and si_rango != etag and parse_http_date_safe(si_rango) != modificado:
+        return None
+
+    coincidencia = _RANGO.match(cabecera.strip())
+    if not coincidencia:
+        # Varios rangos o unidades desconocidas: se entrega el archivo entero
+        return None
+
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        if not fin:
+            return None
+        # bytes=-N: los últimos N bytes
+        inicio, fin = max(tamano - int(fin), 0), tamano - 1
+    else:
+        inicio = int(inicio)
+        fin = min(int(fin), tamano - 1) if fin else tamano - 1
+
+    if inicio >= tamano or inicio > fin:
+        return False
+    return inicio, fin
+
+
+def _leer_tramo(ruta, inicio, largo):
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(inicio)
+        while largo > 0:
+            datos = archivo.read(min(BLOQUE, largo))
+            if not datos:
+                break
+            largo -= len(datos)
+            yield datos
+
+
+def respuesta_archivo(request, campo, nombre=None):
+    """Respuesta HTTP para el ``FieldFile`` ``campo``, o para el archivo
+    ``nombre`` del mismo almacenamiento (los derivados)."""
+    nombre = nombre or campo.name
+    ruta = campo.storage.path(nombre)
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        raise Http404('El archivo no existe')
+
+    etag = _etag(estado)
+    modificado = int(estado.st_mtime)
+    cabeceras = {
+        'ETag': etag,
+        'Last-Modified': http_date(modificado),
+        'Accept-Ranges': 'bytes',
+        # Los permisos pueden cambiar: el navegador guarda el archivo pero lo revalida
+        'Cache-Control': 'private, no-cache',
+    }
+
+    condicional = get_conditional_response(request, etag=etag, last_modified=modificado)
+    if condicional is not None:
+        for nombre_cabecera, valor in cabeceras.items():
+            condicional[nombre_cabecera] = valor
+        return condicional
+
+    nombre_descarga = os.path.basename(nombre)
+    tipo = mimetypes.guess_type(nombre_descarga)[0] or 'application/octet-stream'
+    entrega = getattr(settings, 'RECURSOS_ENTREGA', 'django')
+
+    if entrega == 'x-accel':
+        # nginx atiende Range y las cabeceras condicionales de la ubicación interna
+        respuesta = HttpResponse(content_type=tipo)
+        prefijo = getattr(settings, 'RECURSOS_X_ACCEL_PREFIJO', '/protegido/')
+        respuesta['X-Accel-Redirect'] = prefijo + quote(nombre)
+    elif entrega == 'x-sendfile':
+        respuesta = HttpResponse(content_type=tipo)
+        respuesta['X-Sendfile'] = ruta
+    else:
+        rango = _rango(request, estado.st_size, etag, modificado)
+        if rango is False:
+            respuesta = HttpResponse(status=416)
+            respuesta['Content-Range'] = f'bytes */{estado.st_size}'
+            return respuesta
+        if rango:
+            inicio, fin = rango
+            largo = fin - inicio + 1
+            respuesta = StreamingHttpResponse(_leer_tramo(ruta, inicio, largo), status=206, content_type=tipo)
+            respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{estado.st_size}'
+            respuesta['Content-Length'] = str(largo)
+        else:
+            respuesta = FileResponse(open(ruta, 'rb'), content_type=tipo)
+            respuesta.block_size = BLOQUE
+
+    respuesta['Content-Disposition'] = content_disposition_header(False, nombre_descarga)
+    for nombre_cabecera, valor in cabeceras.items():
+        respuesta[nombre_cabecera] = valor
+    return respuesta
+
+
+# ==================== SUBIDA ====================
+
+class LimiteTamanoUploadHandler(FileUploadHandler):
+    """Corta la subida cuando un archivo supera ``RECURSOS_ARCHIVO_MAX_BYTES``.
+
+    Va primero en ``FILE_UPLOAD_HANDLERS``: ve cada bloque antes que los
+    manejadores que lo guardan en memoria o en el archivo temporal.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        limite = getattr(settings, 'RECURSOS_ARCHIVO_MAX_BYTES', None)
+        if limite is not None and start + len(raw_data) > limite:
+            self.request.archivo_rechazado = (
+                f'El archivo "{self.file_name}" supera el tamaño máximo de {filesizeformat(limite)}'
+            )
+            # Se descarta el resto del cuerpo sin guardarlo
+            raise StopUpload(connection_reset=False)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def archivo_rechazado(request):
+    """Mensaje de error si la subida de esta petición se cortó, o None."""
+    # Accede a FILES para asegurar que el cuerpo ya se procesó
+    request.FILES
+    return getattr(request, 'archivo_rechazado', None)
+
+
+def borrar_si_no_se_usan(storage, nombres):
+    """Borra los archivos de ``nombres`` que ya ningún recurso usa.
+
+    Varios recursos pueden compartir archivo cuando miapp.derivados detecta
+    que tienen el mismo contenido.
+    """
+    nombres = set(filter(None, nombres))
+    if not nombres:
+        return
+    en_uso = set(Recurso.objects.filter(archivo__in=nombres).values_list('archivo', flat=True))
+    for nombre in nombres - en_uso:
+        storage.delete(nombre)
+
+
+def guardar_recurso(recurso, archivo=None):
+    """Guarda el recurso; si llega ``archivo`` reemplaza al anterior, que se borra."""
+    anterior = recurso.archivo.name if recurso.archivo else None
+    if archivo:
+        recurso.archivo = archivo
+    recurso.save()
+    if archivo and anterior and anterior != recurso.archivo.name:
+        storage = recurso.archivo.storage
+        transaction.on_commit(lambda: borrar_si_no_se_usan(storage, [anterior]))
+
+
+@receiver(post_delete, sender=Recurso)
+def borrar_archivo_recurso(sender, instance, **kwargs):
+    if instance.archivo:
+        storage, nombre = instance.archivo.storage, instance.archivo.name
+        transaction.on_commit(lambda: borrar_si_no_se_usan(storage, [nombre]))
@@ -0,0 +1,22 @@
+"""Backend de autenticación de miapp."""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+class BackendConPerfil(ModelBackend):
+    """
+    ModelBackend que carga el usuario de la sesión junto con su perfil.
+
+    ``request.user`` llega con ``userprofile`` ya cargado en la misma consulta,
+    así el rol (``request.role``) y las plantillas que leen el perfil no cuestan
+    consultas extra.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related('userprofile').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
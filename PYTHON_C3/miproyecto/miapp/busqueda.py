@@ -0,0 +1,245 @@
+"""Búsqueda de texto completo en hilos y respuestas del foro.
+
+En PostgreSQL cada tabla tiene una columna ``busqueda`` de tipo tsvector,
+generada por la base de datos con el diccionario ``spanish`` (título con peso A,
+contenido con peso B) y un índice GIN. En SQLite, para poder probar en local,
+se usan tablas virtuales FTS5 que se mantienen con las señales de este módulo.
+Las columnas, tablas e índices se crean en la migración 0005.
+"""
+import re
+
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import HiloForo, RespuestaForo
+
+RESULTADOS_POR_PAGINA = 20
+
+# Marcas que la base de datos pone alrededor de las coincidencias. Son
+# caracteres de control (STX y ETX) para que el texto de los usuarios no pueda
+# imitarlas; se cambian por <mark> después de escapar el texto.
+MARCA_INICIO = '\x02'
+MARCA_FIN = '\x03'
+
+OPCIONES_TITULO = f'HighlightAll=true, StartSel={MARCA_INICIO}, StopSel={MARCA_FIN}'
+OPCIONES_FRAGMENTO = (
+    f'StartSel={MARCA_INICIO}, StopSel={MARCA_FIN}, MaxFragments=2, MaxWords=30, MinWords=10'
+)
+
+FTS_HILOS = 'miapp_hiloforo_fts'
+FTS_RESPUESTAS = 'miapp_respuestaforo_fts'
+
+
+class ResultadosBusqueda:
+    """Una página de resultados, ya ordenada por relevancia."""
+
+    def __init__(self, objetos, pagina, tiene_siguiente):
+        self.objetos = objetos
+        self.pagina = pagina
+        self.tiene_siguiente = tiene_siguiente
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    @property
+    def tiene_anterior(self):
+        return self.pagina > 1
+
+
+def resaltar(texto):
+    """Escapa el texto y convierte las marcas de coincidencia en <mark>.
+
+    Una marca que no abre o cierra una coincidencia (por ejemplo, un carácter
+    de control que venía en el texto) se descarta, así que las etiquetas
+    siempre quedan balanceadas.
+    """
+    partes = []
+    abierta = False
+    for parte in re.split(f'({MARCA_INICIO}|{MARCA_FIN})', texto or ''):
+        if parte == MARCA_INICIO:
+            if not abierta:
+                partes.append('<mark>')
+                abierta = True
+        elif parte == MARCA_FIN:
+            if abierta:
+                partes.append('</mark>')
+                abierta = False
+        else:
+            partes.append(escape(parte))
+    if abierta:
+        partes.append('</mark>')
+    return mark_safe(''.join(partes))
+
+
+def buscar(texto, en='hilos', pagina=1):
+    """
+    Busca ``texto`` en hilos (``en='hilos'``) o en respuestas (``en='respuestas'``).
+
+    Cada resultado trae los atributos ``rango``, ``titulo_resaltado`` (sólo
+    hilos) y ``fragmento`` con las coincidencias marcadas.
+    """
+    texto = (texto or '').strip()
+    pagina = max(pagina, 1)
+    # Se pide una fila extra sólo para saber si hay otra página
+    limite = RESULTADOS_POR_PAGINA + 1
+    desplazamiento = (pagina - 1) * RESULTADOS_POR_PAGINA
+
+    if connection.vendor == 'postgresql':
+        sql, params = _consulta_postgresql(texto, en, limite, desplazamiento)
+    elif connection.vendor == 'sqlite':
+        sql, params = _consulta_sqlite(texto, en, limite, desplazamiento)
+    else:
+        raise NotImplementedError(f'Búsqueda no disponible para {connection.vendor}')
+
+    if sql is None:
+        return ResultadosBusqueda([], pagina, False)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        filas = cursor.fetchall()
+    tiene_siguiente = len(filas) > RESULTADOS_POR_PAGINA
+    filas = filas[:RESULTADOS_POR_PAGINA]
+
+    ids = [fila[0] for fila in filas]
+    if en == 'hilos':
+        objetos = HiloForo.objects.select_related('categoria').in_bulk(ids)
+    else:
+        objetos = RespuestaForo.objects.select_related('hilo', 'hilo__categoria').in_bulk(ids)
+
+    resultados = []
+    for objeto_id, rango, titulo, fragmento in filas:
+        objeto = objetos.get(objeto_id)
+        if objeto is None:
+            continue
+        objeto.rango = rango
+        objeto.titulo_resaltado = resaltar(titulo) if titulo is not None else None
+        objeto.fragmento = resaltar(fragmento)
+        resultados.append(objeto)
+
+    return ResultadosBusqueda(resultados, pagina, tiene_siguiente)
+
+
+# ==================== POSTGRESQL ====================
+
+def _consulta_postgresql(texto, en, limite, desplazamiento):
+    if not texto:
+        return None, []
+
+    if en == 'hilos':
+        tabla = HiloForo._meta.db_table
+        resaltado = "ts_headline('spanish', t.titulo, q.consulta, %s), ts_headline('spanish', t.contenido, q.consulta, %s)"
+        params_resaltado = [OPCIONES_TITULO, OPCIONES_FRAGMENTO]
+    else:
+        tabla = RespuestaForo._meta.db_table
+        resaltado = "NULL, ts_headline('spanish', t.contenido, q.consulta, %s)"
+        params_resaltado = [OPCIONES_FRAGMENTO]
+
+    # La página se resuelve primero con el índice GIN y el rango; los
+    # fragmentos resaltados se calculan después sólo para esas filas
+    sql = f"""
+        WITH q AS (SELECT websearch_to_tsquery('spanish', %s) AS consulta),
+        pagina AS (
+            SELECT t.id, ts_rank_cd(t.busqueda, q.consulta) AS rango
+            FROM {tabla} t, q
+            WHERE t.busqueda @@ q.consulta
+            ORDER BY rango DESC, t.id DESC
+            LIMIT %s OFFSET %s
+        )
+        SELECT p.id, p.rango, {resaltado}
+        FROM pagina p JOIN {tabla} t ON t.id = p.id, q
+        ORDER BY p.rango DESC, p.id DESC
+    """
+    return sql, [texto, limite, desplazamiento] + params_resaltado
+
+
+# ==================== SQLITE (FTS5) ====================
+
+def _consulta_fts5(texto):
+    # FTS5 no tiene un stemmer en español: cada palabra se busca como
+    # prefijo ("ansied"* encuentra ansiedad y ansiedades). Las comillas
+    # evitan que la entrada del usuario se interprete como sintaxis FTS5.
+    palabras = re.findall(r'\w+', texto)
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def _consulta_sqlite(texto, en, limite, desplazamiento):
+    consulta = _consulta_fts5(texto)
+    if not consulta:
+        return None, []
+
+    if en == 'hilos':
+        tabla = FTS_HILOS
+        # bm25 con más peso para el título; en FTS5 un rango menor es mejor
+        columnas = (
+            f"-bm25({tabla}, 10.0, 1.0), "
+            f"highlight({tabla}, 0, '{MARCA_INICIO}', '{MARCA_FIN}'), "
+            f"snippet({tabla}, 1, '{MARCA_INICIO}', '{MARCA_FIN}', ' ... ', 30)"
+        )
+    else:
+        tabla = FTS_RESPUESTAS
+        columnas = (
+            f"-bm25({tabla}), NULL, "
+            f"snippet({tabla}, 0, '{MARCA_INICIO}', '{MARCA_FIN}', ' ... ', 30)"
+        )
+
+    sql = f"""
+        SELECT rowid, {columnas}
+        FROM {tabla}
+        WHERE {tabla} MATCH %s
+        ORDER BY bm25({tabla}), rowid DESC
+        LIMIT %s OFFSET %s
+    """
+    return sql, [consulta, limite, desplazamiento]
+
+
+def _reindexar_sqlite(tabla, objeto_id, valores):
+    columnas = ', '.join(['rowid'] + list(valores))
+    marcadores = ', '.join(['%s'] * (len(valores) + 1))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {tabla} WHERE rowid = %s', [objeto_id])
+        cursor.execute(
+            f'INSERT INTO {tabla} ({columnas}) VALUES ({marcadores})',
+            [objeto_id] + list(valores.values()),
+        )
+
+
+def _borrar_de_indice_sqlite(tabla, objeto_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {tabla} WHERE rowid = %s', [objeto_id])
+
+
+def _toca_texto(update_fields, campos):
+    return update_fields is None or bool(set(update_fields) & set(campos))
+
+
+# ==================== SEÑALES (sólo SQLite) ====================
+# En PostgreSQL la columna tsvector es generada por la base de datos
+
+@receiver(post_save, sender=HiloForo)
+def indexar_hilo(sender, instance, update_fields=None, **kwargs):
+    if connection.vendor == 'sqlite' and _toca_texto(update_fields, ('titulo', 'contenido')):
+        _reindexar_sqlite(FTS_HILOS, instance.pk, {'titulo': instance.titulo, 'contenido': instance.contenido})
+
+
+@receiver(post_delete, sender=HiloForo)
+def desindexar_hilo(sender, instance, **kwargs):
+    if connection.vendor == 'sqlite':
+        _borrar_de_indice_sqlite(FTS_HILOS, instance.pk)
+
+
+@receiver(post_save, sender=RespuestaForo)
+def indexar_respuesta(sender, instance, update_fields=None, **kwargs):
+    if connection.vendor == 'sqlite' and _toca_texto(update_fields, ('contenido',)):
+        _reindexar_sqlite(FTS_RESPUESTAS, instance.pk, {'contenido': instance.contenido})
+
+
+@receiver(post_delete, sender=RespuestaForo)
+def desindexar_respuesta(sender, instance, **kwargs):
+    if connection.vendor == 'sqlite':
+        _borrar_de_indice_sqlite(FTS_RESPUESTAS, instance.pk)
@@ -0,0 +1,140 @@
+"""Catálogo de recursos públicos, paginado y con conteos por faceta.
+
+Las páginas se filtran por categoría y por tipo de recurso. Los conteos de las
+facetas salen de una sola consulta agrupada por (categoría, tipo), de la que se
+derivan los conteos de cada filtro.
+
+Tanto esa consulta como cada página (categoría, tipo, cursor) quedan en caché
+``RECURSOS_CATALOGO_TTL`` segundos. Las claves llevan una versión del catálogo
+que cambia cuando se guarda o elimina un ``Recurso`` o una ``CategoriaRecurso``,
+así que invalidar no requiere conocer las páginas guardadas: las anteriores
+dejan de leerse y vencen solas.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+
+from .models import CategoriaRecurso, Recurso
+from .paginacion import PaginadorCursor
+
+PREFIJO = 'recursos:catalogo:'
+CLAVE_VERSION = PREFIJO + 'version'
+
+ORDEN_CATALOGO = ['-creado_en', '-id']
+RECURSOS_POR_PAGINA = 12
+
+TIPOS_RECURSO = dict(Recurso.TIPO_RECURSO_CHOICES)
+
+
+def _ttl():
+    return getattr(settings, 'RECURSOS_CATALOGO_TTL', 300)
+
+
+def version_catalogo():
+    """Versión actual del catálogo; forma parte de todas las claves de caché."""
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # add() y no set(): si otro proceso ya la creó se usa la suya
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def invalidar_catalogo():
+    """Descarta las páginas y facetas en caché al confirmar la transacción.
+
+    Hay que llamarla después de ``QuerySet.update()`` o ``delete()`` masivos
+    sobre ``Recurso``, que no envían señales por fila.
+    """
+    transaction.on_commit(lambda: cache.set(CLAVE_VERSION, time.time_ns(), None))
+
+
+def recursos_publicos():
+    return Recurso.objects.filter(es_publico=True).select_related('categoria', 'creado_por')
+
+
+# ==================== FACETAS ====================
+
+def _conteos(version):
+    clave = f'{PREFIJO}{version}:conteos'
+    conteos = cache.get(clave)
+    if conteos is None:
+        conteos = list(
+            Recurso.objects.filter(es_publico=True)
+            .values('categoria_id', 'categoria__nombre', 'categoria__color', 'tipo_recurso')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        cache.set(clave, conteos, _ttl())
+    return conteos
+
+
+def facetas(categoria_id=None, tipo=None, version=None):
+    """Conteos por categoría y por tipo.
+
+    Cada faceta respeta el filtro de la otra: las categorías cuentan sólo el
+    tipo elegido y los tipos sólo la categoría elegida.
+    """
+    conteos = _conteos(version or version_catalogo())
+
+    categorias = {}
+    tipos = dict.fromkeys(TIPOS_RECURSO, 0)
+    total = 0
+    for fila in conteos:
+        if tipo is None or fila['tipo_recurso'] == tipo:
+            categoria = categorias.setdefault(fila['categoria_id'], {
+                'id': fila['categoria_id'],
+                'nombre': fila['categoria__nombre'],
+                'color': fila['categoria__color'],
+                'total': 0,
+            })
+            categoria['total'] += fila['total']
+        if categoria_id is None or fila['categoria_id'] == categoria_id:
+            tipos[fila['tipo_recurso']] += fila['total']
+            if tipo is None or fila['tipo_recurso'] == tipo:
+                total += fila['total']
+
+    return {
+        'categorias': sorted(categorias.values(), key=lambda categoria: categoria['nombre']),
+        'tipos': [
+            {'valor': valor, 'nombre': nombre, 'total': tipos[valor]}
+            for valor, nombre in TIPOS_RECURSO.items()
+        ],
+        'total': total,
+    }
+
+
+# ==================== PÁGINAS ====================
+
+def pagina_catalogo(categoria_id=None, tipo=None, cursor=None, version=None):
+    """Página del catálogo (``PaginaCursor``) para los filtros dados."""
+    version = version or version_catalogo()
+    marca = hashlib.sha1((cursor or '').encode()).hexdigest()
+    clave = f'{PREFIJO}{version}:pagina:{categoria_id or ""}:{tipo or ""}:{marca}'
+
+    pagina = cache.get(clave)
+    if pagina is None:
+        recursos = recursos_publicos()
+        if categoria_id is not None:
+            recursos = recursos.filter(categoria_id=categoria_id)
+        if tipo is not None:
+            recursos = recursos.filter(tipo_recurso=tipo)
+        pagina = PaginadorCursor(recursos, ORDEN_CATALOGO, por_pagina=RECURSOS_POR_PAGINA).pagina(cursor)
+        cache.set(clave, pagina, _ttl())
+    return pagina
+
+
+# ==================== SEÑALES ====================
+
+def _invalidar(sender, **kwargs):
+    invalidar_catalogo()
+
+
+for _modelo in (Recurso, CategoriaRecurso):
+    post_save.connect(_invalidar, sender=_modelo, dispatch_uid=f'catalogo:{_modelo._meta.label_lower}:guardado')
+    post_delete.connect(_invalidar, sender=_modelo, dispatch_uid=f'catalogo:{_modelo._meta.label_lower}:borrado')
@@ -0,0 +1,38 @@
+"""Decoradores de vistas de miapp."""
+from functools import wraps
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import redirect
+
+
+def role_required(*roles, mensaje='No tienes permisos para acceder a esta página'):
+    """
+    Exige sesión iniciada y que ``request.role`` sea uno de ``roles``.
+
+    Sin sesión redirige al login; con otro rol muestra ``mensaje`` y vuelve al
+    inicio. Uso: ``@role_required('admin', 'pasante')``.
+    """
+    def decorador(vista):
+        @login_required
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.role not in roles:
+                messages.error(request, mensaje)
+                return redirect('miapp:index')
+            return vista(request, *args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def presupuesto_consultas(maximo):
+    """
+    Declara cuántas consultas SQL puede hacer la vista por petición.
+
+    ``InstrumentacionMiddleware`` avisa en los logs cuando se supera y
+    ``PresupuestoConsultasMixin`` lo comprueba en los tests.
+    """
+    def decorador(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return decorador
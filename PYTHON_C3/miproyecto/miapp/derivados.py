@@ -0,0 +1,320 @@
+"""Derivados de los archivos de los recursos de imagen y video.
+
+Cuando se sube el archivo de un recurso ``texto_imagen`` o ``video`` se
+calcula, fuera de la petición:
+
+- el hash SHA-256 del contenido. Si otro recurso ya tiene el mismo archivo, se
+  reutilizan su archivo y sus derivados y la copia nueva se borra;
+- versiones reducidas y comprimidas de la imagen (o del póster del video) en
+  los anchos de ``RECURSOS_DERIVADOS_ANCHOS``, que las plantillas ofrecen con
+  ``srcset``;
+- para los videos, un póster tomado de un fotograma con ffmpeg.
+
+Los derivados se guardan junto al original, en ``recursos/derivados/<hash>/``.
+Como la carpeta depende sólo del contenido, dos recursos con el mismo archivo
+los comparten.
+
+El trabajo corre en un ``ProcessPoolExecutor`` de ``RECURSOS_DERIVADOS_PROCESOS``
+procesos y se encola al confirmar el guardado del recurso. Con
+``RECURSOS_DERIVADOS_AUTOMATICOS = False`` los recursos quedan pendientes y los
+procesa ``python manage.py procesar_derivados`` (desde cron o un worker).
+
+Pillow y ffmpeg son opcionales: sin Pillow no hay versiones reducidas y sin
+ffmpeg los videos no tienen póster. El hash se calcula siempre.
+
+Este módulo no importa los modelos al cargarse: los procesos del pool se
+inician con "spawn" y lo importan antes de configurar Django.
+"""
+import atexit
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError, features
+except ImportError:  # Pillow es opcional
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+TIPOS_CON_DERIVADOS = ('texto_imagen', 'video')
+CARPETA = 'recursos/derivados'
+
+# Bloques con los que se lee el original para calcular el hash
+BLOQUE = 1024 * 1024
+
+
+# ==================== PROCESOS ====================
+
+def _iniciar_proceso(modulo_settings):
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', modulo_settings)
+        django.setup()
+
+
+def crear_ejecutor(procesos):
+    # "spawn" y no "fork": los procesos no heredan las conexiones abiertas a la base de datos
+    return ProcessPoolExecutor(
+        max_workers=procesos,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_iniciar_proceso,
+        initargs=(settings.SETTINGS_MODULE,),
+    )
+
+
+_ejecutor = None
+_lock = threading.Lock()
+
+
+def _ejecutor_compartido():
+    global _ejecutor
+    with _lock:
+        if _ejecutor is None:
+            _ejecutor = crear_ejecutor(getattr(settings, 'RECURSOS_DERIVADOS_PROCESOS', 2))
+            atexit.register(_ejecutor.shutdown, wait=False, cancel_futures=True)
+        return _ejecutor
+
+
+def encolar(recurso_id):
+    """Procesa el recurso en el pool compartido, sin esperar el resultado."""
+    global _ejecutor
+    try:
+        futuro = _ejecutor_compartido().submit(procesar_recurso, recurso_id)
+    except BrokenProcessPool:
+        # Un proceso murió (por ejemplo, sin memoria): se crea un pool nuevo
+        with _lock:
+            _ejecutor = None
+        futuro = _ejecutor_compartido().submit(procesar_recurso, recurso_id)
+    futuro.add_done_callback(_terminado)
+
+
+def _terminado(futuro):
+    from .catalogo import invalidar_catalogo
+
+    try:
+        estado = futuro.result()
+    except Exception:
+        logger.exception('Falló el procesamiento de derivados')
+        return
+    if estado is not None:
+        # Las páginas del catálogo en caché tienen los recursos sin sus variantes
+        invalidar_catalogo()
+
+
+# ==================== PROCESAMIENTO ====================
+
+def hash_archivo(storage, nombre):
+    sha = hashlib.sha256()
+    with storage.open(nombre, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(BLOQUE), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+@contextmanager
+def _ruta_local(storage, nombre):
+    """Ruta en disco del archivo; si el almacenamiento es remoto, una copia temporal."""
+    try:
+        ruta = storage.path(nombre)
+    except NotImplementedError:
+        ruta = None
+    if ruta:
+        yield ruta
+        return
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(nombre)[1]) as temporal:
+        with storage.open(nombre, 'rb') as original:
+            shutil.copyfileobj(original, temporal, BLOQUE)
+        temporal.flush()
+        yield temporal.name
+
+
+def _guardar_imagen(imagen, storage, nombre, formato):
+    # El nombre depende del hash del original: si ya existe, es la misma imagen
+    if storage.exists(nombre):
+        return nombre
+    buffer = io.BytesIO()
+    imagen.save(buffer, formato, quality=getattr(settings, 'RECURSOS_DERIVADOS_CALIDAD', 80), optimize=True)
+    return storage.save(nombre, ContentFile(buffer.getvalue()))
+
+
+def _variantes(imagen, storage, carpeta):
+    """Guarda versiones reducidas de ``imagen``; devuelve [[ancho, nombre], ...]."""
+    # WebP pesa bastante menos que JPEG con la misma calidad
+    formato, extension = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+    imagen = ImageOps.exif_transpose(imagen)
+    transparente = formato == 'WEBP' and imagen.mode in ('RGBA', 'LA', 'P')
+    imagen = imagen.convert('RGBA' if transparente else 'RGB')
+
+    variantes = []
+    for ancho in sorted(getattr(settings, 'RECURSOS_DERIVADOS_ANCHOS', (480, 960, 1600))):
+        # Nunca se amplía: la última variante es la imagen a su tamaño, recomprimida
+        ancho = min(ancho, imagen.width)
+        alto = max(1, round(imagen.height * ancho / imagen.width))
+        reducida = imagen if ancho == imagen.width else imagen.resize((ancho, alto), Image.Resampling.LANCZOS)
+        variantes.append([ancho, _guardar_imagen(reducida, storage, f'{carpeta}/{ancho}w.{extension}', formato)])
+        if ancho == imagen.width:
+            break
+    return variantes
+
+
+def _poster(ruta, storage, carpeta):
+    """Extrae un fotograma del video con ffmpeg; devuelve el nombre guardado o None."""
+    nombre = f'{carpeta}/poster.jpg'
+    if storage.exists(nombre):
+        return nombre
+    ffmpeg = shutil.which(getattr(settings, 'RECURSOS_FFMPEG', 'ffmpeg'))
+    if ffmpeg is None:
+        logger.warning('ffmpeg no está instalado: los videos quedan sin póster')
+        return None
+
+    with tempfile.TemporaryDirectory() as directorio:
+        destino = os.path.join(directorio, 'poster.jpg')
+        # Un segundo dentro del video suele evitar el fotograma negro inicial;
+        # si el video es más corto, se toma el primero
+        for segundo in ('1', '0'):
+            subprocess.run(
+                [ffmpeg, '-v', 'error', '-y', '-ss', segundo, '-i', ruta, '-frames:v', '1', '-q:v', '3', destino],
+                check=segundo == '0', capture_output=True, timeout=120,
+            )
+            if os.path.exists(destino) and os.path.getsize(destino):
+                with open(destino, 'rb') as poster:
+                    return storage.save(nombre, ContentFile(poster.read()))
+    return None
+
+
+def generar_derivados(recurso, hash_contenido):
+    """Genera los derivados del archivo del recurso y devuelve su descripción."""
+    storage = recurso.archivo.storage
+    carpeta = f'{CARPETA}/{hash_contenido}'
+    derivados = {}
+
+    if recurso.tipo_recurso == 'video':
+        with _ruta_local(storage, recurso.archivo.name) as ruta:
+            derivados['poster'] = _poster(ruta, storage, carpeta)
+        # Las versiones reducidas del video son las de su póster
+        origen = derivados['poster']
+    else:
+        origen = recurso.archivo.name
+
+    if origen and Image is not None:
+        try:
+            with storage.open(origen, 'rb') as archivo, Image.open(archivo) as imagen:
+                derivados['variantes'] = _variantes(imagen, storage, carpeta)
+        except (UnidentifiedImageError, Image.DecompressionBombError):
+            # texto_imagen también admite PDFs u otros documentos
+            pass
+    return derivados
+
+
+def borrar_derivados_sin_uso(storage, derivados_por_hash):
+    """Borra los derivados ({hash: derivados}) de los contenidos que ya ningún
+    recurso tiene."""
+    from .models import Recurso
+
+    derivados_por_hash = {hash_: derivados for hash_, derivados in derivados_por_hash.items() if hash_}
+    if not derivados_por_hash:
+        return
+    en_uso = set(
+        Recurso.objects.filter(hash_contenido__in=derivados_por_hash).values_list('hash_contenido', flat=True)
+    )
+    for hash_contenido, derivados in derivados_por_hash.items():
+        if hash_contenido in en_uso:
+            continue
+        nombres = [nombre for _, nombre in derivados.get('variantes', [])]
+        if derivados.get('poster'):
+            nombres.append(derivados['poster'])
+        for nombre in nombres:
+            storage.delete(nombre)
+
+
+def procesar_recurso(recurso_id):
+    """Calcula el hash y los derivados del recurso; devuelve el estado final o
+    None si el recurso ya no existe o su archivo cambió mientras tanto."""
+    from .archivos import borrar_si_no_se_usan
+    from .models import Recurso
+
+    recurso = Recurso.objects.filter(id=recurso_id).first()
+    if recurso is None or not recurso.archivo:
+        return None
+    nombre = recurso.archivo.name
+    storage = recurso.archivo.storage
+
+    try:
+        hash_contenido = hash_archivo(storage, nombre)
+        cambios = {'hash_contenido': hash_contenido, 'estado_derivados': 'listo'}
+        gemelo = (
+            Recurso.objects.filter(hash_contenido=hash_contenido, estado_derivados='listo')
+            .exclude(id=recurso.id)
+            .only('archivo', 'derivados')
+            .first()
+        )
+        if gemelo is not None:
+            # Mismo contenido que otro recurso: se comparte su archivo y sus derivados
+            cambios['archivo'] = gemelo.archivo.name
+            cambios['derivados'] = gemelo.derivados
+        else:
+            cambios['derivados'] = generar_derivados(recurso, hash_contenido)
+    except Exception:
+        logger.exception('No se pudieron generar los derivados del recurso %s', recurso_id)
+        cambios = {'estado_derivados': 'error'}
+
+    # Si el archivo se reemplazó mientras tanto, ya hay otro trabajo para el nuevo
+    if not Recurso.objects.filter(id=recurso_id, archivo=nombre).update(**cambios):
+        return None
+
+    if cambios.get('archivo', nombre) != nombre:
+        borrar_si_no_se_usan(storage, [nombre])
+    if recurso.hash_contenido and recurso.hash_contenido != cambios.get('hash_contenido'):
+        borrar_derivados_sin_uso(storage, {recurso.hash_contenido: recurso.derivados})
+    return cambios['estado_derivados']
+
+
+# ==================== SEÑALES ====================
+
+@receiver(post_init, sender='miapp.Recurso')
+def recordar_archivo(sender, instance, **kwargs):
+    # Los recursos leídos de la base traen el nombre (str); los nuevos, el archivo subido
+    valor = instance.__dict__.get('archivo')
+    instance._archivo_guardado = valor if isinstance(valor, str) else ''
+
+
+@receiver(post_save, sender='miapp.Recurso')
+def encolar_si_cambio_el_archivo(sender, instance, **kwargs):
+    if 'archivo' not in instance.__dict__:
+        return
+    nombre = instance.archivo.name or ''
+    anterior, instance._archivo_guardado = instance._archivo_guardado, nombre
+    if not nombre or nombre == anterior or instance.tipo_recurso not in TIPOS_CON_DERIVADOS:
+        return
+
+    sender.objects.filter(pk=instance.pk).update(estado_derivados='pendiente')
+    instance.estado_derivados = 'pendiente'
+    if getattr(settings, 'RECURSOS_DERIVADOS_AUTOMATICOS', True):
+        recurso_id = instance.pk
+        transaction.on_commit(lambda: encolar(recurso_id))
+
+
+@receiver(post_delete, sender='miapp.Recurso')
+def borrar_derivados_recurso(sender, instance, **kwargs):
+    if instance.hash_contenido and instance.derivados:
+        storage = instance.archivo.storage
+        derivados_por_hash = {instance.hash_contenido: instance.derivados}
+        transaction.on_commit(lambda: borrar_derivados_sin_uso(storage, derivados_por_hash))
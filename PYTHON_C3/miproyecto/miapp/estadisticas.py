@@ -0,0 +1,96 @@
+"""Estadísticas del foro guardadas en el caché de Django.
+
+Los contadores se calculan una sola vez (cuando faltan en el caché) y después
+se mantienen con incrementos desde las señales de HiloForo y RespuestaForo.
+La portada del foro sólo lee el caché. El TTL acota cualquier desvío, por
+ejemplo por borrados masivos con ``QuerySet.delete()`` que no envían señales
+por fila.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import HiloForo, RespuestaForo
+
+PREFIJO = 'foro:estadisticas:'
+
+CALCULOS = {
+    'total_hilos': lambda: HiloForo.objects.count(),
+    'total_respuestas': lambda: RespuestaForo.objects.count(),
+    'hilos_abiertos': lambda: HiloForo.objects.filter(estado='abierto').count(),
+}
+
+
+def estadisticas_foro():
+    """Devuelve el diccionario de estadísticas del foro."""
+    claves = {PREFIJO + nombre: nombre for nombre in CALCULOS}
+    en_cache = cache.get_many(claves)
+
+    faltantes = {}
+    for clave, nombre in claves.items():
+        if clave not in en_cache:
+            faltantes[clave] = CALCULOS[nombre]()
+    if faltantes:
+        ttl = getattr(settings, 'FORO_ESTADISTICAS_TTL', 3600)
+        for clave, valor in faltantes.items():
+            # add() y no set(): si otro proceso ya lo recalculó no se pisa
+            cache.add(clave, valor, ttl)
+        en_cache.update(faltantes)
+
+    return {nombre: en_cache[clave] for clave, nombre in claves.items()}
+
+
+def _sumar(nombre, delta):
+    def aplicar():
+        clave = PREFIJO + nombre
+        try:
+            if delta > 0:
+                cache.incr(clave, delta)
+            else:
+                cache.decr(clave, -delta)
+        except ValueError:
+            # La clave no está en caché: se recalculará en la próxima lectura
+            pass
+
+    if delta:
+        transaction.on_commit(aplicar)
+
+
+# ==================== SEÑALES ====================
+
+@receiver(post_init, sender=HiloForo)
+def recordar_estado_hilo(sender, instance, **kwargs):
+    # Se lee de __dict__ para no disparar una consulta si el campo está diferido
+    instance._estado_guardado = instance.__dict__.get('estado')
+
+
+@receiver(post_save, sender=HiloForo)
+def contar_hilo_guardado(sender, instance, created, **kwargs):
+    if created:
+        _sumar('total_hilos', 1)
+        _sumar('hilos_abiertos', int(instance.estado == 'abierto'))
+    elif instance._estado_guardado is not None and instance._estado_guardado != instance.estado:
+        if instance._estado_guardado == 'abierto':
+            _sumar('hilos_abiertos', -1)
+        elif instance.estado == 'abierto':
+            _sumar('hilos_abiertos', 1)
+    instance._estado_guardado = instance.estado
+
+
+@receiver(post_delete, sender=HiloForo)
+def descontar_hilo_borrado(sender, instance, **kwargs):
+    _sumar('total_hilos', -1)
+    _sumar('hilos_abiertos', -int(instance.estado == 'abierto'))
+
+
+@receiver(post_save, sender=RespuestaForo)
+def contar_respuesta_guardada(sender, instance, created, **kwargs):
+    if created:
+        _sumar('total_respuestas', 1)
+
+
+@receiver(post_delete, sender=RespuestaForo)
+def descontar_respuesta_borrada(sender, instance, **kwargs):
+    _sumar('total_respuestas', -1)
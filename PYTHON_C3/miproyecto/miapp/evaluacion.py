@@ -0,0 +1,307 @@
+"""Aplicación y calificación de los tests psicológicos.
+
+La estructura de un test (preguntas por ``orden`` y, por cada una, los valores
+y las categorías de sus opciones) cambia poco y se lee en cada página del test
+y en cada envío. Por eso cada test se compila una vez en un ``TestCompilado``:
+una tupla inmutable con las opciones de todas las preguntas en arreglos planos
+(ids, valores, categorías), donde las opciones de la pregunta ``i`` ocupan las
+posiciones ``inicio[i]`` a ``inicio[i + 1]``.
+
+El test compilado se guarda en un diccionario del proceso y en el caché
+compartido, con una versión por test que cambia cuando se guarda o elimina el
+test, una de sus preguntas o una de sus opciones. Con el test en caché, mostrar
+el formulario y calificar no leen la base de datos.
+
+Las respuestas llegan todas juntas en un solo envío (``pregunta_<id>`` = id de
+la opción):
+
+- ``puntuacion_total`` es la suma de los valores de las opciones elegidas.
+- ``categoria_recomendada`` es la categoría de recursos con más puntos: los
+  valores se suman por categoría en una sola pasada. Ante un empate gana la
+  categoría que aparece primero en el orden de las preguntas.
+
+El resultado se guarda con un único INSERT en ``ResultadoTest``, que incluye
+las respuestas empaquetadas: un byte por pregunta con la posición de la opción
+elegida, más la ``VersionTest`` con la que se decodifican. Las distribuciones
+de respuestas se calculan agrupando en la base de datos los resultados con las
+mismas respuestas, sin expandirlos en una fila por respuesta.
+"""
+import hashlib
+import json
+import time
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.db.models.signals import post_delete, post_save
+from django.http import Http404
+
+from .models import OpcionRespuesta, PreguntaTest, ResultadoTest, TestPsicologico, VersionTest
+
+PREFIJO = 'tests:'
+
+# test_id -> (versión, TestCompilado) de este proceso
+_compilados = {}
+
+
+class TestCompilado(namedtuple('TestCompilado', [
+    'id', 'nombre', 'descripcion', 'instrucciones',
+    'version_id',   # VersionTest con esta estructura
+    'preguntas',    # ((pregunta_id, texto), ...) por posición
+    'inicio',       # posición de la primera opción de cada pregunta, más el total al final
+    'opciones',     # ids de las opciones
+    'textos',       # textos de las opciones
+    'valores',      # valores de las opciones
+    'categorias',   # categoria_recomendacion_id de las opciones
+])):
+    """Estructura compilada e inmutable de un test; ver el docstring del módulo."""
+    __slots__ = ()
+
+    def formulario(self, datos=None):
+        """Preguntas y opciones para la plantilla, con la opción ya elegida en ``datos``."""
+        datos = datos or {}
+        return [
+            {
+                'id': pregunta_id,
+                'texto': texto,
+                'elegida': datos.get(f'pregunta_{pregunta_id}'),
+                'opciones': [
+                    {'id': self.opciones[j], 'texto': self.textos[j]}
+                    for j in range(self.inicio[i], self.inicio[i + 1])
+                ],
+            }
+            for i, (pregunta_id, texto) in enumerate(self.preguntas)
+        ]
+
+    def elegidas(self, datos):
+        """Posición de la opción elegida en ``datos`` (el POST) para cada pregunta.
+
+        Lanza ValueError si falta alguna respuesta o si la opción no pertenece a
+        su pregunta.
+        """
+        if not self.preguntas:
+            raise ValueError('El test no tiene preguntas')
+        elegidas = []
+        faltantes = 0
+        for i, (pregunta_id, _) in enumerate(self.preguntas):
+            valor = datos.get(f'pregunta_{pregunta_id}')
+            if not valor:
+                faltantes += 1
+                continue
+            try:
+                # Sólo se busca entre las opciones de esta pregunta
+                elegidas.append(self.opciones.index(int(valor), self.inicio[i], self.inicio[i + 1]))
+            except ValueError:
+                raise ValueError(f'Respuesta inválida para la pregunta {i + 1}')
+        if faltantes:
+            raise ValueError(f'Faltan {faltantes} respuesta{"s" if faltantes > 1 else ""}')
+        return elegidas
+
+    def puntuar(self, elegidas):
+        """(puntuacion_total, id de la categoría recomendada) de las opciones ``elegidas``."""
+        por_categoria = Counter()
+        for j in elegidas:
+            por_categoria[self.categorias[j]] += self.valores[j]
+        # max() devuelve la primera clave con el máximo: el Counter conserva el orden
+        recomendada = max(por_categoria, key=por_categoria.__getitem__)
+        return sum(por_categoria.values()), recomendada
+
+    def calificar(self, datos):
+        return self.puntuar(self.elegidas(datos))
+
+    def empaquetar(self, elegidas):
+        """Valor de ``ResultadoTest.respuestas``: la posición de cada opción dentro de su pregunta."""
+        return bytes(j - self.inicio[i] for i, j in enumerate(elegidas))
+
+
+# ==================== COMPILACIÓN ====================
+
+def compilar(test_id):
+    """Lee un test activo con sus preguntas y opciones (tres consultas) y lo compila.
+
+    Lanza ValueError si una pregunta tiene más opciones de las que caben en
+    ``ResultadoTest.respuestas``.
+    """
+    opciones = OpcionRespuesta.objects.order_by('id').only(
+        'id', 'pregunta_id', 'texto_opcion', 'valor', 'categoria_recomendacion_id'
+    )
+    preguntas = (
+        PreguntaTest.objects.order_by('orden', 'id')
+        .only('id', 'test_id', 'texto_pregunta')
+        .prefetch_related(Prefetch('opciones', queryset=opciones))
+    )
+    test = (
+        TestPsicologico.objects.filter(es_activo=True, id=test_id)
+        .prefetch_related(Prefetch('preguntas', queryset=preguntas))
+        .first()
+    )
+    if test is None:
+        raise Http404('El test no existe')
+
+    inicio, filas = [0], []
+    for pregunta in test.preguntas.all():
+        opciones = pregunta.opciones.all()
+        if len(opciones) > OpcionRespuesta.MAX_POR_PREGUNTA:
+            # OpcionRespuesta.clean() lo impide en los formularios, no en el ORM
+            raise ValueError(f'La pregunta {pregunta.id} tiene más de {OpcionRespuesta.MAX_POR_PREGUNTA} opciones')
+        filas.extend(opciones)
+        inicio.append(len(filas))
+    return TestCompilado(
+        id=test.id,
+        nombre=test.nombre,
+        descripcion=test.descripcion,
+        instrucciones=test.instrucciones,
+        version_id=_version_estructura(test).id,
+        preguntas=tuple((pregunta.id, pregunta.texto_pregunta) for pregunta in test.preguntas.all()),
+        inicio=tuple(inicio),
+        opciones=tuple(opcion.id for opcion in filas),
+        textos=tuple(opcion.texto_opcion for opcion in filas),
+        valores=tuple(opcion.valor for opcion in filas),
+        categorias=tuple(opcion.categoria_recomendacion_id for opcion in filas),
+    )
+
+
+def _version_estructura(test):
+    """``VersionTest`` con las preguntas y opciones actuales del test (ya cargadas)."""
+    preguntas = [pregunta.id for pregunta in test.preguntas.all()]
+    opciones = [[opcion.id for opcion in pregunta.opciones.all()] for pregunta in test.preguntas.all()]
+    firma = hashlib.sha256(json.dumps([preguntas, opciones]).encode()).hexdigest()
+    versiones = VersionTest.objects.filter(test=test, firma=firma).only('id')
+    version = versiones.first()
+    if version is None:
+        # ignore_conflicts: si otro proceso la creó al mismo tiempo se usa esa
+        VersionTest.objects.bulk_create(
+            [VersionTest(test=test, firma=firma, preguntas=preguntas, opciones=opciones)], ignore_conflicts=True,
+        )
+        version = versiones.get()
+    return version
+
+
+def _clave_version(test_id):
+    return f'{PREFIJO}{test_id}:version'
+
+
+def version_test(test_id):
+    version = cache.get(_clave_version(test_id))
+    if version is None:
+        # add() y no set(): si otro proceso ya la creó se usa la suya
+        cache.add(_clave_version(test_id), time.time_ns(), None)
+        version = cache.get(_clave_version(test_id))
+    return version
+
+
+def invalidar_test(test_id):
+    """Hace que el test se vuelva a compilar al confirmar la transacción."""
+    transaction.on_commit(lambda: cache.set(_clave_version(test_id), time.time_ns(), None))
+
+
+def obtener_test(test_id):
+    """``TestCompilado`` del test activo ``test_id``.
+
+    Lanza Http404 si el test no existe y ValueError si no se puede compilar.
+
+    Sólo consulta el caché compartido para leer la versión; la base de datos
+    se lee únicamente cuando el test cambió o no está en ningún caché.
+    """
+    version = version_test(test_id)
+    local = _compilados.get(test_id)
+    if local is not None and local[0] == version:
+        return local[1]
+
+    clave = f'{PREFIJO}{test_id}:{version}:compilado'
+    compilado = cache.get(clave)
+    if compilado is None:
+        compilado = compilar(test_id)
+        cache.set(clave, compilado, getattr(settings, 'TESTS_COMPILADOS_TTL', 86400))
+    _compilados[test_id] = (version, compilado)
+    return compilado
+
+
+def registrar_resultado(usuario, test, datos):
+    """Califica las respuestas de ``datos`` sobre el ``TestCompilado`` y guarda el resultado."""
+    elegidas = test.elegidas(datos)
+    puntuacion, categoria_id = test.puntuar(elegidas)
+    # El resultado y su suma en miapp.analitica se guardan juntos
+    with transaction.atomic():
+        return ResultadoTest.objects.create(
+            usuario=usuario, test_id=test.id, puntuacion_total=puntuacion, categoria_recomendada_id=categoria_id,
+            version_id=test.version_id, respuestas=test.empaquetar(elegidas),
+        )
+
+
+# ==================== ANÁLISIS ====================
+
+def desglose_resultado(resultado):
+    """Pregunta y opción elegida de cada respuesta de ``resultado``, en orden.
+
+    Lee las preguntas y opciones en una consulta. Si alguna se borró después
+    de responder el test, su texto queda en None.
+    """
+    elegidas = resultado.opciones_elegidas
+    opciones = OpcionRespuesta.objects.select_related('pregunta').in_bulk([opcion_id for _, opcion_id in elegidas])
+    desglose = []
+    for pregunta_id, opcion_id in elegidas:
+        opcion = opciones.get(opcion_id)
+        desglose.append({
+            'pregunta_id': pregunta_id,
+            'pregunta': opcion.pregunta.texto_pregunta if opcion else None,
+            'opcion_id': opcion_id,
+            'opcion': opcion.texto_opcion if opcion else None,
+            'valor': opcion.valor if opcion else None,
+        })
+    return desglose
+
+
+def distribucion_respuestas(resultados):
+    """Cuántas veces se eligió cada opción de cada pregunta en ``resultados``.
+
+    Devuelve ``{pregunta_id: {opcion_id: veces}}``. La base de datos agrupa
+    los resultados con las mismas respuestas (``GROUP BY version, respuestas``)
+    y sólo se decodifica cada combinación distinta una vez, así que el costo
+    depende de cuántas combinaciones hay y no de cuántos resultados. Son dos
+    consultas: la agrupada y la de las versiones.
+    """
+    combinaciones = list(
+        resultados.filter(version__isnull=False)
+        .values_list('version_id', 'respuestas')
+        .annotate(veces=Count('id'))
+        .order_by()
+    )
+    versiones = VersionTest.objects.in_bulk({version_id for version_id, _, _ in combinaciones})
+
+    distribucion = defaultdict(Counter)
+    for version_id, respuestas, veces in combinaciones:
+        version = versiones[version_id]
+        for pregunta_id, opciones, indice in zip(version.preguntas, version.opciones, bytes(respuestas)):
+            distribucion[pregunta_id][opciones[indice]] += veces
+    return {pregunta_id: dict(conteo) for pregunta_id, conteo in distribucion.items()}
+
+
+# ==================== SEÑALES ====================
+
+def _invalidar_test(sender, instance, **kwargs):
+    invalidar_test(instance.id)
+
+
+def _invalidar_pregunta(sender, instance, **kwargs):
+    invalidar_test(instance.test_id)
+
+
+def _invalidar_opcion(sender, instance, **kwargs):
+    if OpcionRespuesta.pregunta.is_cached(instance):
+        invalidar_test(instance.pregunta.test_id)
+        return
+    # Al borrar una pregunta en cascada ya no existe: esa pregunta invalida por su cuenta
+    for test_id in PreguntaTest.objects.filter(id=instance.pregunta_id).values_list('test_id', flat=True):
+        invalidar_test(test_id)
+
+
+for _modelo, _receptor in (
+    (TestPsicologico, _invalidar_test),
+    (PreguntaTest, _invalidar_pregunta),
+    (OpcionRespuesta, _invalidar_opcion),
+):
+    post_save.connect(_receptor, sender=_modelo, dispatch_uid=f'evaluacion:{_modelo._meta.label_lower}:guardado')
+    post_delete.connect(_receptor, sender=_modelo, dispatch_uid=f'evaluacion:{_modelo._meta.label_lower}:borrado')
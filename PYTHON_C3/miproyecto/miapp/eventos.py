@@ -0,0 +1,159 @@
+"""Publicación y suscripción de eventos del foro para las vistas en vivo (SSE).
+
+Cada hilo tiene un canal ``hilo:<id>``. Se publica un evento cuando se crea una
+respuesta o cambian los votos, y la vista ``eventos_hilo`` se los envía a los
+navegadores conectados. Los eventos sólo avisan qué cambió: el cliente pide
+después únicamente lo nuevo. Esa vista sólo está activa con
+``FORO_EVENTOS_EN_VIVO`` (servidor ASGI); si no, la página consulta
+periódicamente las respuestas nuevas.
+
+El backend se elige con ``FORO_EVENTOS_BACKEND``:
+
+- ``miapp.eventos.BackendMemoria`` (por defecto): dentro del proceso. Sirve
+  con un solo proceso ASGI.
+- ``miapp.eventos.BackendRedis``: usa Redis pub/sub (``FORO_EVENTOS_REDIS_URL``)
+  para que los eventos lleguen a todos los procesos. Requiere el paquete redis.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from functools import cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import RespuestaForo
+
+logger = logging.getLogger(__name__)
+
+
+def canal_hilo(hilo_id):
+    return f'hilo:{hilo_id}'
+
+
+# ==================== BACKENDS ====================
+
+class BackendMemoria:
+    """Pub/sub dentro del proceso, con una cola asyncio por suscriptor."""
+
+    # Si un cliente lento acumula más eventos, los nuevos se descartan; al
+    # reconectarse pide lo que le falta igualmente
+    MAX_PENDIENTES = 100
+
+    def __init__(self):
+        self._suscriptores = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publicar(self, canal, evento):
+        with self._lock:
+            suscriptores = list(self._suscriptores.get(canal, ()))
+        for suscripcion in suscriptores:
+            # publicar() se llama desde hilos síncronos: la cola se toca
+            # siempre desde el event loop del suscriptor
+            suscripcion.loop.call_soon_threadsafe(suscripcion.entregar, evento)
+
+    def suscribir(self, canal):
+        suscripcion = _SuscripcionMemoria(self, canal, asyncio.get_running_loop())
+        with self._lock:
+            self._suscriptores[canal].add(suscripcion)
+        return suscripcion
+
+    def _quitar(self, suscripcion):
+        with self._lock:
+            suscriptores = self._suscriptores.get(suscripcion.canal)
+            if suscriptores is not None:
+                suscriptores.discard(suscripcion)
+                if not suscriptores:
+                    del self._suscriptores[suscripcion.canal]
+
+
+class _SuscripcionMemoria:
+    def __init__(self, backend, canal, loop):
+        self.backend = backend
+        self.canal = canal
+        self.loop = loop
+        self.cola = asyncio.Queue(maxsize=backend.MAX_PENDIENTES)
+
+    def entregar(self, evento):
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            pass
+
+    async def recibir(self, timeout):
+        """Devuelve el próximo evento o None si no llegó ninguno a tiempo."""
+        try:
+            return await asyncio.wait_for(self.cola.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def cerrar(self):
+        self.backend._quitar(self)
+
+
+class BackendRedis:
+    """Pub/sub con Redis, para despliegues con varios procesos."""
+
+    def __init__(self):
+        import redis
+        import redis.asyncio
+
+        self.url = getattr(settings, 'FORO_EVENTOS_REDIS_URL', 'redis://localhost:6379/0')
+        self._cliente = redis.Redis.from_url(self.url)
+        self._cliente_async = redis.asyncio.Redis.from_url(self.url)
+
+    def publicar(self, canal, evento):
+        self._cliente.publish(canal, json.dumps(evento))
+
+    def suscribir(self, canal):
+        return _SuscripcionRedis(self._cliente_async.pubsub(), canal)
+
+
+class _SuscripcionRedis:
+    def __init__(self, pubsub, canal):
+        self.pubsub = pubsub
+        self.canal = canal
+        self._suscrito = False
+
+    async def recibir(self, timeout):
+        if not self._suscrito:
+            await self.pubsub.subscribe(self.canal)
+            self._suscrito = True
+        mensaje = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if mensaje is None:
+            return None
+        return json.loads(mensaje['data'])
+
+    async def cerrar(self):
+        await self.pubsub.aclose()
+
+
+@cache
+def obtener_backend():
+    ruta = getattr(settings, 'FORO_EVENTOS_BACKEND', 'miapp.eventos.BackendMemoria')
+    return import_string(ruta)()
+
+
+def publicar(canal, evento):
+    """Publica ``evento`` cuando se confirme la transacción en curso."""
+    def enviar():
+        try:
+            obtener_backend().publicar(canal, evento)
+        except Exception:
+            # Sin eventos en vivo el foro sigue funcionando: no se rompe la petición
+            logger.exception('No se pudo publicar el evento %s en %s', evento.get('tipo'), canal)
+
+    transaction.on_commit(enviar)
+
+
+# ==================== SEÑALES ====================
+
+@receiver(post_save, sender=RespuestaForo)
+def avisar_respuesta_nueva(sender, instance, created, **kwargs):
+    if created:
+        publicar(canal_hilo(instance.hilo_id), {'tipo': 'respuesta', 'id': instance.id})
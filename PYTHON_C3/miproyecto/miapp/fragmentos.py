@@ -0,0 +1,49 @@
+"""Caché del HTML renderizado de las respuestas del foro.
+
+La parte fija de cada respuesta (autor, rol y contenido con ``linebreaks``) se
+renderiza una vez y se guarda bajo una clave con el id y ``actualizado_en`` de
+la respuesta y una huella de los datos del autor que se muestran (nombre,
+usuario y rol): si la respuesta se edita o el autor cambia su nombre o su rol,
+la clave cambia y la versión vieja simplemente expira. Lo que depende de quién mira o de la hora (votos del
+usuario, "hace 5 minutos") queda fuera del fragmento.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+TEMPLATE_RESPUESTA = 'miapp/fragmentos/respuesta_foro.html'
+
+
+def _huella_autor(autor):
+    # Los datos del autor llegan con select_related: calcular la huella no consulta la base
+    perfil = getattr(autor, 'userprofile', None)
+    datos = [autor.username, autor.first_name, autor.last_name, perfil.tipo_usuario if perfil else '']
+    return hashlib.sha1('\x1f'.join(datos).encode()).hexdigest()
+
+
+def clave_respuesta(respuesta):
+    return (
+        f'foro:respuesta:{respuesta.id}:{respuesta.actualizado_en.timestamp()}:'
+        f'{_huella_autor(respuesta.creado_por)}'
+    )
+
+
+def renderizar_respuestas(respuestas):
+    """Asigna a cada respuesta su HTML en ``respuesta.html`` con un solo get_many."""
+    claves = {clave_respuesta(respuesta): respuesta for respuesta in respuestas}
+    en_cache = cache.get_many(claves)
+
+    nuevos = {}
+    for clave, respuesta in claves.items():
+        html = en_cache.get(clave)
+        if html is None:
+            html = render_to_string(TEMPLATE_RESPUESTA, {'respuesta': respuesta})
+            nuevos[clave] = html
+        respuesta.html = mark_safe(html)
+
+    if nuevos:
+        cache.set_many(nuevos, getattr(settings, 'FORO_FRAGMENTOS_TTL', 86400))
+    return respuestas
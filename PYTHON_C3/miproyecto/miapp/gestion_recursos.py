@@ -0,0 +1,109 @@
+"""Gestión de recursos compartida por administradores y pasantes.
+
+Los administradores gestionan todos los recursos y los pasantes sólo los que
+crearon (``recursos_editables``). Todas las operaciones pasan por ese filtro.
+
+Las acciones masivas (publicar, despublicar, cambiar de categoría y eliminar)
+se ejecutan sobre los recursos seleccionados que el usuario puede editar,
+después de un SELECT que bloquea esas filas y dice cuáles cambian. Devuelven un
+diff para actualizar la tabla sin recargar la página::
+
+    {'accion': 'publicar', 'actualizados': [3, 7], 'cambios': {'es_publico': True},
+     'eliminados': [], 'sin_cambios': [9], 'sin_permiso': [12]}
+
+Los cambios de campos son un solo ``UPDATE``, que no envía señales: aquí se
+invalida el catálogo, como harían los receptores. Los recursos se eliminan con
+``QuerySet.delete()``, que sí las envía por fila: los receptores invalidan el
+catálogo y las métricas y borran los archivos y derivados que quedan sin uso.
+"""
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+
+from .archivos import guardar_recurso
+from .catalogo import invalidar_catalogo
+from .models import CategoriaRecurso, Recurso
+
+ACCIONES_MASIVAS = ('publicar', 'despublicar', 'recategorizar', 'eliminar')
+
+
+def recursos_editables(usuario, rol):
+    """Recursos que ``usuario`` puede modificar según su rol."""
+    recursos = Recurso.objects.select_related('categoria', 'creado_por')
+    if rol == 'admin':
+        return recursos
+    return recursos.filter(creado_por=usuario)
+
+
+def _asignar(recurso, datos):
+    recurso.titulo = datos.get('titulo')
+    recurso.descripcion = datos.get('descripcion')
+    recurso.tipo_recurso = datos.get('tipo_recurso')
+    recurso.categoria_id = datos.get('categoria')
+    recurso.contenido = datos.get('contenido', '')
+    recurso.es_publico = datos.get('es_publico') == 'on'
+
+
+def crear_recurso(usuario, datos, archivo=None):
+    recurso = Recurso(creado_por=usuario, archivo=archivo)
+    _asignar(recurso, datos)
+    recurso.save()
+    return recurso
+
+
+def editar_recurso(usuario, rol, recurso_id, datos, archivo=None):
+    recurso = get_object_or_404(recursos_editables(usuario, rol), id=recurso_id)
+    _asignar(recurso, datos)
+    guardar_recurso(recurso, archivo)
+    return recurso
+
+
+def _ids(valores):
+    ids = set()
+    for valor in valores:
+        try:
+            ids.add(int(valor))
+        except (TypeError, ValueError):
+            raise ValueError(f'Identificador de recurso inválido: {valor}')
+    return ids
+
+
+def accion_masiva(usuario, rol, accion, ids, categoria_id=None):
+    """Aplica ``accion`` a los recursos ``ids`` que el usuario puede editar y devuelve el diff."""
+    if accion not in ACCIONES_MASIVAS:
+        raise ValueError(f'Acción inválida: {accion}')
+    ids = _ids(ids)
+
+    diff = {'accion': accion, 'actualizados': [], 'cambios': {}, 'eliminados': [], 'sin_cambios': []}
+    if accion == 'publicar':
+        campo, valor = 'es_publico', True
+        diff['cambios'] = {'es_publico': True}
+    elif accion == 'despublicar':
+        campo, valor = 'es_publico', False
+        diff['cambios'] = {'es_publico': False}
+    elif accion == 'recategorizar':
+        categoria = CategoriaRecurso.objects.filter(id=categoria_id).first() if categoria_id else None
+        if categoria is None:
+            raise ValueError('La categoría no existe')
+        campo, valor = 'categoria_id', categoria.id
+        diff['cambios'] = {'categoria': {'id': categoria.id, 'nombre': categoria.nombre, 'color': categoria.color}}
+
+    # order_by() vacío: el SELECT ... FOR UPDATE no necesita ordenar
+    seleccion = recursos_editables(usuario, rol).filter(id__in=ids).order_by().select_for_update(of=('self',))
+    with transaction.atomic():
+        if accion == 'eliminar':
+            diff['eliminados'] = sorted(seleccion.values_list('id', flat=True))
+            if diff['eliminados']:
+                Recurso.objects.filter(id__in=diff['eliminados']).delete()
+            editables = set(diff['eliminados'])
+        else:
+            filas = list(seleccion.values_list('id', campo))
+            diff['actualizados'] = sorted(id_ for id_, actual in filas if actual != valor)
+            diff['sin_cambios'] = sorted(id_ for id_, actual in filas if actual == valor)
+            if diff['actualizados']:
+                Recurso.objects.filter(id__in=diff['actualizados']).update(**{campo: valor})
+                invalidar_catalogo()
+            editables = {id_ for id_, _ in filas}
+
+    diff['sin_permiso'] = sorted(ids - editables)
+    return diff
+
@@ -0,0 +1,199 @@
+"""Medición de consultas SQL y tiempos de cada petición.
+
+``InstrumentacionMiddleware`` registra por petición la cantidad de consultas,
+el tiempo total de SQL, la consulta más lenta, el tiempo de render de
+plantillas y el total, agrupados por el nombre de la URL (``miapp:detalle_hilo``).
+El resultado va al logger ``miapp.instrumentacion`` y, si
+``INSTRUMENTACION_SERVER_TIMING`` está activo, a la cabecera ``Server-Timing``.
+
+Las vistas declaran cuántas consultas pueden hacer con
+``@presupuesto_consultas(n)`` (en ``miapp.decorators``). Si lo superan se
+registra una advertencia, y en los tests ``PresupuestoConsultasMixin`` hace
+fallar el caso.
+"""
+import contextvars
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# Medición de la petición en curso. Es una variable de contexto para que las
+# consultas hechas en hilos de sync_to_async (vistas async) también se cuenten
+_medicion_actual = contextvars.ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+    """Contadores de una petición."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_sql = 0.0
+        self.tiempo_render = 0.0
+        self.consulta_mas_lenta = ('', 0.0)
+        self.sentencias = []
+        self.inicio = time.perf_counter()
+        self.total = None
+
+    def registrar_consulta(self, sql, duracion):
+        self.consultas += 1
+        self.tiempo_sql += duracion
+        self.sentencias.append(sql)
+        if duracion > self.consulta_mas_lenta[1]:
+            self.consulta_mas_lenta = (sql, duracion)
+
+    def terminar(self):
+        self.total = time.perf_counter() - self.inicio
+
+    def como_dict(self):
+        return {
+            'consultas': self.consultas,
+            'sql_ms': round(self.tiempo_sql * 1000, 1),
+            'render_ms': round(self.tiempo_render * 1000, 1),
+            'total_ms': round(self.total * 1000, 1),
+            'consulta_mas_lenta_ms': round(self.consulta_mas_lenta[1] * 1000, 1),
+            'consulta_mas_lenta': self.consulta_mas_lenta[0],
+        }
+
+
+def presupuesto_de(vista):
+    """Presupuesto de consultas declarado por una vista, o None."""
+    return getattr(vista, 'presupuesto_consultas', None)
+
+
+# ==================== CONSULTAS ====================
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.registrar_consulta(sql, time.perf_counter() - inicio)
+
+
+@receiver(connection_created)
+def instrumentar_conexion(sender, connection, **kwargs):
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_consulta)
+
+
+# ==================== PLANTILLAS ====================
+
+class PlantillasMedidas(DjangoTemplates):
+    """Backend DjangoTemplates que suma el tiempo de render a la medición en curso."""
+
+    def from_string(self, template_code):
+        return _PlantillaMedida(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _PlantillaMedida(super().get_template(template_name))
+
+
+class _PlantillaMedida:
+    def __init__(self, plantilla):
+        self.plantilla = plantilla
+
+    def __getattr__(self, nombre):
+        return getattr(self.plantilla, nombre)
+
+    def render(self, context=None, request=None):
+        medicion = _medicion_actual.get()
+        if medicion is None:
+            return self.plantilla.render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return self.plantilla.render(context, request)
+        finally:
+            # Incluye las consultas perezosas que se ejecutan desde la plantilla
+            medicion.tiempo_render += time.perf_counter() - inicio
+
+
+# ==================== MIDDLEWARE ====================
+
+class InstrumentacionMiddleware:
+    """Mide cada petición; va primero en MIDDLEWARE para abarcar a los demás."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        self._informar(request, response, medicion)
+        return response
+
+    async def _acall(self, request):
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        self._informar(request, response, medicion)
+        return response
+
+    def _informar(self, request, response, medicion):
+        medicion.terminar()
+        response.medicion = medicion
+
+        coincidencia = getattr(request, 'resolver_match', None)
+        vista = coincidencia.view_name if coincidencia else None
+        datos = {'vista': vista, 'metodo': request.method, 'estado': response.status_code, **medicion.como_dict()}
+
+        presupuesto = presupuesto_de(coincidencia.func) if coincidencia else None
+        if presupuesto is not None and medicion.consultas > presupuesto:
+            logger.warning(
+                '%s superó su presupuesto de consultas: %d de %d',
+                vista, medicion.consultas, presupuesto, extra={'instrumentacion': datos},
+            )
+        logger.info(
+            '%s %s consultas=%d sql_ms=%.1f render_ms=%.1f total_ms=%.1f',
+            request.method, vista or request.path, medicion.consultas,
+            datos['sql_ms'], datos['render_ms'], datos['total_ms'],
+            extra={'instrumentacion': datos},
+        )
+
+        if getattr(settings, 'INSTRUMENTACION_SERVER_TIMING', settings.DEBUG):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={datos["sql_ms"]};desc="{medicion.consultas} consultas"',
+                f'db-max;dur={datos["consulta_mas_lenta_ms"]}',
+                f'render;dur={datos["render_ms"]}',
+                f'total;dur={datos["total_ms"]}',
+            ])
+
+
+# ==================== TESTS ====================
+
+class PresupuestoConsultasMixin:
+    """Para los TestCase: falla si una respuesta supera el presupuesto de su vista."""
+
+    def assertDentroDelPresupuesto(self, respuesta):
+        vista = respuesta.resolver_match.view_name
+        presupuesto = presupuesto_de(respuesta.resolver_match.func)
+        if presupuesto is None:
+            self.fail(f'{vista} no declara @presupuesto_consultas')
+        medicion = respuesta.medicion
+        if medicion.consultas > presupuesto:
+            sentencias = '\n'.join(f'{i}. {sql}' for i, sql in enumerate(medicion.sentencias, start=1))
+            self.fail(
+                f'{vista} hizo {medicion.consultas} consultas y su presupuesto es {presupuesto}:\n{sentencias}'
+            )
@@ -0,0 +1,223 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from miapp.metricas import invalidar_metricas
+from miapp.models import UserProfile
+
+TIPOS_USUARIO = dict(UserProfile.TIPO_USUARIO_CHOICES)
+
+# Columnas de User que se pueden importar (además de username y password)
+CAMPOS_USUARIO = ('email', 'first_name', 'last_name', 'is_active')
+
+VERDADEROS = {'1', 'true', 'si', 'sí', 'yes'}
+
+
+def _iniciar_proceso(modulo_settings):
+    # Con el método "spawn" (macOS, Windows) los procesos no heredan Django configurado
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', modulo_settings)
+        django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa usuarios y sus roles desde un archivo CSV o JSONL. Crea los usuarios '
+        'nuevos y actualiza los existentes con bulk_create/bulk_update'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'archivo',
+            help='CSV con encabezados o JSONL con un objeto por línea. Campos: username (obligatorio), '
+                 'password, email, first_name, last_name, is_active y tipo_usuario. Los usuarios '
+                 'existentes sólo cambian en los campos presentes (sin tipo_usuario conservan su rol); '
+                 'si la fila trae password, se reemplaza. Los nuevos sin tipo_usuario son pacientes',
+        )
+        parser.add_argument(
+            '--formato', choices=['csv', 'jsonl'],
+            help='Formato del archivo (por defecto se deduce de la extensión)',
+        )
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Cantidad de usuarios que se escriben por transacción (por defecto 1000)',
+        )
+        parser.add_argument(
+            '--procesos', type=int, default=os.cpu_count(),
+            help='Procesos que calculan los hashes de las contraseñas (por defecto, uno por CPU)',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Valida el archivo y muestra qué se haría, sin escribir en la base de datos',
+        )
+
+    def handle(self, *args, **options):
+        filas = self._leer(Path(options['archivo']), options['formato'])
+        usuarios = self._validar(filas)
+
+        existentes = {
+            usuario.username: usuario
+            for usuario in User.objects.filter(username__in=list(usuarios)).select_related('userprofile')
+        }
+        con_password = {username: datos['password'] for username, datos in usuarios.items() if datos['password']}
+        escribir = not options['dry_run']
+
+        if escribir:
+            # El hash es lo más caro de la importación: se reparte entre procesos
+            passwords = self._hashear(con_password, options['procesos'])
+        else:
+            passwords = dict.fromkeys(con_password, '')
+
+        creados = actualizados = 0
+        lista = list(usuarios.items())
+        for inicio in range(0, len(lista), options['lote']):
+            lote = dict(lista[inicio:inicio + options['lote']])
+            with transaction.atomic():
+                c, a = self._escribir_lote(lote, existentes, passwords, escribir)
+            creados += c
+            actualizados += a
+
+        if not escribir:
+            self.stdout.write(
+                f'Se crearían {creados} usuarios y se actualizarían {actualizados} (no se escribió nada)'
+            )
+            return
+
+        # bulk_create/bulk_update no envían señales: ni las de models.py (por eso
+        # los perfiles se crean aquí) ni las que invalidan las métricas
+        invalidar_metricas(User)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Importación completada: {creados} usuarios creados, {actualizados} actualizados'
+        ))
+
+    def _leer(self, ruta, formato):
+        formato = formato or ruta.suffix.lstrip('.').lower()
+        if formato not in ('csv', 'jsonl'):
+            raise CommandError('No se pudo deducir el formato del archivo: usa --formato csv o jsonl')
+        try:
+            with ruta.open(encoding='utf-8-sig', newline='') as archivo:
+                if formato == 'csv':
+                    return list(csv.DictReader(archivo))
+                return [json.loads(linea) for linea in archivo if linea.strip()]
+        except OSError as error:
+            raise CommandError(f'No se pudo leer {ruta}: {error}')
+        except json.JSONDecodeError as error:
+            raise CommandError(f'JSONL inválido en {ruta}: {error}')
+
+    def _validar(self, filas):
+        """Normaliza las filas y devuelve {username: datos}; avisa de las inválidas."""
+        usuarios = {}
+        for numero, fila in enumerate(filas, start=1):
+            username = str(fila.get('username') or '').strip()
+            # Sin tipo_usuario los existentes conservan su rol; los nuevos son pacientes
+            tipo = str(fila.get('tipo_usuario') or '').strip() or None
+            if not username:
+                self.stderr.write(f'Fila {numero}: falta username, se omite')
+                continue
+            if tipo is not None and tipo not in TIPOS_USUARIO:
+                self.stderr.write(f'Fila {numero}: tipo_usuario "{tipo}" inválido, se omite')
+                continue
+            if username in usuarios:
+                self.stderr.write(f'Fila {numero}: {username} está repetido, se usa la última fila')
+
+            datos = {'tipo_usuario': tipo, 'password': fila.get('password') or ''}
+            for campo in CAMPOS_USUARIO:
+                valor = fila.get(campo)
+                if valor is None or valor == '':
+                    continue
+                if campo == 'is_active' and not isinstance(valor, bool):
+                    valor = str(valor).strip().lower() in VERDADEROS
+                datos[campo] = valor
+            usuarios[username] = datos
+        return usuarios
+
+    def _hashear(self, passwords, procesos):
+        if not passwords:
+            return {}
+        if procesos <= 1 or len(passwords) == 1:
+            return {username: make_password(password) for username, password in passwords.items()}
+
+        with ProcessPoolExecutor(
+            max_workers=procesos, initializer=_iniciar_proceso, initargs=(settings.SETTINGS_MODULE,)
+        ) as ejecutor:
+            hashes = ejecutor.map(
+                make_password, passwords.values(), chunksize=max(1, len(passwords) // (procesos * 4))
+            )
+            return dict(zip(passwords, hashes))
+
+    def _escribir_lote(self, lote, existentes, passwords, escribir):
+        """Crea y actualiza los usuarios del lote; devuelve (creados, actualizados)."""
+        # Usuarios nuevos; sin contraseña en el archivo quedan con una inutilizable
+        nuevos = [
+            User(
+                username=username,
+                password=passwords.get(username) or make_password(None),
+                **{campo: datos[campo] for campo in CAMPOS_USUARIO if campo in datos},
+            )
+            for username, datos in lote.items()
+            if username not in existentes
+        ]
+        perfiles_nuevos = []
+        if escribir and nuevos:
+            User.objects.bulk_create(nuevos)
+            # No todos los motores devuelven los ids de bulk_create: se leen de nuevo
+            ids = dict(
+                User.objects.filter(username__in=[usuario.username for usuario in nuevos])
+                .values_list('username', 'id')
+            )
+            perfiles_nuevos = [
+                UserProfile(
+                    user_id=ids[usuario.username], tipo_usuario=lote[usuario.username]['tipo_usuario'] or 'paciente',
+                )
+                for usuario in nuevos
+            ]
+
+        # Usuarios existentes: sólo se escriben los campos que cambiaron
+        ids_existentes = {existentes[username].id for username in lote if username in existentes}
+        usuarios_cambiados, campos_usuario = [], set()
+        perfiles_cambiados = []
+        for username, datos in lote.items():
+            usuario = existentes.get(username)
+            if usuario is None:
+                continue
+
+            cambios = {campo for campo in CAMPOS_USUARIO if campo in datos and getattr(usuario, campo) != datos[campo]}
+            for campo in cambios:
+                setattr(usuario, campo, datos[campo])
+            if username in passwords:
+                usuario.password = passwords[username]
+                cambios.add('password')
+            if cambios:
+                usuarios_cambiados.append(usuario)
+                campos_usuario |= cambios
+
+            perfil = getattr(usuario, 'userprofile', None)
+            if perfil is None:
+                perfiles_nuevos.append(UserProfile(user=usuario, tipo_usuario=datos['tipo_usuario'] or 'paciente'))
+            elif datos['tipo_usuario'] is not None and perfil.tipo_usuario != datos['tipo_usuario']:
+                perfil.tipo_usuario = datos['tipo_usuario']
+                perfiles_cambiados.append(perfil)
+
+        if escribir:
+            UserProfile.objects.bulk_create(perfiles_nuevos)
+            if usuarios_cambiados:
+                User.objects.bulk_update(usuarios_cambiados, sorted(campos_usuario))
+            if perfiles_cambiados:
+                UserProfile.objects.bulk_update(perfiles_cambiados, ['tipo_usuario'])
+
+        actualizados = {usuario.id for usuario in usuarios_cambiados}
+        actualizados |= {perfil.user_id for perfil in perfiles_cambiados}
+        actualizados |= {perfil.user_id for perfil in perfiles_nuevos if perfil.user_id in ids_existentes}
+        return len(nuevos), len(actualizados)
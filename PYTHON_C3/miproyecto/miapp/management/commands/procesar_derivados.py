@@ -0,0 +1,45 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from miapp.catalogo import invalidar_catalogo
+from miapp.derivados import TIPOS_CON_DERIVADOS, crear_ejecutor, procesar_recurso
+from miapp.models import Recurso
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera el hash, las versiones reducidas y el póster de los recursos de imagen y video '
+        'que todavía no los tienen (pendientes, con error o subidos antes de que existieran)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--procesos', type=int, default=2,
+            help='Procesos que generan los derivados en paralelo (por defecto 2)',
+        )
+
+    def handle(self, *args, **options):
+        ids = list(
+            Recurso.objects.filter(tipo_recurso__in=TIPOS_CON_DERIVADOS)
+            .exclude(archivo='').exclude(archivo__isnull=True)
+            .exclude(estado_derivados='listo')
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        if not ids:
+            self.stdout.write('No hay recursos pendientes')
+            return
+
+        if options['procesos'] <= 1:
+            estados = Counter(map(procesar_recurso, ids))
+        else:
+            with crear_ejecutor(options['procesos']) as ejecutor:
+                estados = Counter(ejecutor.map(procesar_recurso, ids))
+
+        # Las actualizaciones se hacen con update(), que no envía señales
+        invalidar_catalogo()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{estados["listo"]} recursos procesados, {estados["error"]} con error'
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from miapp.models import HiloForo, RespuestaForo
+from miapp.paginacion import lotes_de_ids
+from miapp.popularidad import actualizar_popularidad
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero los contadores de respuestas de los hilos del foro'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Cantidad de hilos que se actualizan por transacción (por defecto 1000)',
+        )
+
+    def handle(self, *args, **options):
+        respuestas = RespuestaForo.objects.filter(hilo=OuterRef('pk'))
+        conteo = respuestas.order_by().values('hilo').annotate(total=Count('id')).values('total')
+        ultima = respuestas.order_by('-creado_en', '-id')
+
+        total = 0
+        for ids in lotes_de_ids(HiloForo.objects.all(), options['lote']):
+            with transaction.atomic():
+                total += HiloForo.objects.filter(id__in=ids).update(
+                    num_respuestas=Coalesce(Subquery(conteo, output_field=IntegerField()), 0),
+                    ultima_respuesta_en=Subquery(ultima.values('creado_en')[:1]),
+                    ultima_respuesta_por=Subquery(ultima.values('creado_por')[:1]),
+                )
+                actualizar_popularidad(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Contadores recalculados para {total} hilos'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from miapp.models import HiloForo
+from miapp.paginacion import lotes_de_ids
+from miapp.popularidad import actualizar_popularidad
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la puntuación de popularidad de todos los hilos del foro'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Cantidad de hilos que se actualizan por transacción (por defecto 1000)',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for ids in lotes_de_ids(HiloForo.objects.all(), options['lote']):
+            with transaction.atomic():
+                total += actualizar_popularidad(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Popularidad recalculada para {total} hilos'))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from miapp.models import HiloForo
+from miapp.paginacion import lotes_de_ids
+from miapp.popularidad import actualizar_popularidad
+from miapp.votos import VOTABLES
+
+
+def conteo_votos(ModeloVoto, campo, tipo_voto):
+    votos = (
+        ModeloVoto.objects.filter(**{campo: OuterRef('pk')}, tipo_voto=tipo_voto)
+        .order_by()
+        .values(campo)
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    return Coalesce(Subquery(votos, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores de votos de hilos y respuestas a partir de las tablas de votos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Cantidad de filas que se actualizan por transacción (por defecto 1000)',
+        )
+
+    def handle(self, *args, **options):
+        for tipo_objeto, (Modelo, ModeloVoto, campo) in VOTABLES.items():
+            positivos = conteo_votos(ModeloVoto, campo, 'positivo')
+            negativos = conteo_votos(ModeloVoto, campo, 'negativo')
+
+            total = 0
+            for ids in lotes_de_ids(Modelo.objects.all(), options['lote']):
+                with transaction.atomic():
+                    total += Modelo.objects.filter(id__in=ids).update(
+                        votos_positivos=positivos,
+                        votos_negativos=negativos,
+                    )
+                    if Modelo is HiloForo:
+                        actualizar_popularidad(ids)
+
+            self.stdout.write(self.style.SUCCESS(f'Votos reconciliados para {total} filas de tipo {tipo_objeto}'))
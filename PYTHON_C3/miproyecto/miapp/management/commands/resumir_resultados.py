@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from miapp.analitica import resumir_pendientes
+from miapp.models import ResultadoTest
+from miapp.paginacion import lotes_de_ids
+
+
+class Command(BaseCommand):
+    help = (
+        'Suma a los resúmenes de analítica los resultados de tests que todavía no están resumidos '
+        '(los anteriores a los resúmenes). Se puede interrumpir y volver a ejecutar'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Cantidad de resultados que se suman por transacción (por defecto 1000)',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for ids in lotes_de_ids(ResultadoTest.objects.filter(resumido=False), options['lote']):
+            with transaction.atomic():
+                total += resumir_pendientes(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'{total} resultados sumados a los resúmenes'))
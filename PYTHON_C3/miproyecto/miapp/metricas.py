@@ -0,0 +1,94 @@
+"""Métricas de las tarjetas de los dashboards de administrador y pasante.
+
+Cada tarjeta es un agregado sobre un modelo (por ejemplo ``Count('id',
+filter=Q(respondido=False))``). Todas las tarjetas de un mismo modelo se
+calculan juntas en un solo ``aggregate()``, así que agregar una tarjeta sobre
+una tabla que ya tiene otras no suma consultas.
+
+El resultado de cada modelo se guarda en caché ``DASHBOARD_METRICAS_TTL``
+segundos y se borra cuando se guarda o elimina una fila de ese modelo.
+Para agregar una tarjeta::
+
+    registrar_tarjeta('hilos_abiertos', HiloForo, Count('id', filter=Q(estado='abierto')))
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+
+from .models import FormularioContacto, Recurso
+
+PREFIJO = 'dashboard:metricas:'
+
+# Nombre de la tarjeta -> (modelo, agregado)
+TARJETAS = {}
+
+
+def _clave(modelo):
+    return PREFIJO + modelo._meta.label_lower
+
+
+def invalidar_metricas(modelo):
+    """Borra del caché las tarjetas de ``modelo`` al confirmar la transacción.
+
+    Hay que llamarla después de ``QuerySet.update()`` o ``delete()`` masivos,
+    que no envían señales por fila.
+    """
+    clave = _clave(modelo)
+    transaction.on_commit(lambda: cache.delete(clave))
+
+
+def _invalidar(sender, **kwargs):
+    invalidar_metricas(sender)
+
+
+def registrar_tarjeta(nombre, modelo, agregado):
+    """Agrega una tarjeta calculada con ``agregado`` sobre ``modelo``."""
+    TARJETAS[nombre] = (modelo, agregado)
+    # Con dispatch_uid cada modelo queda conectado una sola vez
+    uid = f'metricas_dashboard:{modelo._meta.label_lower}'
+    post_save.connect(_invalidar, sender=modelo, dispatch_uid=uid, weak=False)
+    post_delete.connect(_invalidar, sender=modelo, dispatch_uid=uid, weak=False)
+
+
+def metricas_dashboard(nombres):
+    """Devuelve {nombre: valor} con una consulta por modelo que no esté en caché."""
+    por_modelo = defaultdict(list)
+    for nombre in nombres:
+        modelo, _ = TARJETAS[nombre]
+        por_modelo[modelo].append(nombre)
+
+    claves = {_clave(modelo): modelo for modelo in por_modelo}
+    en_cache = cache.get_many(claves)
+
+    metricas = {}
+    nuevas = {}
+    for clave, modelo in claves.items():
+        valores = en_cache.get(clave)
+        if valores is None or not set(por_modelo[modelo]) <= valores.keys():
+            # Se calculan todas las tarjetas del modelo, no sólo las pedidas,
+            # para que el otro dashboard también encuentre su resultado en caché
+            valores = modelo._default_manager.order_by().aggregate(**{
+                nombre: agregado
+                for nombre, (modelo_tarjeta, agregado) in TARJETAS.items()
+                if modelo_tarjeta is modelo
+            })
+            nuevas[clave] = valores
+        metricas.update(valores)
+
+    if nuevas:
+        cache.set_many(nuevas, getattr(settings, 'DASHBOARD_METRICAS_TTL', 60))
+    return {nombre: metricas[nombre] for nombre in nombres}
+
+
+# ==================== TARJETAS ====================
+
+registrar_tarjeta('total_usuarios', User, Count('id'))
+registrar_tarjeta('total_recursos', Recurso, Count('id'))
+registrar_tarjeta('total_consultas', FormularioContacto, Count('id'))
+registrar_tarjeta('consultas_sin_responder', FormularioContacto, Count('id', filter=Q(respondido=False)))
+registrar_tarjeta('consultas_sin_leer', FormularioContacto, Count('id', filter=Q(leido=False)))
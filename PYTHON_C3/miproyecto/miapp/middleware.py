@@ -0,0 +1,28 @@
+"""Middleware de miapp."""
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .models import UserProfile
+
+
+def rol_de(user):
+    """Tipo de usuario ('admin', 'pasante', 'paciente') o None si no hay sesión o perfil."""
+    if not user.is_authenticated:
+        return None
+    try:
+        return user.userprofile.tipo_usuario
+    except UserProfile.DoesNotExist:
+        return None
+
+
+class RolUsuarioMiddleware(MiddlewareMixin):
+    """
+    Expone ``request.role`` con el tipo de usuario de la sesión.
+
+    Va después de ``AuthenticationMiddleware``. Se evalúa recién cuando se usa
+    y, con ``BackendConPerfil``, sale de la misma consulta que carga el usuario.
+    Con MiddlewareMixin sirve tanto a vistas síncronas como async (eventos SSE).
+    """
+
+    def process_request(self, request):
+        request.role = SimpleLazyObject(lambda: rol_de(request.user))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def calcular_contadores(apps, schema_editor):
+    HiloForo = apps.get_model('miapp', 'HiloForo')
+    RespuestaForo = apps.get_model('miapp', 'RespuestaForo')
+
+    respuestas = RespuestaForo.objects.filter(hilo=OuterRef('pk'))
+    conteo = respuestas.order_by().values('hilo').annotate(total=Count('id')).values('total')
+    ultima = respuestas.order_by('-creado_en', '-id')
+
+    HiloForo.objects.update(
+        num_respuestas=Coalesce(Subquery(conteo, output_field=IntegerField()), 0),
+        ultima_respuesta_en=Subquery(ultima.values('creado_en')[:1]),
+        ultima_respuesta_por=Subquery(ultima.values('creado_por')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0002_categoriaforo_hiloforo_respuestaforo_votohilo_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hiloforo',
+            name='num_respuestas',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hiloforo',
+            name='ultima_respuesta_en',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='hiloforo',
+            name='ultima_respuesta_por',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(calcular_contadores, migrations.RunPython.noop),
+    ]
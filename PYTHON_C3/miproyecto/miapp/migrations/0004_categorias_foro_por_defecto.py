@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+CATEGORIAS_POR_DEFECTO = [
+    {'nombre': 'Experiencias Personales', 'color': '#6C63FF', 'orden': 1},
+    {'nombre': 'Consejos y Estrategias', 'color': '#4CAF50', 'orden': 2},
+    {'nombre': 'Apoyo Emocional', 'color': '#FF6B6B', 'orden': 3},
+    {'nombre': 'Preguntas y Dudas', 'color': '#FFA726', 'orden': 4},
+]
+
+
+def crear_categorias(apps, schema_editor):
+    CategoriaForo = apps.get_model('miapp', 'CategoriaForo')
+    # Igual que hacía antes la vista del foro: sólo si todavía no hay ninguna
+    if not CategoriaForo.objects.exists():
+        CategoriaForo.objects.bulk_create(
+            [CategoriaForo(**datos) for datos in CATEGORIAS_POR_DEFECTO]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0003_hiloforo_contadores_respuestas'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_categorias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+from django.db import migrations
+
+
+# PostgreSQL: columnas tsvector generadas por la base de datos + índice GIN
+POSTGRESQL = [
+    """
+    ALTER TABLE miapp_hiloforo ADD COLUMN busqueda tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', coalesce(titulo, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(contenido, '')), 'B')
+    ) STORED
+    """,
+    'CREATE INDEX miapp_hiloforo_busqueda_gin ON miapp_hiloforo USING gin (busqueda)',
+    """
+    ALTER TABLE miapp_respuestaforo ADD COLUMN busqueda tsvector GENERATED ALWAYS AS (
+        to_tsvector('spanish', coalesce(contenido, ''))
+    ) STORED
+    """,
+    'CREATE INDEX miapp_respuestaforo_busqueda_gin ON miapp_respuestaforo USING gin (busqueda)',
+]
+
+POSTGRESQL_REVERSA = [
+    'DROP INDEX IF EXISTS miapp_respuestaforo_busqueda_gin',
+    'ALTER TABLE miapp_respuestaforo DROP COLUMN IF EXISTS busqueda',
+    'DROP INDEX IF EXISTS miapp_hiloforo_busqueda_gin',
+    'ALTER TABLE miapp_hiloforo DROP COLUMN IF EXISTS busqueda',
+]
+
+# SQLite (desarrollo local): tablas FTS5 que mantienen las señales de miapp.busqueda
+SQLITE = [
+    """
+    CREATE VIRTUAL TABLE miapp_hiloforo_fts USING fts5(
+        titulo, contenido, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO miapp_hiloforo_fts (rowid, titulo, contenido)
+    SELECT id, titulo, contenido FROM miapp_hiloforo
+    """,
+    """
+    CREATE VIRTUAL TABLE miapp_respuestaforo_fts USING fts5(
+        contenido, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO miapp_respuestaforo_fts (rowid, contenido)
+    SELECT id, contenido FROM miapp_respuestaforo
+    """,
+]
+
+SQLITE_REVERSA = [
+    'DROP TABLE IF EXISTS miapp_respuestaforo_fts',
+    'DROP TABLE IF EXISTS miapp_hiloforo_fts',
+]
+
+
+def ejecutar(sentencias_por_motor):
+    def operacion(apps, schema_editor):
+        for sentencia in sentencias_por_motor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sentencia)
+    return operacion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0004_categorias_foro_por_defecto'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            ejecutar({'postgresql': POSTGRESQL, 'sqlite': SQLITE}),
+            ejecutar({'postgresql': POSTGRESQL_REVERSA, 'sqlite': SQLITE_REVERSA}),
+        ),
+    ]
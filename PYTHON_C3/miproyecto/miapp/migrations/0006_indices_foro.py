@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+from miapp.operaciones import AgregarIndiceConcurrente
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('miapp', '0005_busqueda_foro'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AgregarIndiceConcurrente(
+            model_name='hiloforo',
+            index=models.Index(fields=['-creado_en', '-id'], name='miapp_hilo_creado_idx'),
+        ),
+        AgregarIndiceConcurrente(
+            model_name='hiloforo',
+            index=models.Index(fields=['categoria', '-creado_en', '-id'], name='miapp_hilo_cat_creado_idx'),
+        ),
+        AgregarIndiceConcurrente(
+            model_name='hiloforo',
+            index=models.Index(fields=['-votos_positivos', '-visitas', '-actualizado_en', '-id'], name='miapp_hilo_populares_idx'),
+        ),
+        AgregarIndiceConcurrente(
+            model_name='hiloforo',
+            index=models.Index(fields=['categoria', '-votos_positivos', '-visitas', '-actualizado_en', '-id'], name='miapp_hilo_cat_populares_idx'),
+        ),
+        AgregarIndiceConcurrente(
+            model_name='hiloforo',
+            index=models.Index(condition=models.Q(('estado', 'abierto')), fields=['id'], name='miapp_hilo_abiertos_idx'),
+        ),
+        AgregarIndiceConcurrente(
+            model_name='respuestaforo',
+            index=models.Index(fields=['hilo', 'creado_en', 'id'], name='miapp_resp_hilo_creado_idx'),
+        ),
+    ]
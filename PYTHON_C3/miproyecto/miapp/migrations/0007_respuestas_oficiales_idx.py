@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+from miapp.operaciones import AgregarIndiceConcurrente
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('miapp', '0006_indices_foro'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AgregarIndiceConcurrente(
+            model_name='respuestaforo',
+            index=models.Index(condition=models.Q(('es_respuesta_oficial', True)), fields=['hilo', 'creado_en', 'id'], name='miapp_resp_oficiales_idx'),
+        ),
+    ]
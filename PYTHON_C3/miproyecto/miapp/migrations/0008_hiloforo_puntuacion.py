@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:27
+
+import datetime
+import math
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Copia de la fórmula de miapp.popularidad al momento de esta migración, para
+# que no cambie si más adelante cambia la del módulo
+EPOCA = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+PESO_RESPUESTA = 2
+VISITAS_POR_PUNTO = 20
+CAMPOS = ('votos_positivos', 'votos_negativos', 'num_respuestas', 'visitas', 'creado_en')
+
+
+def calcular_puntuacion(votos_positivos, votos_negativos, num_respuestas, visitas, creado_en):
+    vida_media = getattr(settings, 'FORO_POPULARIDAD_VIDA_MEDIA', 48 * 3600)
+    interacciones = max(
+        votos_positivos - votos_negativos
+        + PESO_RESPUESTA * num_respuestas
+        + visitas / VISITAS_POR_PUNTO,
+        0,
+    )
+    antiguedad = (creado_en - EPOCA).total_seconds()
+    return math.log10(1 + interacciones) + antiguedad / vida_media * math.log10(2)
+
+
+def calcular_puntuaciones(apps, schema_editor):
+    HiloForo = apps.get_model('miapp', 'HiloForo')
+    hilos = []
+    for hilo in HiloForo.objects.only(*CAMPOS).iterator(chunk_size=1000):
+        hilo.puntuacion = calcular_puntuacion(*(getattr(hilo, campo) for campo in CAMPOS))
+        hilos.append(hilo)
+    HiloForo.objects.bulk_update(hilos, ['puntuacion'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0007_respuestas_oficiales_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hiloforo',
+            name='puntuacion',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(calcular_puntuaciones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+from miapp.operaciones import AgregarIndiceConcurrente
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('miapp', '0008_hiloforo_puntuacion'),
+    ]
+
+    # Los índices nuevos se crean antes de borrar los del orden anterior
+    operations = [
+        AgregarIndiceConcurrente(
+            model_name='hiloforo',
+            index=models.Index(fields=['-puntuacion', '-id'], name='miapp_hilo_puntuacion_idx'),
+        ),
+        AgregarIndiceConcurrente(
+            model_name='hiloforo',
+            index=models.Index(fields=['categoria', '-puntuacion', '-id'], name='miapp_hilo_cat_puntuacion_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='hiloforo',
+            name='miapp_hilo_populares_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='hiloforo',
+            name='miapp_hilo_cat_populares_idx',
+        ),
+    ]
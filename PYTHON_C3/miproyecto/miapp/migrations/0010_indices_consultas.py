@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+from miapp.operaciones import AgregarIndiceConcurrente
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('miapp', '0009_indices_puntuacion'),
+    ]
+
+    operations = [
+        AgregarIndiceConcurrente(
+            model_name='formulariocontacto',
+            index=models.Index(fields=['respondido', '-creado_en', '-id'], name='miapp_consulta_bandeja_idx'),
+        ),
+        AgregarIndiceConcurrente(
+            model_name='formulariocontacto',
+            index=models.Index(condition=models.Q(('respondido', False)), fields=['-creado_en', '-id'], name='miapp_consulta_pendientes_idx'),
+        ),
+    ]
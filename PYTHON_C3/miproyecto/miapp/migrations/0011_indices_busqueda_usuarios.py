@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+# La búsqueda de usuarios usa username__istartswith y email__istartswith, que en
+# PostgreSQL se traducen a UPPER(columna) LIKE 'PREFIJO%'. Estos índices de
+# expresión con varchar_pattern_ops permiten resolver ese LIKE por rango sin
+# importar la collation de la base. auth_user no es de miapp, por eso van en SQL.
+POSTGRESQL = [
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS miapp_usuario_username_prefijo_idx '
+    'ON auth_user (UPPER(username::text) varchar_pattern_ops)',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS miapp_usuario_email_prefijo_idx '
+    'ON auth_user (UPPER(email::text) varchar_pattern_ops)',
+]
+
+POSTGRESQL_REVERSA = [
+    'DROP INDEX CONCURRENTLY IF EXISTS miapp_usuario_email_prefijo_idx',
+    'DROP INDEX CONCURRENTLY IF EXISTS miapp_usuario_username_prefijo_idx',
+]
+
+
+def ejecutar(sentencias_por_motor):
+    def operacion(apps, schema_editor):
+        for sentencia in sentencias_por_motor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sentencia)
+    return operacion
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('miapp', '0010_indices_consultas'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            ejecutar({'postgresql': POSTGRESQL}),
+            ejecutar({'postgresql': POSTGRESQL_REVERSA}),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+from miapp.operaciones import AgregarIndiceConcurrente
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('miapp', '0011_indices_busqueda_usuarios'),
+    ]
+
+    operations = [
+        AgregarIndiceConcurrente(
+            model_name='recurso',
+            index=models.Index(condition=models.Q(('es_publico', True)), fields=['-creado_en', '-id'], name='miapp_recurso_publicos_idx'),
+        ),
+        AgregarIndiceConcurrente(
+            model_name='recurso',
+            index=models.Index(condition=models.Q(('es_publico', True)), fields=['categoria', '-creado_en', '-id'], name='miapp_recurso_cat_idx'),
+        ),
+        AgregarIndiceConcurrente(
+            model_name='recurso',
+            index=models.Index(condition=models.Q(('es_publico', True)), fields=['tipo_recurso', '-creado_en', '-id'], name='miapp_recurso_tipo_idx'),
+        ),
+    ]
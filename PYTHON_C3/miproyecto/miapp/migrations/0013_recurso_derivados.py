@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0012_indices_catalogo_recursos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurso',
+            name='derivados',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='recurso',
+            name='estado_derivados',
+            field=models.CharField(blank=True, choices=[('pendiente', 'Pendiente'), ('listo', 'Listo'), ('error', 'Error')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='recurso',
+            name='hash_contenido',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
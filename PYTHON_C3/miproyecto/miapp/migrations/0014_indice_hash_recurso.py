@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+from miapp.operaciones import AgregarIndiceConcurrente
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('miapp', '0013_recurso_derivados'),
+    ]
+
+    operations = [
+        AgregarIndiceConcurrente(
+            model_name='recurso',
+            index=models.Index(condition=models.Q(('hash_contenido', ''), _negated=True), fields=['hash_contenido'], name='miapp_recurso_hash_idx'),
+        ),
+    ]
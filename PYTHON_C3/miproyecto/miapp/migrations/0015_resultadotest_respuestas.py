@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0014_indice_hash_recurso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultadotest',
+            name='respuestas',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.CreateModel(
+            name='VersionTest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('firma', models.CharField(max_length=64)),
+                ('preguntas', models.JSONField()),
+                ('opciones', models.JSONField()),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versiones', to='miapp.testpsicologico')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='resultadotest',
+            name='version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='miapp.versiontest'),
+        ),
+        migrations.AddConstraint(
+            model_name='versiontest',
+            constraint=models.UniqueConstraint(fields=('test', 'firma'), name='miapp_versiontest_firma_unica'),
+        ),
+    ]
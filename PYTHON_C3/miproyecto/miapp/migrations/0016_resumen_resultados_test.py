@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0015_resultadotest_respuestas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenResultadosTest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('puntuacion', models.IntegerField()),
+                ('total', models.IntegerField(default=0)),
+            ],
+        ),
+        # Los resultados existentes quedan pendientes de sumar y los nuevos se
+        # suman al guardarse
+        migrations.AddField(
+            model_name='resultadotest',
+            name='resumido',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='resultadotest',
+            name='resumido',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='resumenresultadostest',
+            name='categoria',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='miapp.categoriarecurso'),
+        ),
+        migrations.AddField(
+            model_name='resumenresultadostest',
+            name='test',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='miapp.testpsicologico'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenresultadostest',
+            constraint=models.UniqueConstraint(fields=('test', 'dia', 'categoria', 'puntuacion'), name='miapp_resumen_resultados_unico'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+from miapp.operaciones import AgregarIndiceConcurrente
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción
+    atomic = False
+
+    dependencies = [
+        ('miapp', '0016_resumen_resultados_test'),
+    ]
+
+    operations = [
+        AgregarIndiceConcurrente(
+            model_name='resultadotest',
+            index=models.Index(condition=models.Q(('resumido', False)), fields=['id'], name='miapp_resultado_pendiente_idx'),
+        ),
+    ]
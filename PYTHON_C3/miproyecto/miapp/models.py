@@ -1,11 +1,10 @@
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_save
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
+from django.urls import reverse
 
 class UserProfile(models.Model):
     TIPO_USUARIO_CHOICES = [
@@ -32,6 +31,17 @@ class UserProfile(models.Model):
     
     def es_paciente(self):
         return self.tipo_usuario == 'paciente'
+    
+    # Campos cuyo cambio decide si el perfil se vuelve a guardar junto con el usuario
+    CAMPOS_EDITABLES = ('tipo_usuario', 'telefono', 'fecha_nacimiento')
+    
+    def campos_modificados(self):
+        """Campos editables que cambiaron desde que se cargó o guardó el perfil"""
+        return [
+            campo for campo in self.CAMPOS_EDITABLES
+            if campo in self._valores_guardados
+            and getattr(self, campo) != self._valores_guardados[campo]
+        ]
 
 # Señales para crear el profile automáticamente
 @receiver(post_save, sender=User)
@@ -40,9 +50,25 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'userprofile'):
-        instance.userprofile.save()
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    # login() guarda sólo last_login: el perfil no cambia
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    # Sólo se guarda un perfil ya cargado (si nadie lo leyó, nadie lo cambió)
+    # y sólo con los campos que cambiaron
+    if User.userprofile.is_cached(instance):
+        perfil = instance.userprofile
+        campos = perfil.campos_modificados()
+        if campos:
+            perfil.save(update_fields=campos)
+
+@receiver(post_init, sender=UserProfile)
+@receiver(post_save, sender=UserProfile)
+def recordar_valores_perfil(sender, instance, **kwargs):
+    # Se lee de __dict__ para no disparar una consulta si el campo está diferido
+    instance._valores_guardados = {
+        campo: instance.__dict__[campo] for campo in UserProfile.CAMPOS_EDITABLES if campo in instance.__dict__
+    }
 
 # Categorías para los recursos
 class CategoriaRecurso(models.Model):
@@ -72,10 +98,50 @@ class Recurso(models.Model):
     es_publico = models.BooleanField(default=True)
     creado_por = models.ForeignKey(User, on_delete=models.CASCADE)
     creado_en = models.DateTimeField(auto_now_add=True)
-    
+
+    # Derivados del archivo (miapp/derivados.py): imágenes reducidas y póster
+    ESTADO_DERIVADOS_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    ]
+    hash_contenido = models.CharField(max_length=64, blank=True)
+    derivados = models.JSONField(default=dict, blank=True)
+    estado_derivados = models.CharField(max_length=10, choices=ESTADO_DERIVADOS_CHOICES, blank=True)
+
+    class Meta:
+        # Catálogo público: sin filtro, por categoría y por tipo de recurso
+        indexes = [
+            models.Index(fields=['-creado_en', '-id'], condition=Q(es_publico=True), name='miapp_recurso_publicos_idx'),
+            models.Index(
+                fields=['categoria', '-creado_en', '-id'],
+                condition=Q(es_publico=True),
+                name='miapp_recurso_cat_idx',
+            ),
+            models.Index(
+                fields=['tipo_recurso', '-creado_en', '-id'],
+                condition=Q(es_publico=True),
+                name='miapp_recurso_tipo_idx',
+            ),
+            # Deduplicación de archivos por contenido
+            models.Index(fields=['hash_contenido'], condition=~Q(hash_contenido=''), name='miapp_recurso_hash_idx'),
+        ]
+
     def __str__(self):
         return self.titulo
 
+    @property
+    def variantes(self):
+        """[(ancho, url), ...] de las versiones reducidas, de menor a mayor."""
+        return [
+            (ancho, reverse('miapp:variante_recurso', args=[self.id, ancho]))
+            for ancho, _ in self.derivados.get('variantes', [])
+        ]
+
+    @property
+    def srcset(self):
+        return ', '.join(f'{url} {ancho}w' for ancho, url in self.variantes)
+
 # Tests psicológicos
 class TestPsicologico(models.Model):
     nombre = models.CharField(max_length=200)
@@ -99,6 +165,9 @@ class PreguntaTest(models.Model):
         return f"Pregunta {self.orden}: {self.texto_pregunta[:50]}..."
 
 class OpcionRespuesta(models.Model):
+    # ResultadoTest.respuestas guarda la opción elegida de cada pregunta en un byte
+    MAX_POR_PREGUNTA = 256
+
     pregunta = models.ForeignKey(PreguntaTest, on_delete=models.CASCADE, related_name='opciones')
     texto_opcion = models.CharField(max_length=200)
     valor = models.IntegerField()
@@ -107,16 +176,100 @@ class OpcionRespuesta(models.Model):
     def __str__(self):
         return self.texto_opcion
 
+    def clean(self):
+        if self.pregunta_id is None:
+            return
+        otras = OpcionRespuesta.objects.filter(pregunta_id=self.pregunta_id).exclude(pk=self.pk)
+        if otras.count() >= self.MAX_POR_PREGUNTA:
+            raise ValidationError(f'Una pregunta no puede tener más de {self.MAX_POR_PREGUNTA} opciones.')
+
+class VersionTest(models.Model):
+    """Preguntas y opciones de un test tal como estaban cuando se respondió.
+
+    Permite decodificar ``ResultadoTest.respuestas`` aunque después se agreguen,
+    reordenen o borren preguntas u opciones. Hay una fila por cada estructura
+    distinta del test (miapp.evaluacion la crea al compilarlo).
+    """
+    test = models.ForeignKey(TestPsicologico, on_delete=models.CASCADE, related_name='versiones')
+    firma = models.CharField(max_length=64)  # sha256 de la estructura
+    preguntas = models.JSONField()  # [pregunta_id, ...] por posición
+    opciones = models.JSONField()  # [[opcion_id, ...], ...] de cada pregunta
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['test', 'firma'], name='miapp_versiontest_firma_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.test_id} v{self.id}"
+
 class ResultadoTest(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
     test = models.ForeignKey(TestPsicologico, on_delete=models.CASCADE)
     puntuacion_total = models.IntegerField()
     categoria_recomendada = models.ForeignKey(CategoriaRecurso, on_delete=models.CASCADE)
     completado_en = models.DateTimeField(auto_now_add=True)
+    # Respuesta de cada pregunta: un byte con la posición de la opción elegida
+    # entre las de su pregunta, en el orden de ``version``. Vacío en los
+    # resultados anteriores a que se guardaran las respuestas.
+    version = models.ForeignKey(VersionTest, on_delete=models.CASCADE, null=True, blank=True)
+    respuestas = models.BinaryField(default=b'', blank=True)
+    # Ya se sumó a ResumenResultadosTest (los anteriores a los resúmenes los
+    # suma "manage.py resumir_resultados")
+    resumido = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            # Resultados que falta sumar; queda casi vacío después del backfill
+            models.Index(fields=['id'], condition=Q(resumido=False), name='miapp_resultado_pendiente_idx'),
+        ]
     
     def __str__(self):
         return f"Resultado de {self.usuario.username} - {self.test.nombre}"
 
+    @property
+    def indices_respuestas(self):
+        """Posición de la opción elegida en cada pregunta, sin consultar la base de datos."""
+        # Según el motor llega como bytes o memoryview
+        return tuple(bytes(self.respuestas))
+
+    @property
+    def opciones_elegidas(self):
+        """[(pregunta_id, opcion_id), ...]; usa ``version`` (conviene select_related)."""
+        if self.version_id is None:
+            return []
+        return [
+            (pregunta_id, opciones[indice])
+            for pregunta_id, opciones, indice in zip(
+                self.version.preguntas, self.version.opciones, self.indices_respuestas
+            )
+        ]
+
+class ResumenResultadosTest(models.Model):
+    """Cantidad de resultados de un test por día, categoría recomendada y puntuación.
+
+    Lo mantiene miapp.analitica a medida que se guardan los resultados; las
+    tendencias y distribuciones se calculan sobre esta tabla y no sobre
+    ``ResultadoTest``.
+    """
+    test = models.ForeignKey(TestPsicologico, on_delete=models.CASCADE, related_name='resumenes')
+    dia = models.DateField()
+    categoria = models.ForeignKey(CategoriaRecurso, on_delete=models.CASCADE)
+    puntuacion = models.IntegerField()
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # También sirve para leer un test en un rango de días
+            models.UniqueConstraint(
+                fields=['test', 'dia', 'categoria', 'puntuacion'], name='miapp_resumen_resultados_unico'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.test_id} {self.dia}: {self.total}"
+
 # Formulario de contacto
 class FormularioContacto(models.Model):
     TIPO_CONSULTA_CHOICES = [
@@ -135,6 +288,18 @@ class FormularioContacto(models.Model):
     respuesta = models.TextField(blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Bandeja de consultas: pendientes primero, las más nuevas arriba
+            models.Index(fields=['respondido', '-creado_en', '-id'], name='miapp_consulta_bandeja_idx'),
+            # Sólo las pendientes, que son pocas: conteos y primera página de la bandeja
+            models.Index(
+                fields=['-creado_en', '-id'],
+                condition=Q(respondido=False),
+                name='miapp_consulta_pendientes_idx',
+            ),
+        ]
+    
     def __str__(self):
         return f"{self.asunto} - {self.usuario.username}"
     
@@ -172,6 +337,14 @@ class HiloForo(models.Model):
     votos_positivos = models.IntegerField(default=0)
     votos_negativos = models.IntegerField(default=0)
     visitas = models.IntegerField(default=0)
+    # Contadores desnormalizados, mantenidos por las señales de RespuestaForo
+    num_respuestas = models.PositiveIntegerField(default=0)
+    ultima_respuesta_en = models.DateTimeField(blank=True, null=True)
+    ultima_respuesta_por = models.ForeignKey(
+        User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+'
+    )
+    # Popularidad con decaimiento por antigüedad, ver miapp/popularidad.py
+    puntuacion = models.FloatField(default=0, editable=False)
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
     
@@ -179,12 +352,21 @@ class HiloForo(models.Model):
         ordering = ['-actualizado_en']
         verbose_name = 'Hilo del Foro'
         verbose_name_plural = 'Hilos del Foro'
+        # Un índice por cada forma de consulta del listado del foro (con y
+        # sin filtro de categoría) y uno parcial para contar los abiertos
+        indexes = [
+            models.Index(fields=['-creado_en', '-id'], name='miapp_hilo_creado_idx'),
+            models.Index(fields=['categoria', '-creado_en', '-id'], name='miapp_hilo_cat_creado_idx'),
+            models.Index(fields=['-puntuacion', '-id'], name='miapp_hilo_puntuacion_idx'),
+            models.Index(fields=['categoria', '-puntuacion', '-id'], name='miapp_hilo_cat_puntuacion_idx'),
+            models.Index(fields=['id'], condition=Q(estado='abierto'), name='miapp_hilo_abiertos_idx'),
+        ]
     
     def __str__(self):
         return self.titulo
     
     def total_respuestas(self):
-        return self.respuestas.count()
+        return self.num_respuestas
     
     def ultima_respuesta(self):
         return self.respuestas.order_by('-creado_en').first()
@@ -204,9 +386,56 @@ class RespuestaForo(models.Model):
         ordering = ['creado_en']
         verbose_name = 'Respuesta del Foro'
         verbose_name_plural = 'Respuestas del Foro'
+        indexes = [
+            models.Index(fields=['hilo', 'creado_en', 'id'], name='miapp_resp_hilo_creado_idx'),
+            models.Index(
+                fields=['hilo', 'creado_en', 'id'],
+                condition=Q(es_respuesta_oficial=True),
+                name='miapp_resp_oficiales_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Respuesta a: {self.hilo.titulo}"
+    
+    def save(self, *args, **kwargs):
+        # Los contadores del hilo se actualizan en post_save; así quedan en
+        # la misma transacción que la respuesta
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+# Señales para mantener los contadores de respuestas del hilo
+@receiver(post_save, sender=RespuestaForo)
+def sumar_respuesta_al_hilo(sender, instance, created, **kwargs):
+    if not created:
+        return
+    # Sólo se mueve el puntero si esta respuesta es la más reciente
+    es_mas_reciente = Q(ultima_respuesta_en__isnull=True) | Q(ultima_respuesta_en__lte=instance.creado_en)
+    HiloForo.objects.filter(pk=instance.hilo_id).update(
+        num_respuestas=F('num_respuestas') + 1,
+        ultima_respuesta_en=Case(
+            When(es_mas_reciente, then=Value(instance.creado_en)),
+            default=F('ultima_respuesta_en'),
+        ),
+        ultima_respuesta_por=Case(
+            When(es_mas_reciente, then=Value(instance.creado_por_id)),
+            default=F('ultima_respuesta_por'),
+            output_field=models.IntegerField(),
+        ),
+    )
+
+@receiver(post_delete, sender=RespuestaForo)
+def restar_respuesta_del_hilo(sender, instance, origin=None, **kwargs):
+    # Si se está borrando el hilo completo, sus respuestas caen en cascada
+    # y no tiene sentido actualizar un hilo que va a desaparecer
+    if isinstance(origin, HiloForo) or getattr(origin, 'model', None) is HiloForo:
+        return
+    ultima = RespuestaForo.objects.filter(hilo=OuterRef('pk')).order_by('-creado_en', '-id')
+    HiloForo.objects.filter(pk=instance.hilo_id).update(
+        num_respuestas=F('num_respuestas') - 1,
+        ultima_respuesta_en=Subquery(ultima.values('creado_en')[:1]),
+        ultima_respuesta_por=Subquery(ultima.values('creado_por')[:1]),
+    )
 
 class VotoHilo(models.Model):
     TIPO_VOTO_CHOICES = [
@@ -0,0 +1,41 @@
+"""Operaciones de migración propias de miapp."""
+from django.db import NotSupportedError
+from django.db.migrations import AddIndex
+
+
+class AgregarIndiceConcurrente(AddIndex):
+    """
+    Crea un índice con CREATE INDEX CONCURRENTLY en PostgreSQL, sin bloquear
+    las escrituras de la tabla mientras se construye.
+
+    Equivale a ``AddIndexConcurrently`` de ``django.contrib.postgres``, pero en
+    otros motores (el SQLite de desarrollo) crea el índice de la forma normal y
+    no obliga a tener instalado psycopg. La migración debe usar ``atomic = False``.
+    """
+
+    def describe(self):
+        return f'Concurrently create index {self.index.name} on field(s) ' \
+               f'{", ".join(self.index.fields)} of model {self.model_name}'
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        self._sin_transaccion(schema_editor)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        self._sin_transaccion(schema_editor)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+    def _sin_transaccion(self, schema_editor):
+        if schema_editor.connection.in_atomic_block:
+            raise NotSupportedError(
+                'Los índices concurrentes no se pueden crear dentro de una transacción. '
+                'Define atomic = False en la migración.'
+            )
@@ -0,0 +1,125 @@
+"""Paginación por cursor (keyset) para listados que pueden crecer sin límite.
+
+En lugar de OFFSET, cada página se pide "a partir de" los valores de orden del
+último elemento de la página anterior. Así el coste de cada página es el mismo
+sin importar cuán profundo se navegue.
+"""
+import datetime
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class PaginaCursor:
+    """Resultado de una página: los objetos y el cursor para la siguiente."""
+
+    def __init__(self, objetos, siguiente_cursor=None):
+        self.objetos = objetos
+        self.siguiente_cursor = siguiente_cursor
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    @property
+    def tiene_siguiente(self):
+        return self.siguiente_cursor is not None
+
+
+class PaginadorCursor:
+    """
+    Pagina un queryset por cursor opaco.
+
+    ``orden`` es la lista de campos de ordenamiento (con ``-`` para descendente)
+    y debe terminar en un campo único, normalmente ``id``, para que el orden sea
+    estable cuando hay empates. El cursor va firmado, por lo que el cliente no
+    puede manipularlo.
+    """
+
+    salt = 'miapp.paginacion.cursor'
+
+    def __init__(self, queryset, orden, por_pagina=20):
+        self.queryset = queryset
+        self.orden = list(orden)
+        self.por_pagina = por_pagina
+
+    def pagina(self, cursor=None):
+        queryset = self.queryset.order_by(*self.orden)
+
+        valores = self._decodificar(cursor)
+        if valores is not None:
+            queryset = queryset.filter(self._filtro_despues(valores))
+
+        # Se pide un elemento extra sólo para saber si hay otra página
+        objetos = list(queryset[:self.por_pagina + 1])
+        siguiente = None
+        if len(objetos) > self.por_pagina:
+            objetos = objetos[:self.por_pagina]
+            siguiente = self.cursor_despues(objetos[-1])
+
+        return PaginaCursor(objetos, siguiente)
+
+    def _filtro_despues(self, valores):
+        # (a, b, id) > (va, vb, vid) expandido a:
+        # a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND id > vid)
+        condicion = Q()
+        iguales = {}
+        for campo, valor in zip(self.orden, valores):
+            nombre = campo.lstrip('-')
+            lookup = 'lt' if campo.startswith('-') else 'gt'
+            condicion |= Q(**iguales, **{f'{nombre}__{lookup}': valor})
+            iguales[nombre] = valor
+        return condicion
+
+    def cursor_despues(self, objeto):
+        """Cursor de la página que empieza justo después de ``objeto``."""
+        valores = []
+        for campo in self.orden:
+            valor = getattr(objeto, campo.lstrip('-'))
+            if isinstance(valor, (datetime.date, datetime.datetime)):
+                valor = valor.isoformat()
+            valores.append(valor)
+        return signing.dumps({'o': self.orden, 'v': valores}, salt=self.salt, compress=True)
+
+    def _decodificar(self, cursor):
+        if not cursor:
+            return None
+        try:
+            datos = signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            return None
+
+        # Un cursor de otro ordenamiento no sirve: se vuelve a la primera página
+        if datos.get('o') != self.orden or len(datos.get('v', [])) != len(self.orden):
+            return None
+
+        modelo = self.queryset.model
+        try:
+            return [
+                modelo._meta.get_field(campo.lstrip('-')).to_python(valor)
+                for campo, valor in zip(self.orden, datos['v'])
+            ]
+        except ValidationError:
+            return None
+
+
+def lotes_de_ids(queryset, tamano=1000):
+    """
+    Recorre los ids de ``queryset`` en lotes ordenados, también por keyset.
+
+    Útil para procesos de mantenimiento que deben actualizar tablas enteras
+    sin mantener una sola transacción larga.
+    """
+    ultimo_id = None
+    while True:
+        lote = queryset.order_by('pk')
+        if ultimo_id is not None:
+            lote = lote.filter(pk__gt=ultimo_id)
+        ids = list(lote.values_list('pk', flat=True)[:tamano])
+        if not ids:
+            return
+        yield ids
+        ultimo_id = ids[-1]
@@ -0,0 +1,103 @@
+"""Puntuación de popularidad ("hot") de los hilos del foro.
+
+La popularidad de un hilo es su cantidad de interacciones (votos netos,
+respuestas y visitas) con un decaimiento exponencial según su antigüedad: cada
+``FORO_POPULARIDAD_VIDA_MEDIA`` segundos vale la mitad. Se guarda en escala
+logarítmica, donde ese decaimiento se convierte en un término que sólo depende
+de la fecha de creación:
+
+    log10(1 + interacciones) + (creado_en - EPOCA) / vida_media * log10(2)
+
+El "ahora" que haría falta restar es el mismo para todos los hilos, así que el
+orden no cambia con el paso del tiempo y la columna sólo se recalcula cuando
+cambian los datos del hilo. El comando ``recalcular_popularidad`` la recalcula
+completa (por ejemplo, si se cambia la fórmula o la vida media).
+"""
+import datetime
+import math
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Greatest, Log
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import HiloForo, RespuestaForo
+
+# Fecha fija de referencia para el término de tiempo
+EPOCA = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Cuánto pesa cada tipo de interacción
+PESO_RESPUESTA = 2
+VISITAS_POR_PUNTO = 20
+
+CAMPOS = ('votos_positivos', 'votos_negativos', 'num_respuestas', 'visitas', 'creado_en')
+
+
+def _vida_media():
+    return getattr(settings, 'FORO_POPULARIDAD_VIDA_MEDIA', 48 * 3600)
+
+
+def _termino_tiempo(creado_en):
+    return (creado_en - EPOCA).total_seconds() / _vida_media() * math.log10(2)
+
+
+def calcular_puntuacion(votos_positivos, votos_negativos, num_respuestas, visitas, creado_en):
+    interacciones = max(
+        votos_positivos - votos_negativos
+        + PESO_RESPUESTA * num_respuestas
+        + visitas / VISITAS_POR_PUNTO,
+        0,
+    )
+    return math.log10(1 + interacciones) + _termino_tiempo(creado_en)
+
+
+def actualizar_popularidad(hilo_ids):
+    """Recalcula la puntuación de los hilos indicados con una lectura y un UPDATE.
+
+    Los contadores se leen dentro del mismo UPDATE (con F()), así que un voto o
+    una visita concurrente no puede quedar fuera de la puntuación guardada. Sólo
+    se lee antes ``creado_en``, que no cambia.
+    """
+    creaciones = dict(HiloForo.objects.filter(pk__in=list(hilo_ids)).values_list('pk', 'creado_en'))
+    if not creaciones:
+        return 0
+
+    interacciones = Greatest(
+        F('votos_positivos') - F('votos_negativos')
+        + Value(PESO_RESPUESTA) * F('num_respuestas')
+        + F('visitas') * Value(1 / VISITAS_POR_PUNTO),
+        Value(0.0),
+        output_field=FloatField(),
+    )
+    termino_tiempo = Case(
+        *[When(pk=pk, then=Value(_termino_tiempo(creado_en))) for pk, creado_en in creaciones.items()],
+        output_field=FloatField(),
+    )
+    # update() no toca actualizado_en
+    return HiloForo.objects.filter(pk__in=list(creaciones)).update(
+        puntuacion=Log(Value(10.0), Value(1.0) + interacciones) + termino_tiempo
+    )
+
+
+# ==================== SEÑALES ====================
+# Los votos y las visitas llaman a actualizar_popularidad() directamente
+# porque se escriben con update(), que no envía señales
+
+@receiver(post_save, sender=HiloForo)
+def puntuar_hilo_nuevo(sender, instance, created, **kwargs):
+    if created:
+        actualizar_popularidad([instance.pk])
+
+
+@receiver(post_save, sender=RespuestaForo)
+def puntuar_hilo_con_respuesta(sender, instance, created, **kwargs):
+    if created:
+        actualizar_popularidad([instance.hilo_id])
+
+
+@receiver(post_delete, sender=RespuestaForo)
+def puntuar_hilo_sin_respuesta(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, HiloForo) or getattr(origin, 'model', None) is HiloForo:
+        return
+    actualizar_popularidad([instance.hilo_id])
@@ -1,3 +1,1592 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import html
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.db.models import F
+from django.http import QueryDict
+from django.shortcuts import get_object_or_404
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import popularidad
+from .busqueda import RESULTADOS_POR_PAGINA, buscar, resaltar
+from .catalogo import facetas, invalidar_catalogo, pagina_catalogo
+from .derivados import Image, procesar_recurso
+from .estadisticas import estadisticas_foro
+from .eventos import canal_hilo, obtener_backend
+from .evaluacion import distribucion_respuestas, obtener_test, registrar_resultado
+from .fragmentos import renderizar_respuestas
+from .instrumentacion import PresupuestoConsultasMixin
+from .metricas import metricas_dashboard
+from .models import (
+    CategoriaForo, CategoriaRecurso, FormularioContacto, HiloForo, OpcionRespuesta, PreguntaTest, Recurso,
+    RespuestaForo, ResultadoTest, ResumenResultadosTest, TestPsicologico, UserProfile, VotoHilo,
+    VotoRespuesta,
+)
+from .paginacion import PaginadorCursor
+from .popularidad import CAMPOS, calcular_puntuacion
+from .views import HILOS_POR_PAGINA, ORDENES_FORO
+from .visitas import AgregadorVisitas
+from .votos import votar
+
+
+class IndicesForoTests(TestCase):
+    """Las consultas frecuentes del foro deben resolverse con un índice."""
+
+    @classmethod
+    def setUpTestData(cls):
+        autor = User.objects.create_user('autor', password='clave-de-prueba')
+        cls.categoria = CategoriaForo.objects.create(nombre='General')
+        cls.hilo = HiloForo.objects.create(
+            titulo='Hilo', contenido='Contenido', categoria=cls.categoria, creado_por=autor
+        )
+        RespuestaForo.objects.create(hilo=cls.hilo, contenido='Respuesta', creado_por=autor)
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Con tablas tan pequeñas el planificador prefiere leerlas completas
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsaIndice(self, queryset, indice):
+        plan = queryset.explain()
+        self.assertIn(indice, plan)
+        # El orden tiene que salir del índice, no de un sort en memoria
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('Sort Key', plan)
+
+    def test_listado_por_cada_orden(self):
+        indices = {
+            'recientes': 'miapp_hilo_creado_idx',
+            'antiguos': 'miapp_hilo_creado_idx',
+            'populares': 'miapp_hilo_puntuacion_idx',
+        }
+        for orden, indice in indices.items():
+            with self.subTest(orden=orden):
+                hilos = HiloForo.objects.order_by(*ORDENES_FORO[orden])[:HILOS_POR_PAGINA + 1]
+                self.assertUsaIndice(hilos, indice)
+
+    def test_listado_filtrado_por_categoria(self):
+        indices = {
+            'recientes': 'miapp_hilo_cat_creado_idx',
+            'antiguos': 'miapp_hilo_cat_creado_idx',
+            'populares': 'miapp_hilo_cat_puntuacion_idx',
+        }
+        for orden, indice in indices.items():
+            with self.subTest(orden=orden):
+                hilos = (
+                    HiloForo.objects.filter(categoria_id=self.categoria.id)
+                    .order_by(*ORDENES_FORO[orden])[:HILOS_POR_PAGINA + 1]
+                )
+                self.assertUsaIndice(hilos, indice)
+
+    def test_conteo_de_hilos_abiertos(self):
+        abiertos = HiloForo.objects.filter(estado='abierto').order_by().values('id')
+        self.assertUsaIndice(abiertos, 'miapp_hilo_abiertos_idx')
+
+    def test_respuestas_de_un_hilo(self):
+        respuestas = RespuestaForo.objects.filter(hilo_id=self.hilo.id).order_by('creado_en', 'id')
+        self.assertUsaIndice(respuestas, 'miapp_resp_hilo_creado_idx')
+
+
+class ContadoresHiloTests(TestCase):
+    """Los campos desnormalizados del hilo siguen a sus respuestas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='clave-de-prueba')
+        cls.otro = User.objects.create_user('otro', password='clave-de-prueba')
+        cls.categoria = CategoriaForo.objects.create(nombre='General')
+
+    def setUp(self):
+        self.hilo = HiloForo.objects.create(
+            titulo='Hilo', contenido='Contenido', categoria=self.categoria, creado_por=self.autor
+        )
+
+    def test_respuestas_creadas_y_borradas(self):
+        primera = RespuestaForo.objects.create(hilo=self.hilo, contenido='Primera', creado_por=self.autor)
+        segunda = RespuestaForo.objects.create(hilo=self.hilo, contenido='Segunda', creado_por=self.otro)
+        self.hilo.refresh_from_db()
+        self.assertEqual(self.hilo.num_respuestas, 2)
+        self.assertEqual(self.hilo.ultima_respuesta_en, segunda.creado_en)
+        self.assertEqual(self.hilo.ultima_respuesta_por, self.otro)
+
+        segunda.delete()
+        self.hilo.refresh_from_db()
+        self.assertEqual(self.hilo.num_respuestas, 1)
+        self.assertEqual(self.hilo.ultima_respuesta_en, primera.creado_en)
+        self.assertEqual(self.hilo.ultima_respuesta_por, self.autor)
+
+        primera.delete()
+        self.hilo.refresh_from_db()
+        self.assertEqual(self.hilo.num_respuestas, 0)
+        self.assertIsNone(self.hilo.ultima_respuesta_en)
+        self.assertIsNone(self.hilo.ultima_respuesta_por)
+
+    def test_editar_no_pisa_los_contadores(self):
+        self.client.force_login(self.autor)
+
+        def cargar_y_recibir_actividad(*args, **kwargs):
+            hilo = get_object_or_404(*args, **kwargs)
+            # Respuestas, visitas y votos que llegan después de leer el hilo
+            RespuestaForo.objects.create(hilo=self.hilo, contenido='Respuesta', creado_por=self.otro)
+            HiloForo.objects.filter(id=self.hilo.id).update(visitas=7, votos_positivos=3)
+            return hilo
+
+        with mock.patch('miapp.views.get_object_or_404', cargar_y_recibir_actividad):
+            respuesta = self.client.post(reverse('miapp:editar_hilo', args=[self.hilo.id]), {
+                'titulo': 'Editado', 'contenido': 'Nuevo', 'categoria': self.categoria.id,
+            })
+        self.assertEqual(respuesta.status_code, 302)
+        self.hilo.refresh_from_db()
+        self.assertEqual(self.hilo.titulo, 'Editado')
+        self.assertEqual(self.hilo.num_respuestas, 1)
+        self.assertEqual((self.hilo.visitas, self.hilo.votos_positivos), (7, 3))
+
+
+class EstadisticasForoTests(TestCase):
+    """Los contadores en caché siguen a las altas, cambios y bajas sin recalcularse."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='clave-de-prueba')
+        cls.categoria = CategoriaForo.objects.create(nombre='General')
+        HiloForo.objects.create(titulo='Previo', contenido='Contenido', categoria=cls.categoria, creado_por=cls.autor)
+
+    def setUp(self):
+        cache.clear()
+
+    def leer(self):
+        # Con el caché caliente la lectura no consulta la base
+        with self.assertNumQueries(0):
+            return estadisticas_foro()
+
+    def test_lectura_en_cache(self):
+        with self.assertNumQueries(3):
+            self.assertEqual(
+                estadisticas_foro(), {'total_hilos': 1, 'total_respuestas': 0, 'hilos_abiertos': 1}
+            )
+        self.assertEqual(self.leer()['total_hilos'], 1)
+
+    def test_altas_cambios_y_bajas(self):
+        estadisticas_foro()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            hilo = HiloForo.objects.create(
+                titulo='Nuevo', contenido='Contenido', categoria=self.categoria, creado_por=self.autor
+            )
+            RespuestaForo.objects.create(hilo=hilo, contenido='Respuesta', creado_por=self.autor)
+        self.assertEqual(self.leer(), {'total_hilos': 2, 'total_respuestas': 1, 'hilos_abiertos': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            hilo.estado = 'cerrado'
+            hilo.save()
+        self.assertEqual(self.leer()['hilos_abiertos'], 1)
+
+        # Borrar el hilo también borra (y descuenta) sus respuestas
+        with self.captureOnCommitCallbacks(execute=True):
+            hilo.delete()
+        self.assertEqual(self.leer(), {'total_hilos': 1, 'total_respuestas': 0, 'hilos_abiertos': 1})
+
+    def test_sin_confirmar_no_cambia(self):
+        estadisticas_foro()
+        with self.captureOnCommitCallbacks(execute=False):
+            HiloForo.objects.create(
+                titulo='Nuevo', contenido='Contenido', categoria=self.categoria, creado_por=self.autor
+            )
+        self.assertEqual(self.leer()['total_hilos'], 1)
+
+
+class VotosTests(TestCase):
+    """Votar, cambiar y retirar un voto ajusta los contadores y la popularidad."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='clave-de-prueba')
+        cls.votante = User.objects.create_user('votante', password='clave-de-prueba')
+        cls.categoria = CategoriaForo.objects.create(nombre='General')
+
+    def setUp(self):
+        self.hilo = HiloForo.objects.create(
+            titulo='Hilo', contenido='Contenido', categoria=self.categoria, creado_por=self.autor
+        )
+        self.respuesta = RespuestaForo.objects.create(hilo=self.hilo, contenido='Respuesta', creado_por=self.autor)
+
+    def estado_hilo(self):
+        hilo = HiloForo.objects.get(id=self.hilo.id)
+        voto = VotoHilo.objects.filter(hilo=hilo, usuario=self.votante).values_list('tipo_voto', flat=True).first()
+        return (hilo.votos_positivos, hilo.votos_negativos, voto), hilo.puntuacion
+
+    def puntuacion_esperada(self):
+        hilo = HiloForo.objects.values_list(*CAMPOS).get(id=self.hilo.id)
+        return calcular_puntuacion(*hilo)
+
+    def test_votos_de_un_hilo(self):
+        pasos = [
+            ('positivo', (1, 0, 'positivo')),
+            ('positivo', (1, 0, 'positivo')),  # repetir el voto no cambia nada
+            ('negativo', (0, 1, 'negativo')),
+            ('positivo', (1, 0, 'positivo')),
+            (None, (0, 0, None)),
+            (None, (0, 0, None)),  # retirar un voto que no existe tampoco
+        ]
+        for voto, esperado in pasos:
+            with self.subTest(voto=voto):
+                resultado = votar('hilo', self.hilo.id, self.votante, voto)
+                self.assertEqual(resultado, {'votos_positivos': esperado[0], 'votos_negativos': esperado[1], 'voto': voto})
+                votos, puntuacion = self.estado_hilo()
+                self.assertEqual(votos, esperado)
+                self.assertAlmostEqual(puntuacion, self.puntuacion_esperada())
+
+    def test_el_voto_cambia_la_puntuacion(self):
+        _, inicial = self.estado_hilo()
+        votar('hilo', self.hilo.id, self.votante, 'positivo')
+        _, positivo = self.estado_hilo()
+        votar('hilo', self.hilo.id, self.votante, 'negativo')
+        _, negativo = self.estado_hilo()
+        votar('hilo', self.hilo.id, self.votante, None)
+        _, retirado = self.estado_hilo()
+        self.assertGreater(positivo, inicial)
+        self.assertLess(negativo, positivo)
+        self.assertAlmostEqual(retirado, inicial)
+
+    def test_votos_de_una_respuesta(self):
+        pasos = [
+            ('negativo', (0, 1, 'negativo')),
+            ('positivo', (1, 0, 'positivo')),
+            (None, (0, 0, None)),
+        ]
+        for voto, esperado in pasos:
+            with self.subTest(voto=voto):
+                votar('respuesta', self.respuesta.id, self.votante, voto)
+                respuesta = RespuestaForo.objects.get(id=self.respuesta.id)
+                registrado = (
+                    VotoRespuesta.objects.filter(respuesta=respuesta, usuario=self.votante)
+                    .values_list('tipo_voto', flat=True).first()
+                )
+                self.assertEqual((respuesta.votos_positivos, respuesta.votos_negativos, registrado), esperado)
+        # Los votos de las respuestas no tocan los del hilo
+        self.assertEqual(self.estado_hilo()[0], (0, 0, None))
+
+    def test_voto_invalido_u_objeto_inexistente(self):
+        with self.assertRaises(ValueError):
+            votar('hilo', self.hilo.id, self.votante, 'neutro')
+        with self.assertRaises(HiloForo.DoesNotExist):
+            votar('hilo', self.hilo.id + 1000, self.votante, 'positivo')
+        self.assertFalse(VotoHilo.objects.exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Prueba las tablas FTS5 de SQLite')
+class BusquedaForoTests(TestCase):
+    """Búsqueda FTS5: coincidencias, orden por relevancia, resaltado y páginas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='clave-de-prueba')
+        cls.categoria = CategoriaForo.objects.create(nombre='General')
+
+    def crear_hilo(self, titulo, contenido):
+        return HiloForo.objects.create(titulo=titulo, contenido=contenido, categoria=self.categoria, creado_por=self.autor)
+
+    def test_coincidencias_por_prefijo(self):
+        hilo = self.crear_hilo('Manejo de la ansiedad', 'Ejercicios de respiración')
+        self.crear_hilo('Dormir mejor', 'Rutinas para el insomnio')
+        respuesta = RespuestaForo.objects.create(hilo=hilo, contenido='Las ansiedades se calman', creado_por=self.autor)
+
+        self.assertEqual([h.id for h in buscar('ansied')], [hilo.id])
+        self.assertEqual([r.id for r in buscar('ansiedades', en='respuestas')], [respuesta.id])
+        self.assertEqual(len(buscar('tristeza')), 0)
+        # Los operadores de FTS5 en la entrada no se interpretan
+        self.assertEqual([h.id for h in buscar('ansiedad OR "dormir')], [])
+        self.assertEqual(len(buscar('   ')), 0)
+
+    def test_indice_al_editar_y_borrar(self):
+        hilo = self.crear_hilo('Hilo', 'Sobre la ansiedad')
+        hilo.contenido = 'Sobre el insomnio'
+        hilo.save()
+        self.assertEqual(len(buscar('ansiedad')), 0)
+        self.assertEqual([h.id for h in buscar('insomnio')], [hilo.id])
+        hilo.delete()
+        self.assertEqual(len(buscar('insomnio')), 0)
+
+    def test_el_titulo_pesa_mas_que_el_contenido(self):
+        en_contenido = self.crear_hilo('Consulta', 'Tengo mucha ansiedad antes de los exámenes')
+        en_titulo = self.crear_hilo('Ansiedad antes de los exámenes', 'Consulta')
+        resultados = list(buscar('ansiedad'))
+        self.assertEqual([h.id for h in resultados], [en_titulo.id, en_contenido.id])
+        self.assertGreater(resultados[0].rango, resultados[1].rango)
+
+    def test_resaltado_escapa_el_texto_del_usuario(self):
+        self.crear_hilo('Ansiedad <script>alert(1)</script>', 'Texto con [[[marcas]]] y \x02 ansiedad \x03 sueltas')
+        hilo = buscar('ansiedad').objetos[0]
+        self.assertEqual(hilo.titulo_resaltado, '<mark>Ansiedad</mark> &lt;script&gt;alert(1)&lt;/script&gt;')
+        self.assertIn('[[[marcas]]]', hilo.fragmento)
+        self.assertEqual(hilo.fragmento.count('<mark>'), hilo.fragmento.count('</mark>'))
+        self.assertNotIn('<script>', hilo.fragmento)
+
+    def test_marcas_desbalanceadas(self):
+        self.assertEqual(resaltar('\x03a\x02b\x02c\x03d\x02e'), 'a<mark>bc</mark>d<mark>e</mark>')
+
+    def test_paginacion(self):
+        total = RESULTADOS_POR_PAGINA + 5
+        for i in range(total):
+            self.crear_hilo(f'Hilo {i}', 'Ansiedad')
+
+        primera = buscar('ansiedad')
+        segunda = buscar('ansiedad', pagina=2)
+        self.assertEqual((len(primera), primera.tiene_anterior, primera.tiene_siguiente), (RESULTADOS_POR_PAGINA, False, True))
+        self.assertEqual((len(segunda), segunda.tiene_anterior, segunda.tiene_siguiente), (5, True, False))
+        ids = [h.id for h in primera] + [h.id for h in segunda]
+        self.assertEqual(len(set(ids)), total)
+        self.assertEqual(len(buscar('ansiedad', pagina=3)), 0)
+
+
+class EventosHiloTests(TestCase):
+    """Los eventos en vivo sólo existen con FORO_EVENTOS_EN_VIVO (ASGI)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('usuario', password='clave-de-prueba')
+        categoria = CategoriaForo.objects.create(nombre='General')
+        cls.hilo = HiloForo.objects.create(titulo='Hilo', contenido='Contenido', categoria=categoria, creado_por=cls.usuario)
+
+    def test_sin_eventos_en_vivo_la_pagina_consulta(self):
+        self.client.force_login(self.usuario)
+        with self.settings(FORO_EVENTOS_EN_VIVO=False):
+            pagina = self.client.get(reverse('miapp:detalle_hilo', args=[self.hilo.id]))
+            eventos = self.client.get(reverse('miapp:eventos_hilo', args=[self.hilo.id]))
+        self.assertNotContains(pagina, 'EventSource')
+        self.assertContains(pagina, 'setInterval')
+        self.assertEqual(eventos.status_code, 404)
+
+    @override_settings(FORO_EVENTOS_EN_VIVO=True, FORO_EVENTOS_BACKEND='miapp.eventos.BackendMemoria')
+    async def test_publicar_recibir_y_desconectar(self):
+        obtener_backend.cache_clear()
+        self.addCleanup(obtener_backend.cache_clear)
+        backend = obtener_backend()
+        canal = canal_hilo(self.hilo.id)
+
+        await self.async_client.aforce_login(self.usuario)
+        respuesta = await self.async_client.get(reverse('miapp:eventos_hilo', args=[self.hilo.id]))
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+        flujo = aiter(respuesta.streaming_content)
+        self.assertEqual(await anext(flujo), b'retry: 5000\n\n')  # ya está suscrito
+
+        backend.publicar(canal, {'tipo': 'respuesta', 'id': 7})
+        evento = await asyncio.wait_for(anext(flujo), 5)
+        self.assertEqual(evento, b'event: respuesta\ndata: {"tipo": "respuesta", "id": 7}\n\n')
+
+        # Cuando el cliente se desconecta, el servidor ASGI cancela la espera del
+        # próximo evento: el generador se cierra y se quita la suscripción
+        siguiente = asyncio.ensure_future(anext(flujo))
+        await asyncio.sleep(0)
+        siguiente.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await siguiente
+        self.assertNotIn(canal, backend._suscriptores)
+
+
+class ImportarUsuariosTests(TestCase):
+    """manage.py importar_usuarios crea y actualiza usuarios en bloque."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin1', email='admin@ejemplo.com', password='clave-de-prueba')
+        UserProfile.objects.filter(user=cls.admin).update(tipo_usuario='admin')
+        cls.pasante = User.objects.create_user('pasante1', password='clave-de-prueba')
+        UserProfile.objects.filter(user=cls.pasante).update(tipo_usuario='pasante')
+
+    def archivo(self, extension, contenido):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ruta = os.path.join(directorio.name, f'usuarios.{extension}')
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write(contenido)
+        return ruta
+
+    def importar(self, ruta, *opciones):
+        salida, errores = StringIO(), StringIO()
+        call_command('importar_usuarios', ruta, '--procesos', '1', *opciones, stdout=salida, stderr=errores)
+        return salida.getvalue(), errores.getvalue()
+
+    def roles(self):
+        return dict(UserProfile.objects.values_list('user__username', 'tipo_usuario'))
+
+    def test_csv_crea_y_actualiza(self):
+        ruta = self.archivo('csv', (
+            'username,password,email,first_name,tipo_usuario,is_active\n'
+            'nuevo1,secreta-1,nuevo1@ejemplo.com,Ana,pasante,si\n'
+            'nuevo2,,,Luis,,no\n'
+            'admin1,,admin@otro.com,,,\n'
+        ))
+        salida, errores = self.importar(ruta)
+        self.assertIn('2 usuarios creados, 1 actualizados', salida)
+        self.assertEqual(errores, '')
+
+        nuevo1 = User.objects.get(username='nuevo1')
+        self.assertTrue(nuevo1.check_password('secreta-1'))
+        self.assertEqual((nuevo1.email, nuevo1.first_name, nuevo1.is_active), ('nuevo1@ejemplo.com', 'Ana', True))
+        nuevo2 = User.objects.get(username='nuevo2')
+        self.assertFalse(nuevo2.has_usable_password())
+        self.assertFalse(nuevo2.is_active)
+        self.assertEqual(User.objects.get(username='admin1').email, 'admin@otro.com')
+        self.assertEqual(self.roles(), {'admin1': 'admin', 'pasante1': 'pasante', 'nuevo1': 'pasante', 'nuevo2': 'paciente'})
+
+    def test_jsonl_actualiza_roles_y_contrasenas(self):
+        ruta = self.archivo('jsonl', (
+            '{"username": "pasante1", "tipo_usuario": "admin", "password": "otra-clave"}\n'
+            '\n'
+            '{"username": "nuevo", "is_active": false}\n'
+        ))
+        salida, _ = self.importar(ruta)
+        self.assertIn('1 usuarios creados, 1 actualizados', salida)
+        self.assertTrue(User.objects.get(username='pasante1').check_password('otra-clave'))
+        self.assertFalse(User.objects.get(username='nuevo').is_active)
+        self.assertEqual(self.roles(), {'admin1': 'admin', 'pasante1': 'admin', 'nuevo': 'paciente'})
+
+    def test_sin_columna_tipo_usuario_conserva_los_roles(self):
+        ruta = self.archivo('csv', 'username,first_name\nadmin1,Ada\npasante1,Pablo\n')
+        self.importar(ruta)
+        self.assertEqual(self.roles(), {'admin1': 'admin', 'pasante1': 'pasante'})
+        self.assertEqual(User.objects.get(username='pasante1').first_name, 'Pablo')
+
+    def test_dry_run_no_escribe(self):
+        ruta = self.archivo('csv', 'username,tipo_usuario\nnuevo,paciente\nadmin1,pasante\n')
+        with CaptureQueriesContext(connection) as consultas:
+            salida, _ = self.importar(ruta, '--dry-run')
+        self.assertIn('Se crearían 1 usuarios y se actualizarían 1', salida)
+        escrituras = [q['sql'] for q in consultas.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(escrituras, [])
+        self.assertEqual(self.roles(), {'admin1': 'admin', 'pasante1': 'pasante'})
+
+    def test_filas_invalidas(self):
+        ruta = self.archivo('csv', (
+            'username,tipo_usuario,first_name\n'
+            ',paciente,Sin nombre\n'
+            'nuevo,director,Rol inválido\n'
+            'repetido,paciente,Primera\n'
+            'repetido,pasante,Segunda\n'
+        ))
+        salida, errores = self.importar(ruta)
+        self.assertIn('Fila 1: falta username', errores)
+        self.assertIn('Fila 2: tipo_usuario "director" inválido', errores)
+        self.assertIn('Fila 4: repetido está repetido', errores)
+        self.assertIn('1 usuarios creados', salida)
+        self.assertFalse(User.objects.filter(username='nuevo').exists())
+        self.assertEqual(User.objects.get(username='repetido').first_name, 'Segunda')
+        self.assertEqual(self.roles()['repetido'], 'pasante')
+
+    def test_lotes(self):
+        filas = ''.join(f'usuario{i},paciente\n' for i in range(5)) + 'admin1,pasante\n'
+        salida, _ = self.importar(self.archivo('csv', 'username,tipo_usuario\n' + filas), '--lote', '2')
+        self.assertIn('5 usuarios creados, 1 actualizados', salida)
+        self.assertEqual(UserProfile.objects.filter(tipo_usuario='paciente').count(), 5)
+        self.assertEqual(self.roles()['admin1'], 'pasante')
+
+    def test_archivo_invalido(self):
+        with self.assertRaisesMessage(CommandError, 'JSONL inválido'):
+            self.importar(self.archivo('jsonl', '{"username": \n'))
+        with self.assertRaisesMessage(CommandError, 'No se pudo deducir el formato'):
+            self.importar(self.archivo('txt', 'username\n'))
+
+
+class FragmentosRespuestaTests(TestCase):
+    """El HTML en caché de una respuesta cambia con los datos visibles de su autor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='clave-de-prueba', first_name='Ana')
+        categoria = CategoriaForo.objects.create(nombre='General')
+        hilo = HiloForo.objects.create(titulo='Hilo', contenido='Contenido', categoria=categoria, creado_por=cls.autor)
+        cls.respuesta = RespuestaForo.objects.create(hilo=hilo, contenido='Gracias', creado_por=cls.autor)
+
+    def setUp(self):
+        cache.clear()
+
+    def html(self):
+        respuesta = RespuestaForo.objects.select_related('creado_por', 'creado_por__userprofile').get()
+        # Una sola lectura del caché y ninguna consulta extra para la clave
+        with self.assertNumQueries(0):
+            renderizar_respuestas([respuesta])
+        return respuesta.html
+
+    def test_se_reutiliza_mientras_nada_cambia(self):
+        primero = self.html()
+        with mock.patch('miapp.fragmentos.render_to_string') as render:
+            self.assertEqual(self.html(), primero)
+        render.assert_not_called()
+
+    def test_cambio_de_nombre_del_autor(self):
+        self.assertIn('Ana', self.html())
+        self.autor.first_name = 'Lucía'
+        self.autor.save()
+        html = self.html()
+        self.assertIn('Lucía', html)
+        self.assertNotIn('Ana', html)
+
+    def test_cambio_de_rol_del_autor(self):
+        self.assertNotIn('Pasante', self.html())
+        self.autor.userprofile.tipo_usuario = 'pasante'
+        self.autor.userprofile.save()
+        self.assertIn('Pasante', self.html())
+
+
+class PaginacionCursorTests(TestCase):
+    """El cursor recorre todos los hilos sin repetir ni saltear, aun con empates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='clave-de-prueba')
+        cls.categoria = CategoriaForo.objects.create(nombre='General')
+        cls.otra = CategoriaForo.objects.create(nombre='Otra')
+        for i in range(30):
+            HiloForo.objects.create(
+                titulo=f'Hilo {i}', contenido='Contenido', creado_por=cls.autor,
+                categoria=cls.otra if i % 5 == 0 else cls.categoria,
+            )
+        # Grupos de hilos con la misma fecha y la misma puntuación
+        momento = timezone.now() - timedelta(days=1)
+        for i, hilo in enumerate(HiloForo.objects.order_by('id')):
+            HiloForo.objects.filter(id=hilo.id).update(
+                creado_en=momento + timedelta(minutes=i // 6), puntuacion=float(i % 3),
+            )
+
+    def recorrer(self, orden, por_pagina):
+        paginador = PaginadorCursor(HiloForo.objects.all(), ORDENES_FORO[orden], por_pagina=por_pagina)
+        ids, cursor = [], None
+        while True:
+            pagina = paginador.pagina(cursor)
+            self.assertLessEqual(len(pagina), por_pagina)
+            ids.extend(hilo.id for hilo in pagina)
+            if not pagina.tiene_siguiente:
+                return ids
+            cursor = pagina.siguiente_cursor
+
+    def test_recorre_todo_sin_duplicados_ni_huecos(self):
+        for orden, campos in ORDENES_FORO.items():
+            esperado = list(HiloForo.objects.order_by(*campos).values_list('id', flat=True))
+            for por_pagina in (1, 4, 6, 30, 40):
+                with self.subTest(orden=orden, por_pagina=por_pagina):
+                    self.assertEqual(self.recorrer(orden, por_pagina), esperado)
+
+    def test_cursor_invalido_vuelve_a_la_primera_pagina(self):
+        recientes = PaginadorCursor(HiloForo.objects.all(), ORDENES_FORO['recientes'], por_pagina=5)
+        populares = PaginadorCursor(HiloForo.objects.all(), ORDENES_FORO['populares'], por_pagina=5)
+        primera = [hilo.id for hilo in recientes.pagina()]
+        cursor = recientes.pagina().siguiente_cursor
+
+        for invalido in (cursor[:-2] + 'xx', cursor.replace(':', '.', 1), 'basura', populares.pagina().siguiente_cursor):
+            with self.subTest(cursor=invalido):
+                self.assertEqual([hilo.id for hilo in recientes.pagina(invalido)], primera)
+
+    def test_el_enlace_siguiente_conserva_la_categoria(self):
+        self.client.force_login(self.autor)
+        url = reverse('miapp:foro_comunitario')
+        en_categoria = list(
+            HiloForo.objects.filter(categoria=self.categoria).order_by(*ORDENES_FORO['antiguos'])
+            .values_list('id', flat=True)
+        )
+        self.assertGreater(len(en_categoria), HILOS_POR_PAGINA)
+
+        respuesta = self.client.get(url, {'categoria': self.categoria.id, 'orden': 'antiguos', 'aplicar_filtros': '1'})
+        ids = [hilo.id for hilo in respuesta.context['hilos']]
+        enlace = html.unescape(re.search(r'href="([^"]*)"[^>]*id="cargarMas"', respuesta.content.decode()).group(1))
+        parametros = QueryDict(enlace.lstrip('?'))
+        self.assertEqual(parametros['categoria'], str(self.categoria.id))
+        self.assertEqual(parametros['orden'], 'antiguos')
+
+        respuesta = self.client.get(url + enlace)
+        ids += [hilo.id for hilo in respuesta.context['hilos']]
+        self.assertFalse(respuesta.context['pagina'].tiene_siguiente)
+        self.assertEqual(ids, en_categoria)
+
+
+class GestionUsuariosTests(TestCase):
+    """Búsqueda, filtros y paginación del listado de usuarios del administrador."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = cls.crear('zadmin', 'admin')
+        cls.ana = cls.crear('Ana', 'paciente')
+        cls.andres = cls.crear('andres', 'pasante')
+        cls.anabel = cls.crear('ANABEL', 'paciente', is_active=False)
+        cls.beto = cls.crear('beto', 'paciente', email='Anabeto@ejemplo.com')
+        cls.carla = cls.crear('carla', 'pasante', is_active=False)
+
+    @classmethod
+    def crear(cls, username, tipo, **datos):
+        usuario = User.objects.create_user(username, password='clave-de-prueba', **datos)
+        UserProfile.objects.filter(user=usuario).update(tipo_usuario=tipo)
+        return usuario
+
+    # El orden por username depende de la colación: se comparan sin orden
+    def listar(self, **filtros):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('miapp:admin_gestion_usuarios'), filtros)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, [usuario.username for usuario in respuesta.context['usuarios']]
+
+    def test_busqueda_por_prefijo_sin_distinguir_mayusculas(self):
+        for q in ('an', 'AN', 'aN'):
+            with self.subTest(q=q):
+                # Por usuario o por email (beto, por su email)
+                self.assertCountEqual(self.listar(q=q)[1], ['ANABEL', 'Ana', 'andres', 'beto'])
+        self.assertCountEqual(self.listar(q='ANA')[1], ['ANABEL', 'Ana', 'beto'])
+        self.assertCountEqual(self.listar(q='nab')[1], [])  # sólo prefijos
+
+    def test_filtros_combinados(self):
+        self.assertCountEqual(self.listar(tipo='pasante')[1], ['andres', 'carla'])
+        self.assertCountEqual(self.listar(tipo='pasante', estado='activos')[1], ['andres'])
+        self.assertCountEqual(self.listar(tipo='paciente', estado='inactivos')[1], ['ANABEL'])
+        self.assertCountEqual(self.listar(q='a', tipo='paciente', estado='activos')[1], ['Ana', 'beto'])
+        # Valores desconocidos no filtran
+        self.assertEqual(len(self.listar(tipo='otro', estado='todos')[1]), 6)
+
+    def test_paginacion_conserva_los_filtros(self):
+        vistos = []
+        with mock.patch('miapp.views.USUARIOS_POR_PAGINA', 2):
+            respuesta, usuarios = self.listar(tipo='paciente')
+            vistos += usuarios
+            while respuesta.context['pagina'].tiene_siguiente:
+                respuesta, usuarios = self.listar(tipo='paciente', cursor=respuesta.context['pagina'].siguiente_cursor)
+                vistos += usuarios
+        self.assertCountEqual(vistos, ['ANABEL', 'Ana', 'beto'])
+
+    def test_datos_de_un_usuario(self):
+        url = reverse('miapp:admin_datos_usuario', args=[self.anabel.id])
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(url).json(), {
+            'id': self.anabel.id, 'username': 'ANABEL', 'email': '', 'nombre': '',
+            'tipo_usuario': 'paciente', 'is_active': False,
+        })
+        self.assertEqual(self.client.get(reverse('miapp:admin_datos_usuario', args=[0])).status_code, 404)
+
+        for usuario in (self.andres, self.ana):
+            with self.subTest(rol=usuario.userprofile.tipo_usuario):
+                self.client.force_login(usuario)
+                respuesta = self.client.get(url)
+                self.assertEqual(respuesta.status_code, 403)
+                self.assertNotIn('username', respuesta.json())
+
+
+class MetricasDashboardTests(TestCase):
+    """Las tarjetas se leen del caché y se recalculan al guardar o borrar filas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='clave-de-prueba')
+        cls.categoria = CategoriaRecurso.objects.create(nombre='General')
+        FormularioContacto.objects.create(usuario=cls.autor, tipo_consulta='duda', asunto='Asunto', mensaje='Mensaje')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_una_consulta_por_modelo_y_luego_cache(self):
+        nombres = ['total_recursos', 'total_consultas', 'consultas_sin_responder', 'consultas_sin_leer']
+        with self.assertNumQueries(2):
+            metricas = metricas_dashboard(nombres)
+        self.assertEqual(metricas, dict.fromkeys(nombres[1:], 1) | {'total_recursos': 0})
+        with self.assertNumQueries(0):
+            self.assertEqual(metricas_dashboard(nombres), metricas)
+
+    def test_alta_y_baja_de_recurso(self):
+        self.assertEqual(metricas_dashboard(['total_recursos'])['total_recursos'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recurso = Recurso.objects.create(
+                titulo='Guía', descripcion='Descripción', tipo_recurso='articulo',
+                categoria=self.categoria, creado_por=self.autor,
+            )
+        self.assertEqual(metricas_dashboard(['total_recursos'])['total_recursos'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recurso.delete()
+        self.assertEqual(metricas_dashboard(['total_recursos'])['total_recursos'], 0)
+
+    def test_responder_consulta(self):
+        metricas = metricas_dashboard(['consultas_sin_responder', 'total_recursos'])
+        self.assertEqual(metricas['consultas_sin_responder'], 1)
+        consulta = FormularioContacto.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            consulta.respondido = True
+            consulta.save()
+        # Solo se invalidan las tarjetas del modelo guardado
+        with self.assertNumQueries(1):
+            metricas = metricas_dashboard(['consultas_sin_responder', 'total_recursos'])
+        self.assertEqual(metricas['consultas_sin_responder'], 0)
+
+    def test_borrado_de_consulta(self):
+        self.assertEqual(metricas_dashboard(['total_consultas'])['total_consultas'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            FormularioContacto.objects.get().delete()
+        self.assertEqual(metricas_dashboard(['total_consultas'])['total_consultas'], 0)
+
+
+class BandejaConsultasTests(TestCase):
+    """La bandeja marca como leída solo la página mostrada y respeta los filtros."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pasante = User.objects.create_user('pasante', password='clave-de-prueba')
+        cls.pasante.userprofile.tipo_usuario = 'pasante'
+        cls.pasante.userprofile.save()
+        paciente = User.objects.create_user('paciente', password='clave-de-prueba')
+
+        # Una consulta por día, de la más vieja a la más nueva
+        hoy = timezone.now()
+        cls.consultas = []
+        for i, tipo in enumerate(['duda', 'problema', 'sugerencia', 'duda', 'otros']):
+            consulta = FormularioContacto.objects.create(
+                usuario=paciente, tipo_consulta=tipo, asunto=f'Consulta {i}', mensaje='Mensaje'
+            )
+            FormularioContacto.objects.filter(id=consulta.id).update(creado_en=hoy - timedelta(days=4 - i))
+            cls.consultas.append(consulta)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.pasante)
+
+    def get(self, **params):
+        respuesta = self.client.get(reverse('miapp:pasante_consultas'), params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def ids(self, respuesta):
+        return [consulta.id for consulta in respuesta.context['consultas']]
+
+    def test_marca_leida_solo_la_pagina_mostrada(self):
+        self.assertEqual(metricas_dashboard(['consultas_sin_leer'])['consultas_sin_leer'], 5)
+
+        with mock.patch('miapp.views.CONSULTAS_POR_PAGINA', 2), \
+                self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as consultas_sql:
+            respuesta = self.get()
+
+        mostradas = [c.id for c in self.consultas[:2:-1]]
+        self.assertEqual(self.ids(respuesta), mostradas)
+        # En la página siguen apareciendo como nuevas
+        self.assertFalse(any(c.leido for c in respuesta.context['consultas']))
+        updates = [q['sql'] for q in consultas_sql.captured_queries
+                   if q['sql'].startswith('UPDATE') and 'formulariocontacto' in q['sql']]
+        self.assertEqual(len(updates), 1)
+
+        leidas = set(FormularioContacto.objects.filter(leido=True).values_list('id', flat=True))
+        self.assertEqual(leidas, set(mostradas))
+        # La tarjeta se invalida al confirmar y vuelve a contarse
+        self.assertEqual(metricas_dashboard(['consultas_sin_leer'])['consultas_sin_leer'], 3)
+
+    def test_volver_a_abrir_no_escribe(self):
+        self.get()
+        with CaptureQueriesContext(connection) as consultas_sql:
+            self.get()
+        self.assertFalse([q for q in consultas_sql.captured_queries if q['sql'].startswith('UPDATE')])
+
+    def test_filtro_por_tipo(self):
+        duda = [c.id for c in self.consultas if c.tipo_consulta == 'duda']
+        self.assertCountEqual(self.ids(self.get(tipo='duda')), duda)
+        # Un tipo desconocido no filtra
+        self.assertEqual(len(self.ids(self.get(tipo='inexistente'))), 5)
+
+    def test_filtro_por_lectura(self):
+        FormularioContacto.objects.filter(id=self.consultas[0].id).update(leido=True)
+        self.assertEqual(self.ids(self.get(lectura='leidas')), [self.consultas[0].id])
+        self.assertNotIn(self.consultas[0].id, self.ids(self.get(lectura='no_leidas')))
+
+    def test_filtro_por_fechas(self):
+        dias = [timezone.localtime(c.creado_en).date() for c in
+                FormularioContacto.objects.filter(id__in=[c.id for c in self.consultas]).order_by('creado_en')]
+        respuesta = self.get(desde=dias[1].isoformat(), hasta=dias[3].isoformat())
+        self.assertCountEqual(self.ids(respuesta), [c.id for c in self.consultas[1:4]])
+        # Fechas mal formadas se ignoran
+        self.assertEqual(len(self.ids(self.get(desde='ayer'))), 5)
+
+
+class AgregadorVisitasTests(TestCase):
+    """Las visitas se acumulan en memoria y se vuelcan en bloque sin perderse."""
+
+    @classmethod
+    def setUpTestData(cls):
+        autor = User.objects.create_user('autor', password='clave-de-prueba')
+        categoria = CategoriaForo.objects.create(nombre='General')
+        cls.hilos = [
+            HiloForo.objects.create(titulo=f'Hilo {i}', contenido='Contenido', categoria=categoria, creado_por=autor)
+            for i in range(3)
+        ]
+
+    def agregador(self, **opciones):
+        return AgregadorVisitas(**{'intervalo': 3600, 'max_pendientes': 100, 'volcado_periodico': False, **opciones})
+
+    def visitas(self):
+        return list(HiloForo.objects.filter(id__in=[h.id for h in self.hilos]).order_by('id').values_list('visitas', flat=True))
+
+    def test_acumula_y_vuelca_en_bloque(self):
+        agregador = self.agregador()
+        for hilo in [self.hilos[0], self.hilos[0], self.hilos[1]]:
+            agregador.registrar(hilo.id)
+        self.assertEqual(agregador.pendientes(self.hilos[0].id), 2)
+        self.assertEqual(self.visitas(), [0, 0, 0])
+
+        with self.assertNumQueries(3):  # el UPDATE de visitas y los dos de la popularidad
+            self.assertEqual(agregador.volcar(), 2)
+        self.assertEqual(self.visitas(), [2, 1, 0])
+        self.assertEqual(agregador.pendientes(self.hilos[0].id), 0)
+
+    def test_la_puntuacion_incluye_votos_concurrentes(self):
+        hilo = self.hilos[0]
+        agregador = self.agregador()
+        agregador.registrar(hilo.id)
+
+        # Un voto que se confirma entre la lectura y el UPDATE de la popularidad
+        termino_tiempo = popularidad._termino_tiempo
+        def votar_en_medio(creado_en):
+            HiloForo.objects.filter(id=hilo.id).update(votos_positivos=F('votos_positivos') + 5)
+            return termino_tiempo(creado_en)
+
+        with mock.patch('miapp.popularidad._termino_tiempo', side_effect=votar_en_medio):
+            agregador.volcar()
+        hilo.refresh_from_db()
+        self.assertEqual(hilo.votos_positivos, 5)
+        self.assertAlmostEqual(hilo.puntuacion, calcular_puntuacion(*[getattr(hilo, campo) for campo in CAMPOS]))
+
+    def test_vuelca_al_llegar_al_maximo_de_hilos(self):
+        agregador = self.agregador(max_pendientes=2)
+        agregador.registrar(self.hilos[0].id)
+        self.assertEqual(self.visitas(), [0, 0, 0])
+        agregador.registrar(self.hilos[1].id)
+        self.assertEqual(self.visitas(), [1, 1, 0])
+
+    def test_error_de_la_base_de_datos_devuelve_las_visitas_al_buffer(self):
+        agregador = self.agregador()
+        agregador.registrar(self.hilos[0].id)
+        with mock.patch('django.db.models.QuerySet.update', side_effect=DatabaseError('caída')):
+            with self.assertLogs('miapp.visitas', 'ERROR'):
+                self.assertEqual(agregador.volcar(), 0)
+        self.assertEqual(agregador.pendientes(self.hilos[0].id), 1)
+
+        agregador.registrar(self.hilos[0].id)
+        agregador.volcar()
+        self.assertEqual(self.visitas(), [2, 0, 0])
+
+    def test_volcado_periodico_sin_nuevas_visitas(self):
+        agregador = self.agregador(intervalo=0.01, volcado_periodico=True)
+        volcado = threading.Event()
+        # El hilo en segundo plano usa otra conexión: aquí sólo se comprueba que llama a volcar()
+        with mock.patch.object(agregador, 'volcar', side_effect=lambda: volcado.set()):
+            agregador.registrar(self.hilos[0].id)
+            self.assertTrue(volcado.wait(5))
+            agregador.detener()
+
+
+class EscriturasPerfilTests(TestCase):
+    """Guardar un usuario sólo escribe su perfil cuando el perfil cambió."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('paciente', password='clave-de-prueba')
+
+    def escrituras(self, consultas, tabla):
+        return [
+            consulta['sql'] for consulta in consultas.captured_queries
+            if consulta['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and tabla in consulta['sql']
+        ]
+
+    def test_login_solo_escribe_last_login(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(
+                reverse('miapp:login'), {'username': 'paciente', 'password': 'clave-de-prueba'}
+            )
+        self.assertEqual(respuesta.status_code, 302)
+        escrituras_usuario = self.escrituras(consultas, '"auth_user"')
+        self.assertEqual(len(escrituras_usuario), 1)
+        self.assertIn('"last_login"', escrituras_usuario[0])
+        self.assertEqual(self.escrituras(consultas, '"miapp_userprofile"'), [])
+
+    def test_guardar_usuario_sin_cambios_en_el_perfil(self):
+        usuario = User.objects.select_related('userprofile').get(pk=self.usuario.pk)
+        usuario.first_name = 'Ana'
+        with CaptureQueriesContext(connection) as consultas:
+            usuario.save()
+        self.assertEqual(self.escrituras(consultas, '"miapp_userprofile"'), [])
+
+    def test_guardar_usuario_con_el_perfil_modificado(self):
+        usuario = User.objects.select_related('userprofile').get(pk=self.usuario.pk)
+        usuario.userprofile.tipo_usuario = 'pasante'
+        with CaptureQueriesContext(connection) as consultas:
+            usuario.save(update_fields=['first_name'])
+        escrituras_perfil = self.escrituras(consultas, '"miapp_userprofile"')
+        self.assertEqual(len(escrituras_perfil), 1)
+        self.assertIn('"tipo_usuario"', escrituras_perfil[0])
+        self.assertNotIn('"telefono"', escrituras_perfil[0])
+        self.usuario.userprofile.refresh_from_db()
+        self.assertEqual(self.usuario.userprofile.tipo_usuario, 'pasante')
+
+    def test_sesiones_iniciadas_con_model_backend(self):
+        self.client.force_login(self.usuario, backend='django.contrib.auth.backends.ModelBackend')
+        respuesta = self.client.get(reverse('miapp:foro_comunitario'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.wsgi_request.user, self.usuario)
+
+
+class PresupuestoConsultasTests(PresupuestoConsultasMixin, TestCase):
+    """Las vistas principales no superan su @presupuesto_consultas con varias filas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='clave-de-prueba')
+        cls.pasante = User.objects.create_user('pasante', password='clave-de-prueba')
+        cls.admin.userprofile.tipo_usuario = 'admin'
+        cls.admin.userprofile.save()
+        cls.pasante.userprofile.tipo_usuario = 'pasante'
+        cls.pasante.userprofile.save()
+
+        # Varios autores y filas para que una consulta por fila (N+1) se note
+        autores = [User.objects.create_user(f'autor{i}', password='clave-de-prueba') for i in range(5)]
+        categorias = [CategoriaForo.objects.create(nombre=f'Categoría {i}') for i in range(3)]
+        for i in range(8):
+            hilo = HiloForo.objects.create(
+                titulo=f'Ansiedad {i}', contenido='Contenido', categoria=categorias[i % 3],
+                creado_por=autores[i % 5], es_anonimo=i % 2 == 0,
+            )
+            for j in range(4):
+                RespuestaForo.objects.create(hilo=hilo, contenido=f'Respuesta {j}', creado_por=autores[j])
+            FormularioContacto.objects.create(
+                usuario=autores[i % 5], tipo_consulta='duda', asunto=f'Consulta {i}', mensaje='Mensaje'
+            )
+        cls.hilo = hilo
+
+        categorias_recurso = [CategoriaRecurso.objects.create(nombre=f'Recursos {i}') for i in range(3)]
+        for i, tipo in enumerate(['video', 'articulo', 'ejercicio'] * 5):
+            Recurso.objects.create(
+                titulo=f'Recurso {i}', descripcion='Descripción', tipo_recurso=tipo,
+                categoria=categorias_recurso[i % 3], creado_por=autores[i % 5],
+            )
+
+    def setUp(self):
+        # Caché frío: es el caso con más consultas
+        cache.clear()
+
+    def get(self, usuario, nombre, *args, **params):
+        self.client.force_login(usuario)
+        respuesta = self.client.get(reverse(nombre, args=args), params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_vistas_del_foro(self):
+        self.assertDentroDelPresupuesto(self.get(self.pasante, 'miapp:foro_comunitario'))
+        self.assertDentroDelPresupuesto(self.get(self.pasante, 'miapp:buscar_foro', q='ansiedad'))
+        self.assertDentroDelPresupuesto(self.get(self.pasante, 'miapp:detalle_hilo', self.hilo.id))
+        self.assertDentroDelPresupuesto(
+            self.get(self.pasante, 'miapp:respuestas_nuevas', self.hilo.id, despues=0)
+        )
+
+    def test_catalogo_de_recursos(self):
+        self.assertDentroDelPresupuesto(self.get(self.pasante, 'miapp:recursos'))
+        self.assertDentroDelPresupuesto(self.get(self.pasante, 'miapp:recursos', tipo='video'))
+
+    def test_responder_un_hilo(self):
+        self.client.force_login(self.pasante)
+        respuesta = self.client.post(
+            reverse('miapp:detalle_hilo', args=[self.hilo.id]), {'contenido_respuesta': 'Gracias'}
+        )
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertDentroDelPresupuesto(respuesta)
+
+    def test_vistas_de_administracion(self):
+        self.assertDentroDelPresupuesto(self.get(self.admin, 'miapp:admin_dashboard'))
+        self.assertDentroDelPresupuesto(self.get(self.admin, 'miapp:admin_gestion_usuarios'))
+        self.assertDentroDelPresupuesto(self.get(self.admin, 'miapp:admin_consultas'))
+        self.assertDentroDelPresupuesto(self.get(self.pasante, 'miapp:pasante_dashboard'))
+        self.assertDentroDelPresupuesto(self.get(self.pasante, 'miapp:pasante_consultas'))
+
+
+class AccionesMasivasRecursosTests(PresupuestoConsultasMixin, TestCase):
+    """Las acciones masivas sólo tocan los recursos que el usuario puede editar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pasante = User.objects.create_user('pasante', password='clave-de-prueba')
+        cls.otro = User.objects.create_user('otro', password='clave-de-prueba')
+        for usuario in (cls.pasante, cls.otro):
+            usuario.userprofile.tipo_usuario = 'pasante'
+            usuario.userprofile.save()
+
+        cls.categorias = [CategoriaRecurso.objects.create(nombre=f'Recursos {i}') for i in range(2)]
+        cls.propios = [
+            Recurso.objects.create(
+                titulo=f'Propio {i}', descripcion='Descripción', tipo_recurso='articulo',
+                categoria=cls.categorias[0], creado_por=cls.pasante, es_publico=i == 0,
+            )
+            for i in range(3)
+        ]
+        cls.ajeno = Recurso.objects.create(
+            titulo='Ajeno', descripcion='Descripción', tipo_recurso='articulo',
+            categoria=cls.categorias[0], creado_por=cls.otro, es_publico=False,
+        )
+
+    def accion(self, accion, recursos, **datos):
+        self.client.force_login(self.pasante)
+        return self.client.post(
+            reverse('miapp:recursos_accion_masiva'),
+            {'accion': accion, 'ids': [recurso.id for recurso in recursos], **datos},
+        )
+
+    def test_publicar_devuelve_el_diff(self):
+        respuesta = self.accion('publicar', self.propios + [self.ajeno])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertDentroDelPresupuesto(respuesta)
+        diff = respuesta.json()
+        self.assertEqual(diff['actualizados'], [r.id for r in self.propios[1:]])
+        self.assertEqual(diff['sin_cambios'], [self.propios[0].id])
+        self.assertEqual(diff['sin_permiso'], [self.ajeno.id])
+        self.assertEqual(Recurso.objects.filter(es_publico=True).count(), 3)
+
+    def test_recategorizar_y_eliminar(self):
+        respuesta = self.accion('recategorizar', self.propios, categoria=self.categorias[1].id)
+        self.assertDentroDelPresupuesto(respuesta)
+        diff = respuesta.json()
+        self.assertEqual(diff['cambios']['categoria']['id'], self.categorias[1].id)
+        self.assertEqual(Recurso.objects.filter(categoria=self.categorias[1]).count(), 3)
+
+        respuesta = self.accion('eliminar', self.propios[:2] + [self.ajeno])
+        self.assertDentroDelPresupuesto(respuesta)
+        diff = respuesta.json()
+        self.assertEqual(diff['eliminados'], [r.id for r in self.propios[:2]])
+        self.assertEqual(diff['sin_permiso'], [self.ajeno.id])
+        self.assertQuerySetEqual(Recurso.objects.order_by('id'), [self.propios[2], self.ajeno])
+
+    def test_accion_invalida(self):
+        self.assertEqual(self.accion('archivar', self.propios).status_code, 400)
+        self.assertEqual(self.accion('recategorizar', self.propios, categoria=0).status_code, 400)
+
+
+class CatalogoRecursosTests(TestCase):
+    """Facetas y páginas del catálogo se sirven del caché hasta que cambia un recurso."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='clave-de-prueba')
+        cls.ansiedad = CategoriaRecurso.objects.create(nombre='Ansiedad')
+        cls.sueno = CategoriaRecurso.objects.create(nombre='Sueño')
+        for i, tipo in enumerate(['video', 'articulo', 'video']):
+            cls.crear(f'Recurso {i}', tipo, cls.ansiedad)
+        cls.crear('Privado', 'video', cls.sueno, es_publico=False)
+
+    @classmethod
+    def crear(cls, titulo, tipo, categoria, **campos):
+        return Recurso.objects.create(
+            titulo=titulo, descripcion='Descripción', tipo_recurso=tipo,
+            categoria=categoria, creado_por=cls.autor, **campos,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def totales(self, datos, faceta):
+        # Los tipos se identifican por su valor y las categorías por su nombre
+        clave = 'valor' if faceta == 'tipos' else 'nombre'
+        return {fila[clave]: fila['total'] for fila in datos[faceta]}
+
+    def test_conteos_por_faceta(self):
+        datos = facetas()
+        self.assertEqual(datos['total'], 3)
+        self.assertEqual(self.totales(datos, 'categorias'), {'Ansiedad': 3})
+        self.assertEqual(self.totales(datos, 'tipos'), {'video': 2, 'articulo': 1, 'texto_imagen': 0, 'ejercicio': 0})
+        # Cada faceta respeta el filtro de la otra
+        self.assertEqual(self.totales(facetas(tipo='articulo'), 'categorias'), {'Ansiedad': 1})
+        self.assertEqual(facetas(categoria_id=self.sueno.id)['total'], 0)
+
+    def test_lecturas_en_cache(self):
+        facetas()
+        pagina_catalogo()
+        with self.assertNumQueries(0):
+            self.assertEqual(facetas()['total'], 3)
+            self.assertEqual(len(pagina_catalogo().objetos), 3)
+
+    def test_alta_y_baja_cambian_facetas_y_paginas(self):
+        self.assertEqual(self.totales(facetas(), 'tipos')['ejercicio'], 0)
+        self.assertEqual(len(pagina_catalogo(tipo='ejercicio').objetos), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recurso = self.crear('Respiración', 'ejercicio', self.sueno)
+        datos = facetas()
+        self.assertEqual(self.totales(datos, 'tipos')['ejercicio'], 1)
+        self.assertEqual(self.totales(datos, 'categorias'), {'Ansiedad': 3, 'Sueño': 1})
+        self.assertEqual([r.id for r in pagina_catalogo(tipo='ejercicio').objetos], [recurso.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recurso.delete()
+        self.assertEqual(self.totales(facetas(), 'tipos')['ejercicio'], 0)
+        self.assertEqual(len(pagina_catalogo(tipo='ejercicio').objetos), 0)
+
+    def test_renombrar_categoria(self):
+        facetas()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ansiedad.nombre = 'Estrés'
+            self.ansiedad.save()
+        self.assertEqual(self.totales(facetas(), 'categorias'), {'Estrés': 3})
+
+    def test_update_masivo_invalida_explicitamente(self):
+        facetas()
+        with self.captureOnCommitCallbacks(execute=True):
+            Recurso.objects.filter(es_publico=False).update(es_publico=True)
+        # update() no envía señales: el caché conserva el valor anterior
+        self.assertEqual(facetas()['total'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidar_catalogo()
+        self.assertEqual(facetas()['total'], 4)
+
+
+class MediaTemporalMixin:
+    """Guarda los archivos de la clase en un MEDIA_ROOT temporal que se borra al terminar."""
+
+    @classmethod
+    def setUpClass(cls):
+        directorio = tempfile.mkdtemp(prefix='miapp-media-')
+        cls.addClassCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=directorio))
+        super().setUpClass()
+
+
+class ArchivosRecursoTests(MediaTemporalMixin, TestCase):
+    """Entrega de archivos con Range, ETag y permisos, y límite de las subidas."""
+
+    CONTENIDO = bytes(range(100))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='clave-de-prueba')
+        UserProfile.objects.filter(user=cls.admin).update(tipo_usuario='admin')
+        cls.paciente = User.objects.create_user('paciente', password='clave-de-prueba')
+        cls.categoria = CategoriaRecurso.objects.create(nombre='Recursos')
+        cls.recurso = Recurso.objects.create(
+            titulo='Guía', descripcion='Descripción', tipo_recurso='articulo', categoria=cls.categoria,
+            creado_por=cls.admin, archivo=ContentFile(cls.CONTENIDO, name='guia.pdf'),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.paciente)
+
+    def pedir(self, **cabeceras):
+        return self.client.get(reverse('miapp:archivo_recurso', args=[self.recurso.id]), headers=cabeceras)
+
+    def test_archivo_entero(self):
+        respuesta = self.pedir()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.getvalue(), self.CONTENIDO)
+        self.assertEqual(respuesta['Content-Type'], 'application/pdf')
+        self.assertEqual(respuesta['Accept-Ranges'], 'bytes')
+        self.assertTrue(respuesta['ETag'])
+
+    def test_rangos(self):
+        casos = {
+            'bytes=10-19': (10, 19),
+            'bytes=0-0': (0, 0),
+            'bytes=-5': (95, 99),     # los últimos 5 bytes
+            'bytes=-500': (0, 99),    # más que el archivo: entero
+            'bytes=90-': (90, 99),
+            'bytes=95-200': (95, 99),
+            'bytes=99-99': (99, 99),
+        }
+        for rango, (inicio, fin) in casos.items():
+            with self.subTest(rango=rango):
+                respuesta = self.pedir(Range=rango)
+                self.assertEqual(respuesta.status_code, 206)
+                self.assertEqual(respuesta['Content-Range'], f'bytes {inicio}-{fin}/100')
+                self.assertEqual(respuesta['Content-Length'], str(fin - inicio + 1))
+                self.assertEqual(respuesta.getvalue(), self.CONTENIDO[inicio:fin + 1])
+
+    def test_rango_imposible(self):
+        for rango in ('bytes=100-', 'bytes=150-160', 'bytes=20-10'):
+            with self.subTest(rango=rango):
+                respuesta = self.pedir(Range=rango)
+                self.assertEqual(respuesta.status_code, 416)
+                self.assertEqual(respuesta['Content-Range'], 'bytes */100')
+
+    def test_rangos_no_admitidos_entregan_el_archivo(self):
+        for rango in ('bytes=0-1,5-6', 'items=0-1', 'bytes=-'):
+            with self.subTest(rango=rango):
+                respuesta = self.pedir(Range=rango)
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertEqual(respuesta.getvalue(), self.CONTENIDO)
+
+    def test_etag_e_if_range(self):
+        etag = self.pedir()['ETag']
+        self.assertEqual(self.pedir(If_None_Match=etag).status_code, 304)
+        self.assertEqual(self.pedir(If_None_Match='"otro"').status_code, 200)
+
+        # If-Range distinto: el archivo cambió, se entrega entero
+        respuesta = self.pedir(Range='bytes=10-19', If_Range='"otro"')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.getvalue(), self.CONTENIDO)
+        respuesta = self.pedir(Range='bytes=10-19', If_Range=etag)
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(respuesta.getvalue(), self.CONTENIDO[10:20])
+
+    def test_recurso_privado(self):
+        Recurso.objects.filter(id=self.recurso.id).update(es_publico=False)
+        self.assertEqual(self.pedir().status_code, 404)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.pedir().status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.pedir().status_code, 302)
+
+    def test_entrega_por_el_servidor_web(self):
+        nombre = self.recurso.archivo.name
+        with self.settings(RECURSOS_ENTREGA='x-accel', RECURSOS_X_ACCEL_PREFIJO='/protegido/'):
+            respuesta = self.pedir(Range='bytes=0-9')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['X-Accel-Redirect'], f'/protegido/{nombre}')
+        self.assertEqual(respuesta.content, b'')
+
+        with self.settings(RECURSOS_ENTREGA='x-sendfile'):
+            respuesta = self.pedir()
+        self.assertEqual(respuesta['X-Sendfile'], self.recurso.archivo.path)
+        self.assertEqual(respuesta.content, b'')
+
+    def test_subida_que_supera_el_limite(self):
+        self.client.force_login(self.admin)
+        datos = {
+            'crear_recurso': '1', 'titulo': 'Grande', 'descripcion': 'Descripción', 'tipo_recurso': 'articulo',
+            'categoria': self.categoria.id,
+        }
+        with self.settings(RECURSOS_ARCHIVO_MAX_BYTES=50):
+            respuesta = self.client.post(
+                reverse('miapp:admin_gestion_recursos'),
+                {**datos, 'archivo': SimpleUploadedFile('grande.pdf', bytes(51))}, follow=True,
+            )
+            mensajes = [str(mensaje) for mensaje in respuesta.context['messages']]
+            self.assertEqual(mensajes, ['El archivo "grande.pdf" supera el tamaño máximo de 50\xa0bytes'])
+            self.assertFalse(Recurso.objects.filter(titulo='Grande').exists())
+
+            self.client.post(
+                reverse('miapp:admin_gestion_recursos'), {**datos, 'archivo': SimpleUploadedFile('chico.pdf', bytes(50))}
+            )
+            self.assertTrue(Recurso.objects.filter(titulo='Grande').exists())
+
+
+@skipUnless(Image is not None, 'Pillow no está instalado')
+@override_settings(RECURSOS_DERIVADOS_AUTOMATICOS=False, RECURSOS_DERIVADOS_ANCHOS=(40, 80, 200))
+class DerivadosRecursoTests(MediaTemporalMixin, TestCase):
+    """procesar_recurso calcula el hash, reutiliza archivos repetidos y genera las variantes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = User.objects.create_user('autor', password='clave-de-prueba')
+        cls.categoria = CategoriaRecurso.objects.create(nombre='Recursos')
+
+    def imagen(self, ancho=100, alto=50, formato='PNG'):
+        buffer = BytesIO()
+        Image.new('RGB', (ancho, alto), (200, 30, 30)).save(buffer, formato)
+        return buffer.getvalue()
+
+    def crear(self, contenido, nombre='foto.png', tipo='texto_imagen'):
+        return Recurso.objects.create(
+            titulo='Recurso', descripcion='Descripción', tipo_recurso=tipo, categoria=self.categoria,
+            creado_por=self.autor, archivo=ContentFile(contenido, name=nombre),
+        )
+
+    def test_hash_variantes_y_srcset(self):
+        contenido = self.imagen()
+        recurso = self.crear(contenido)
+        self.assertEqual(recurso.estado_derivados, 'pendiente')
+
+        self.assertEqual(procesar_recurso(recurso.id), 'listo')
+        recurso.refresh_from_db()
+        self.assertEqual(recurso.hash_contenido, hashlib.sha256(contenido).hexdigest())
+
+        # 200 es más que el original: se usa su ancho (100) y no se amplía
+        variantes = recurso.derivados['variantes']
+        self.assertEqual([ancho for ancho, _ in variantes], [40, 80, 100])
+        storage = recurso.archivo.storage
+        for ancho, nombre in variantes:
+            self.assertTrue(nombre.startswith(f'recursos/derivados/{recurso.hash_contenido}/{ancho}w.'))
+            with storage.open(nombre) as archivo, Image.open(archivo) as imagen:
+                self.assertEqual(imagen.size, (ancho, ancho // 2))
+
+        self.assertEqual(recurso.srcset, ', '.join(
+            f"{reverse('miapp:variante_recurso', args=[recurso.id, ancho])} {ancho}w" for ancho in (40, 80, 100)
+        ))
+        self.client.force_login(self.autor)
+        respuesta = self.client.get(reverse('miapp:variante_recurso', args=[recurso.id, 40]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.client.get(reverse('miapp:variante_recurso', args=[recurso.id, 60])).status_code, 404)
+
+    def test_archivo_repetido_usa_el_de_su_gemelo(self):
+        contenido = self.imagen()
+        original = self.crear(contenido)
+        procesar_recurso(original.id)
+        original.refresh_from_db()
+
+        copia = self.crear(contenido)
+        duplicado = copia.archivo.name
+        self.assertNotEqual(duplicado, original.archivo.name)
+        storage = copia.archivo.storage
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(procesar_recurso(copia.id), 'listo')
+        copia.refresh_from_db()
+        self.assertEqual(copia.archivo.name, original.archivo.name)
+        self.assertEqual(copia.hash_contenido, original.hash_contenido)
+        self.assertEqual(copia.derivados, original.derivados)
+        self.assertFalse(storage.exists(duplicado))
+        self.assertTrue(storage.exists(original.archivo.name))
+
+    def test_documento_sin_variantes(self):
+        recurso = self.crear(b'%PDF-1.4 documento', nombre='guia.pdf')
+        self.assertEqual(procesar_recurso(recurso.id), 'listo')
+        recurso.refresh_from_db()
+        self.assertEqual(recurso.derivados, {})
+        self.assertEqual(recurso.srcset, '')
+
+    def test_poster_de_un_video(self):
+        poster = self.imagen(120, 60, 'JPEG')
+        llamadas = []
+
+        def ffmpeg(comando, **opciones):
+            llamadas.append(comando)
+            # El último argumento es el archivo de salida
+            with open(comando[-1], 'wb') as destino:
+                destino.write(poster)
+            return subprocess.CompletedProcess(comando, 0)
+
+        recurso = self.crear(b'no es un video de verdad', nombre='charla.mp4', tipo='video')
+        with mock.patch('miapp.derivados.shutil.which', return_value='/usr/bin/ffmpeg'), \
+                mock.patch('miapp.derivados.subprocess.run', side_effect=ffmpeg):
+            self.assertEqual(procesar_recurso(recurso.id), 'listo')
+
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(llamadas[0][0], '/usr/bin/ffmpeg')
+        self.assertIn(recurso.archivo.path, llamadas[0])
+        recurso.refresh_from_db()
+        self.assertEqual(recurso.derivados['poster'], f'recursos/derivados/{recurso.hash_contenido}/poster.jpg')
+        self.assertEqual([ancho for ancho, _ in recurso.derivados['variantes']], [40, 80, 120])
+
+    def test_sin_ffmpeg_el_video_queda_sin_poster(self):
+        recurso = self.crear(b'video', nombre='charla.mp4', tipo='video')
+        with mock.patch('miapp.derivados.shutil.which', return_value=None), \
+                mock.patch('miapp.derivados.subprocess.run') as run, self.assertLogs('miapp.derivados', 'WARNING'):
+            self.assertEqual(procesar_recurso(recurso.id), 'listo')
+        run.assert_not_called()
+        recurso.refresh_from_db()
+        self.assertEqual(recurso.derivados, {'poster': None})
+
+
+class EvaluacionTestsTests(PresupuestoConsultasMixin, TestCase):
+    """Un test se responde y califica sin consultas por pregunta."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('usuario', password='clave-de-prueba')
+        cls.categorias = [CategoriaRecurso.objects.create(nombre=f'Recursos {i}') for i in range(3)]
+        cls.test = TestPsicologico.objects.create(nombre='Estrés', descripcion='Descripción', instrucciones='Responde')
+        cls.preguntas = []
+        for orden in range(8):
+            pregunta = PreguntaTest.objects.create(test=cls.test, texto_pregunta=f'Pregunta {orden}', orden=orden)
+            pregunta.lista_opciones = [
+                OpcionRespuesta.objects.create(
+                    pregunta=pregunta, texto_opcion=f'Opción {valor}', valor=valor,
+                    categoria_recomendacion=cls.categorias[valor],
+                )
+                for valor in range(3)
+            ]
+            cls.preguntas.append(pregunta)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def datos(self, valores):
+        return {
+            f'pregunta_{pregunta.id}': str(pregunta.lista_opciones[valor].id)
+            for pregunta, valor in zip(self.preguntas, valores)
+        }
+
+    def responder(self, valores):
+        return self.client.post(reverse('miapp:tomar_test', args=[self.test.id]), self.datos(valores))
+
+    def test_calificacion_y_categoria_recomendada(self):
+        # Categoría 1: 5 puntos, categoría 2: 2 puntos
+        respuesta = self.responder([1, 1, 1, 1, 1, 2, 0, 0])
+        self.assertDentroDelPresupuesto(respuesta)
+        resultado = ResultadoTest.objects.get()
+        self.assertRedirects(respuesta, reverse('miapp:resultado_test', args=[resultado.id]))
+        self.assertEqual(resultado.puntuacion_total, 7)
+        self.assertEqual(resultado.categoria_recomendada, self.categorias[1])
+        self.assertEqual(resultado.indices_respuestas, (1, 1, 1, 1, 1, 2, 0, 0))
+        self.assertEqual(
+            resultado.opciones_elegidas[5], (self.preguntas[5].id, self.preguntas[5].lista_opciones[2].id)
+        )
+
+    def test_respuestas_incompletas_o_ajenas(self):
+        respuesta = self.responder([1, 1, 1])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'Faltan 5 respuestas')
+
+        datos = {f'pregunta_{pregunta.id}': pregunta.lista_opciones[0].id for pregunta in self.preguntas}
+        datos[f'pregunta_{self.preguntas[0].id}'] = self.preguntas[1].lista_opciones[0].id
+        self.client.post(reverse('miapp:tomar_test', args=[self.test.id]), datos)
+        self.assertFalse(ResultadoTest.objects.exists())
+
+    def test_pregunta_con_demasiadas_opciones(self):
+        pregunta = self.preguntas[0]
+        OpcionRespuesta.objects.bulk_create([
+            OpcionRespuesta(pregunta=pregunta, texto_opcion=f'Extra {i}', valor=0, categoria_recomendacion=self.categorias[0])
+            for i in range(OpcionRespuesta.MAX_POR_PREGUNTA - 3)
+        ])
+        extra = OpcionRespuesta(pregunta=pregunta, texto_opcion='Una más', valor=0, categoria_recomendacion=self.categorias[0])
+        with self.assertRaises(ValidationError):
+            extra.full_clean()
+        # Las opciones existentes se pueden seguir editando
+        pregunta.lista_opciones[0].full_clean()
+
+        extra.save()  # por el ORM no pasa por clean()
+        respuesta = self.client.get(reverse('miapp:tomar_test', args=[self.test.id]), follow=True)
+        self.assertRedirects(respuesta, reverse('miapp:tests'))
+        self.assertContains(respuesta, 'Este test no está disponible por el momento.')
+
+    def test_vistas_dentro_del_presupuesto(self):
+        self.responder([0] * 8)
+        for nombre, args in [
+            ('miapp:tests', []),
+            ('miapp:tomar_test', [self.test.id]),
+            ('miapp:resultado_test', [ResultadoTest.objects.get().id]),
+        ]:
+            respuesta = self.client.get(reverse(nombre, args=args))
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertDentroDelPresupuesto(respuesta)
+
+    def test_calificar_con_el_test_compilado_no_consulta(self):
+        obtener_test(self.test.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_test(self.test.id).calificar(self.datos([2] * 8)), (16, self.categorias[2].id))
+
+        # Cambiar una opción recompila el test
+        opcion = self.preguntas[0].lista_opciones[2]
+        opcion.valor = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            opcion.save()
+        self.assertEqual(obtener_test(self.test.id).calificar(self.datos([2] * 8)), (24, self.categorias[2].id))
+
+    def test_distribucion_de_respuestas_entre_versiones(self):
+        test = obtener_test(self.test.id)
+        for valores in ([0] * 8, [0] * 8, [1] * 8):
+            registrar_resultado(self.usuario, test, self.datos(valores))
+
+        # Una pregunta nueva al principio cambia las posiciones: otra versión del test
+        with self.captureOnCommitCallbacks(execute=True):
+            nueva = PreguntaTest.objects.create(test=self.test, texto_pregunta='Nueva', orden=-1)
+            opcion_nueva = OpcionRespuesta.objects.create(
+                pregunta=nueva, texto_opcion='Sí', valor=1, categoria_recomendacion=self.categorias[0],
+            )
+        test = obtener_test(self.test.id)
+        datos = {**self.datos([2] * 8), f'pregunta_{nueva.id}': str(opcion_nueva.id)}
+        registrar_resultado(self.usuario, test, datos)
+        self.assertEqual(self.test.versiones.count(), 2)
+
+        with self.assertNumQueries(2):
+            distribucion = distribucion_respuestas(ResultadoTest.objects.filter(test=self.test))
+        opciones = self.preguntas[3].lista_opciones
+        self.assertEqual(distribucion[self.preguntas[3].id], {opciones[0].id: 2, opciones[1].id: 1, opciones[2].id: 1})
+        self.assertEqual(distribucion[nueva.id], {opcion_nueva.id: 1})
+
+
+class AnaliticaTestsTests(PresupuestoConsultasMixin, TestCase):
+    """Los resúmenes se mantienen al guardar resultados y la vista sólo los lee."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='clave-de-prueba')
+        cls.admin.userprofile.tipo_usuario = 'admin'
+        cls.admin.userprofile.save()
+        cls.categorias = [CategoriaRecurso.objects.create(nombre=f'Recursos {i}') for i in range(2)]
+        cls.test = TestPsicologico.objects.create(nombre='Estrés', descripcion='Descripción', instrucciones='Responde')
+
+    def crear(self, puntuacion, categoria, **extra):
+        return ResultadoTest.objects.create(
+            usuario=self.admin, test=self.test, puntuacion_total=puntuacion,
+            categoria_recomendada=self.categorias[categoria], **extra,
+        )
+
+    def totales(self):
+        totales = Counter()
+        for fila in ResumenResultadosTest.objects.filter(test=self.test, total__gt=0):
+            totales[fila.categoria_id, fila.puntuacion] += fila.total
+        return dict(totales)
+
+    def test_resumen_incremental(self):
+        for puntuacion, categoria in [(5, 0), (5, 0), (8, 1)]:
+            self.crear(puntuacion, categoria)
+        self.crear(8, 1).delete()
+        self.assertEqual(self.totales(), {(self.categorias[0].id, 5): 2, (self.categorias[1].id, 8): 1})
+
+    def test_borrar_un_resultado_resta_de_su_fila(self):
+        primero, segundo = self.crear(5, 0), self.crear(5, 0)
+        otro = self.crear(8, 1)
+        fila = ResumenResultadosTest.objects.get(categoria=self.categorias[0], puntuacion=5)
+        self.assertEqual(fila.total, 2)
+
+        primero.delete()
+        fila.refresh_from_db()
+        self.assertEqual(fila.total, 1)
+        self.assertEqual(ResumenResultadosTest.objects.get(categoria=self.categorias[1], puntuacion=8).total, 1)
+
+        # Un DELETE masivo también resta, fila por fila
+        ResultadoTest.objects.filter(id__in=[segundo.id, otro.id]).delete()
+        self.assertEqual(self.totales(), {})
+        fila.refresh_from_db()
+        self.assertEqual(fila.total, 0)
+
+        # Un resultado que todavía no se resumió no resta nada
+        self.crear(5, 0, resumido=False).delete()
+        fila.refresh_from_db()
+        self.assertEqual(fila.total, 0)
+
+    def test_backfill_por_lotes_sin_contar_dos_veces(self):
+        self.crear(5, 0)
+        ayer = timezone.now() - timedelta(days=1)
+        for puntuacion, categoria in [(5, 0), (3, 1), (3, 1)]:
+            ResultadoTest.objects.filter(id=self.crear(puntuacion, categoria, resumido=False).id).update(
+                completado_en=ayer
+            )
+        self.assertEqual(self.totales(), {(self.categorias[0].id, 5): 1})
+
+        call_command('resumir_resultados', lote=2, stdout=open(os.devnull, 'w'))
+        call_command('resumir_resultados', lote=2, stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.totales(), {(self.categorias[0].id, 5): 2, (self.categorias[1].id, 3): 2})
+        self.assertEqual(ResumenResultadosTest.objects.filter(dia=timezone.localdate(ayer)).count(), 2)
+        self.assertFalse(ResultadoTest.objects.filter(resumido=False).exists())
+
+    def test_vista_solo_lee_los_resumenes(self):
+        for puntuacion, categoria in [(5, 0), (5, 0), (8, 1)]:
+            self.crear(puntuacion, categoria)
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('miapp:analitica_tests'), {'dias': 7})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertDentroDelPresupuesto(respuesta)
+        self.assertFalse(any('miapp_resultadotest' in consulta['sql'] for consulta in consultas))
+
+        resumen = respuesta.context['resumen']
+        self.assertEqual(resumen['total'], 3)
+        self.assertEqual(len(resumen['dias']), 7)
+        self.assertEqual(resumen['dias'][-1]['promedio'], 6.0)
+        self.assertEqual([c['porcentaje'] for c in resumen['categorias']], [66.7, 33.3])
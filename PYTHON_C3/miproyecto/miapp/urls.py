@@ -15,7 +15,11 @@ urlpatterns = [
     path('datos-curiosos/', views.datos_curiosos, name='datos_curiosos'),
     path('recursos/', views.recursos, name='recursos'),
     path('recursos-multimedia/', views.recursos_multimedia, name='recursos_multimedia'),
+    path('recursos/<int:recurso_id>/archivo/', views.archivo_recurso, name='archivo_recurso'),
+    path('recursos/<int:recurso_id>/archivo/<int:ancho>w/', views.variante_recurso, name='variante_recurso'),
     path('tests/', views.tests_psicologicos, name='tests'),
+    path('tests/<int:test_id>/', views.tomar_test, name='tomar_test'),
+    path('tests/resultados/<int:resultado_id>/', views.resultado_test, name='resultado_test'),
     path('contacto/', views.formulario_contacto, name='formulario_contacto'),
     
     # ==================== DASHBOARDS ESPECÍFICOS ====================
@@ -25,13 +29,21 @@ urlpatterns = [
    # URLs DEL FORO COMUNITARIO ACTUALIZADAS
     path('foro/', views.foro_comunitario, name='foro_comunitario'),
     path('foro/crear/', views.crear_hilo, name='crear_hilo'),
+    path('foro/buscar/', views.buscar_foro, name='buscar_foro'),
     path('foro/hilo/<int:hilo_id>/', views.detalle_hilo, name='detalle_hilo'),
     path('foro/hilo/<int:hilo_id>/editar/', views.editar_hilo, name='editar_hilo'),
     path('foro/hilo/<int:hilo_id>/eliminar/', views.eliminar_hilo, name='eliminar_hilo'),
+    path('foro/hilo/<int:hilo_id>/votar/', views.votar_hilo, name='votar_hilo'),
+    path('foro/hilo/<int:hilo_id>/respuestas-nuevas/', views.respuestas_nuevas, name='respuestas_nuevas'),
+    path('foro/hilo/<int:hilo_id>/eventos/', views.eventos_hilo, name='eventos_hilo'),
+    path('foro/respuesta/<int:respuesta_id>/votar/', views.votar_respuesta, name='votar_respuesta'),
     
     # ==================== ADMINISTRACIÓN (SOLO ADMIN) ====================
     path('admin/usuarios/', views.admin_gestion_usuarios, name='admin_gestion_usuarios'),
+    path('admin/usuarios/<int:user_id>/datos/', views.admin_datos_usuario, name='admin_datos_usuario'),
     path('admin/recursos/', views.admin_gestion_recursos, name='admin_gestion_recursos'),
+    path('recursos/acciones/', views.recursos_accion_masiva, name='recursos_accion_masiva'),
+    path('tests/analitica/', views.analitica_tests, name='analitica_tests'),
     path('admin/consultas/', views.admin_consultas, name='admin_consultas'),
     
     # ==================== PASANTE (SOLO PASANTE) ====================
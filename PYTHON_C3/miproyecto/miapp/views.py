@@ -1,15 +1,31 @@
+from datetime import date, datetime, time, timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.db.models import Count, Q
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_POST, require_safe
 from .models import (
-    UserProfile, Recurso, CategoriaRecurso, FormularioContacto,
+    UserProfile, Recurso, CategoriaRecurso, FormularioContacto, TestPsicologico, ResultadoTest,
     # AGREGAR ESTAS IMPORTACIONES DEL FORO:
-    CategoriaForo, HiloForo, RespuestaForo, VotoHilo, VotoRespuesta
+    CategoriaForo, HiloForo, RespuestaForo
 )
 from .forms import RecursoForm, UserForm, UserProfileForm
+from . import catalogo
+from .analitica import resumen_test
+from .archivos import archivo_rechazado, respuesta_archivo
+from .catalogo import TIPOS_RECURSO
+from .decorators import presupuesto_consultas, role_required
+from .evaluacion import desglose_resultado, obtener_test, registrar_resultado
+from .gestion_recursos import accion_masiva, crear_recurso, editar_recurso, recursos_editables
+from .metricas import invalidar_metricas, metricas_dashboard
+from .middleware import rol_de
+from .paginacion import PaginadorCursor
 
 
 def custom_login(request):
@@ -31,15 +47,12 @@ def custom_login(request):
     return render(request, 'miapp/login.html')
 
 def redirigir_segun_tipo_usuario(user):
-    try:
-        if hasattr(user, 'userprofile'):
-            if user.userprofile.tipo_usuario == 'admin':
-                return redirect('miapp:admin_dashboard')
-            elif user.userprofile.tipo_usuario == 'pasante':
-                return redirect('miapp:pasante_dashboard')
-        return redirect('miapp:index')
-    except UserProfile.DoesNotExist:
-        return redirect('miapp:index')
+    rol = rol_de(user)
+    if rol == 'admin':
+        return redirect('miapp:admin_dashboard')
+    elif rol == 'pasante':
+        return redirect('miapp:pasante_dashboard')
+    return redirect('miapp:index')
 
 def custom_logout(request):
     logout(request)
@@ -52,19 +65,112 @@ def index(request):
 def datos_curiosos(request):
     return render(request, 'miapp/datos_curiosos.html')
 
+@presupuesto_consultas(4)
 @login_required
 def recursos(request):
-    recursos_list = Recurso.objects.filter(es_publico=True)
-    return render(request, 'miapp/recursos.html', {'recursos': recursos_list})
+    """Catálogo de recursos públicos, filtrable por categoría y tipo"""
+    try:
+        categoria_id = int(request.GET.get('categoria', ''))
+    except ValueError:
+        categoria_id = None
+    tipo = request.GET.get('tipo') or None
+    if tipo not in TIPOS_RECURSO:
+        tipo = None
+
+    # Facetas y página con la misma versión del catálogo
+    version = catalogo.version_catalogo()
+    pagina = catalogo.pagina_catalogo(categoria_id, tipo, request.GET.get('cursor'), version=version)
+
+    context = {
+        'recursos': pagina.objetos,
+        'pagina': pagina,
+        'facetas': catalogo.facetas(categoria_id, tipo, version=version),
+        'categoria_actual': categoria_id,
+        'tipo_actual': tipo,
+    }
+    return render(request, 'miapp/recursos.html', context)
 
 @login_required
 def recursos_multimedia(request):
-    recursos_list = Recurso.objects.filter(es_publico=True)
-    return render(request, 'miapp/recursos_multimedia.html', {'recursos': recursos_list})
+    return render(request, 'miapp/recursos_multimedia.html')
+
+@presupuesto_consultas(3)
+@require_safe
+@login_required
+def archivo_recurso(request, recurso_id):
+    """Entrega el archivo de un recurso (admite Range y ETag)"""
+    recurso = get_object_or_404(Recurso.objects.only('archivo', 'es_publico'), id=recurso_id)
+    # Los recursos privados sólo los ve el staff
+    if not recurso.archivo or (not recurso.es_publico and request.role not in ROLES_STAFF):
+        raise Http404('El recurso no tiene archivo')
+    return respuesta_archivo(request, recurso.archivo)
+
+@presupuesto_consultas(3)
+@require_safe
+@login_required
+def variante_recurso(request, recurso_id, ancho):
+    """Entrega una versión reducida de la imagen (o del póster) de un recurso"""
+    recurso = get_object_or_404(Recurso.objects.only('archivo', 'es_publico', 'derivados'), id=recurso_id)
+    if not recurso.es_publico and request.role not in ROLES_STAFF:
+        raise Http404('El recurso no tiene archivo')
+    nombre = dict(recurso.derivados.get('variantes', [])).get(ancho)
+    if nombre is None:
+        raise Http404('No existe esa variante')
+    return respuesta_archivo(request, recurso.archivo, nombre)
 
+@presupuesto_consultas(4)
 @login_required
 def tests_psicologicos(request):
-    return render(request, 'miapp/tests.html')
+    """Tests activos y los últimos resultados del usuario"""
+    tests = (
+        TestPsicologico.objects.filter(es_activo=True)
+        .annotate(total_preguntas=Count('preguntas'))
+        .order_by('nombre')
+    )
+    resultados = (
+        ResultadoTest.objects.filter(usuario=request.user)
+        .select_related('test', 'categoria_recomendada')
+        .order_by('-completado_en', '-id')[:5]
+    )
+    return render(request, 'miapp/tests.html', {'tests': tests, 'resultados': resultados})
+
+# Con el test en caché son 2 consultas al mostrarlo y 4 al enviarlo, más el
+# BEGIN/COMMIT; el resto es compilarlo cuando cambió y crear la primera fila
+# de su resumen en miapp.analitica
+@presupuesto_consultas(16)
+@login_required
+def tomar_test(request, test_id):
+    """Muestra el test completo y califica todas las respuestas en un solo envío"""
+    try:
+        test = obtener_test(test_id)
+    except ValueError:
+        # Una pregunta con demasiadas opciones (ver evaluacion.compilar)
+        messages.error(request, 'Este test no está disponible por el momento.')
+        return redirect('miapp:tests')
+    if request.method == 'POST':
+        try:
+            resultado = registrar_resultado(request.user, test, request.POST)
+        except ValueError as error:
+            messages.error(request, str(error))
+        else:
+            return redirect('miapp:resultado_test', resultado_id=resultado.id)
+
+    # Conserva lo que ya se había respondido si el envío tuvo errores
+    return render(request, 'miapp/tomar_test.html', {'test': test, 'preguntas': test.formulario(request.POST)})
+
+@presupuesto_consultas(4)
+@require_safe
+@login_required
+def resultado_test(request, resultado_id):
+    """Resultado con el desglose de respuestas; el staff puede ver los de cualquier usuario"""
+    resultados = ResultadoTest.objects.select_related('test', 'categoria_recomendada', 'version', 'usuario')
+    if request.role not in ROLES_STAFF:
+        resultados = resultados.filter(usuario=request.user)
+    resultado = get_object_or_404(resultados, id=resultado_id)
+    return render(request, 'miapp/resultado_test.html', {
+        'resultado': resultado,
+        'desglose': desglose_resultado(resultado),
+    })
 
 @login_required
 def formulario_contacto(request):
@@ -86,49 +192,41 @@ def formulario_contacto(request):
 
 # ==================== DASHBOARDS ====================
 
-@login_required
+# Tarjetas de cada dashboard (ver miapp/metricas.py)
+TARJETAS_ADMIN = ['total_usuarios', 'total_recursos', 'total_consultas', 'consultas_sin_responder', 'consultas_sin_leer']
+TARJETAS_PASANTE = ['total_recursos', 'total_consultas', 'consultas_sin_responder', 'consultas_sin_leer']
+
+@presupuesto_consultas(6)
+@role_required('admin', mensaje='No tienes permisos para acceder al dashboard de administrador')
 def admin_dashboard(request):
-    if not hasattr(request.user, 'userprofile') or not request.user.userprofile.es_admin():
-        messages.error(request, 'No tienes permisos para acceder al dashboard de administrador')
-        return redirect('miapp:index')
-    
     context = {
         'user': request.user,
-        'stats': {
-            'total_usuarios': User.objects.count(),
-            'total_recursos': Recurso.objects.count(),
-            'total_consultas': FormularioContacto.objects.count(),
-            'consultas_sin_responder': FormularioContacto.objects.filter(respondido=False).count(),
-        }
+        'stats': metricas_dashboard(TARJETAS_ADMIN),
     }
     return render(request, 'miapp/admin/dashboard.html', context)
 
-@login_required
+@presupuesto_consultas(6)
+@role_required('pasante', mensaje='No tienes permisos para acceder al dashboard de pasante')
 def pasante_dashboard(request):
-    if not hasattr(request.user, 'userprofile') or not request.user.userprofile.es_pasante():
-        messages.error(request, 'No tienes permisos para acceder al dashboard de pasante')
-        return redirect('miapp:index')
-    
     context = {
         'user': request.user,
-        'stats': {
-            'total_recursos': Recurso.objects.count(),
-            'total_consultas': FormularioContacto.objects.count(),
-            'consultas_sin_responder': FormularioContacto.objects.filter(respondido=False).count(),
-        }
+        'stats': metricas_dashboard(TARJETAS_PASANTE),
     }
     return render(request, 'miapp/pasante/dashboard.html', context)
 
 # ==================== ADMINISTRACIÓN ====================
 
-@login_required
+USUARIOS_POR_PAGINA = 25
+# username es único: el cursor no necesita desempate, pero se mantiene el id
+ORDEN_USUARIOS = ['username', 'id']
+
+CONSULTAS_POR_PAGINA = 20
+# Pendientes primero y, dentro de cada grupo, las más nuevas arriba
+ORDEN_CONSULTAS = ['respondido', '-creado_en', '-id']
+
+@presupuesto_consultas(8)
+@role_required('admin')
 def admin_gestion_usuarios(request):
-    if not hasattr(request.user, 'userprofile') or not request.user.userprofile.es_admin():
-        messages.error(request, 'No tienes permisos para acceder a esta página')
-        return redirect('miapp:index')
-    
-    usuarios = User.objects.all().select_related('userprofile')
-    
     if request.method == 'POST':
         if 'crear_usuario' in request.POST:
             username = request.POST.get('username')
@@ -145,7 +243,7 @@ def admin_gestion_usuarios(request):
                     email=email
                 )
                 user.userprofile.tipo_usuario = tipo_usuario
-                user.userprofile.save()
+                user.userprofile.save(update_fields=['tipo_usuario'])
                 messages.success(request, f'Usuario {username} creado exitosamente')
                 
         elif 'editar_usuario' in request.POST:
@@ -153,165 +251,162 @@ def admin_gestion_usuarios(request):
             tipo_usuario = request.POST.get('tipo_usuario')
             is_active = request.POST.get('is_active') == 'on'
             
-            user = get_object_or_404(User, id=user_id)
+            user = get_object_or_404(User.objects.select_related('userprofile'), id=user_id)
             user.userprofile.tipo_usuario = tipo_usuario
-            user.userprofile.save()
             user.is_active = is_active
-            user.save()
+            # save_user_profile guarda el perfil sólo si tipo_usuario cambió
+            user.save(update_fields=['is_active'])
             messages.success(request, f'Usuario {user.username} actualizado')
+        
+        return redirect(request.get_full_path())
     
-    return render(request, 'miapp/admin/gestion_usuarios.html', {'usuarios': usuarios})
-
-@login_required
-def admin_gestion_recursos(request):
-    if not hasattr(request.user, 'userprofile') or not request.user.userprofile.es_admin():
-        messages.error(request, 'No tienes permisos para acceder a esta página')
-        return redirect('miapp:index')
+    usuarios = User.objects.select_related('userprofile')
+    
+    # Filtros: búsqueda por prefijo de usuario o email, tipo y estado
+    filtros = {
+        'q': request.GET.get('q', '').strip(),
+        'tipo': request.GET.get('tipo', ''),
+        'estado': request.GET.get('estado', ''),
+    }
+    if filtros['q']:
+        usuarios = usuarios.filter(
+            Q(username__istartswith=filtros['q']) | Q(email__istartswith=filtros['q'])
+        )
+    if filtros['tipo'] in dict(UserProfile.TIPO_USUARIO_CHOICES):
+        usuarios = usuarios.filter(userprofile__tipo_usuario=filtros['tipo'])
+    if filtros['estado'] == 'activos':
+        usuarios = usuarios.filter(is_active=True)
+    elif filtros['estado'] == 'inactivos':
+        usuarios = usuarios.filter(is_active=False)
     
-    recursos_list = Recurso.objects.all().select_related('categoria', 'creado_por')
-    categorias = CategoriaRecurso.objects.all()
+    paginador = PaginadorCursor(usuarios, ORDEN_USUARIOS, por_pagina=USUARIOS_POR_PAGINA)
+    pagina = paginador.pagina(request.GET.get('cursor'))
     
+    context = {
+        'usuarios': pagina.objetos,
+        'pagina': pagina,
+        'filtros': filtros,
+        'tipos_usuario': UserProfile.TIPO_USUARIO_CHOICES,
+        'stats': metricas_dashboard(['total_usuarios']),
+    }
+    return render(request, 'miapp/admin/gestion_usuarios.html', context)
+
+@login_required
+def admin_datos_usuario(request, user_id):
+    """Endpoint AJAX con los datos del modal de edición de un usuario"""
+    if request.role != 'admin':
+        return JsonResponse({'error': 'No tienes permisos.'}, status=403)
+    
+    usuario = get_object_or_404(User.objects.select_related('userprofile'), id=user_id)
+    return JsonResponse({
+        'id': usuario.id,
+        'username': usuario.username,
+        'email': usuario.email,
+        'nombre': usuario.get_full_name(),
+        'tipo_usuario': usuario.userprofile.tipo_usuario,
+        'is_active': usuario.is_active,
+    })
+
+def _gestion_recursos(request, template):
+    """Vista común de gestión de recursos; el pasante sólo ve y modifica los suyos"""
     if request.method == 'POST':
-        if 'crear_recurso' in request.POST:
-            titulo = request.POST.get('titulo')
-            descripcion = request.POST.get('descripcion')
-            tipo_recurso = request.POST.get('tipo_recurso')
-            categoria_id = request.POST.get('categoria')
-            contenido = request.POST.get('contenido')
-            es_publico = request.POST.get('es_publico') == 'on'
-            
-            recurso = Recurso.objects.create(
-                titulo=titulo,
-                descripcion=descripcion,
-                tipo_recurso=tipo_recurso,
-                categoria_id=categoria_id,
-                contenido=contenido,
-                es_publico=es_publico,
-                creado_por=request.user
-            )
-            messages.success(request, f'Recurso "{titulo}" creado exitosamente')
-            
+        rechazo = archivo_rechazado(request)
+        if rechazo:
+            messages.error(request, rechazo)
+        elif 'crear_recurso' in request.POST:
+            recurso = crear_recurso(request.user, request.POST, request.FILES.get('archivo'))
+            messages.success(request, f'Recurso "{recurso.titulo}" creado exitosamente')
         elif 'editar_recurso' in request.POST:
-            recurso_id = request.POST.get('recurso_id')
-            titulo = request.POST.get('titulo')
-            descripcion = request.POST.get('descripcion')
-            tipo_recurso = request.POST.get('tipo_recurso')
-            categoria_id = request.POST.get('categoria')
-            contenido = request.POST.get('contenido')
-            es_publico = request.POST.get('es_publico') == 'on'
-            
-            recurso = get_object_or_404(Recurso, id=recurso_id)
-            recurso.titulo = titulo
-            recurso.descripcion = descripcion
-            recurso.tipo_recurso = tipo_recurso
-            recurso.categoria_id = categoria_id
-            recurso.contenido = contenido
-            recurso.es_publico = es_publico
-            recurso.save()
-            messages.success(request, f'Recurso "{titulo}" actualizado')
-            
+            recurso = editar_recurso(
+                request.user, request.role, request.POST.get('recurso_id'), request.POST, request.FILES.get('archivo')
+            )
+            messages.success(request, f'Recurso "{recurso.titulo}" actualizado')
         elif 'eliminar_recurso' in request.POST:
-            recurso_id = request.POST.get('recurso_id')
-            recurso = get_object_or_404(Recurso, id=recurso_id)
-            titulo = recurso.titulo
-            recurso.delete()
-            messages.success(request, f'Recurso "{titulo}" eliminado')
-    
-    return render(request, 'miapp/admin/gestion_recursos.html', {
-        'recursos': recursos_list,
-        'categorias': categorias
+            try:
+                diff = accion_masiva(request.user, request.role, 'eliminar', [request.POST.get('recurso_id')])
+            except ValueError:
+                diff = {'eliminados': []}
+            if not diff['eliminados']:
+                raise Http404('No existe el recurso')
+            messages.success(request, 'Recurso eliminado')
+        return redirect(request.path)
+
+    return render(request, template, {
+        'recursos': recursos_editables(request.user, request.role).order_by('-creado_en', '-id'),
+        'categorias': CategoriaRecurso.objects.all(),
     })
 
-@login_required
+@role_required('admin')
+def admin_gestion_recursos(request):
+    return _gestion_recursos(request, 'miapp/admin/gestion_recursos.html')
+
+@presupuesto_consultas(7)
+@require_POST
+@role_required('admin', 'pasante')
+def recursos_accion_masiva(request):
+    """Publica, despublica, recategoriza o elimina varios recursos; responde con el diff"""
+    try:
+        diff = accion_masiva(
+            request.user, request.role, request.POST.get('accion'),
+            request.POST.getlist('ids'), request.POST.get('categoria'),
+        )
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse(diff)
+
+# Rangos que ofrece la analítica de tests, en días
+RANGOS_ANALITICA = (7, 30, 90, 365)
+
+@presupuesto_consultas(6)
+@require_safe
+@role_required('admin', 'pasante')
+def analitica_tests(request):
+    """Tendencias de los resultados de un test; sólo lee los resúmenes de miapp.analitica"""
+    tests = list(TestPsicologico.objects.order_by('nombre').only('id', 'nombre'))
+    try:
+        test_id = int(request.GET.get('test', ''))
+    except ValueError:
+        test_id = None
+    test = next((test for test in tests if test.id == test_id), tests[0] if tests else None)
+    try:
+        dias = int(request.GET.get('dias', ''))
+    except ValueError:
+        dias = None
+    if dias not in RANGOS_ANALITICA:
+        dias = 30
+
+    hasta = timezone.localdate()
+    desde = hasta - timedelta(days=dias - 1)
+    context = {
+        'tests': tests,
+        'test_actual': test,
+        'dias': dias,
+        'rangos': RANGOS_ANALITICA,
+        'desde': desde,
+        'hasta': hasta,
+        'resumen': resumen_test(test.id, desde, hasta) if test else None,
+    }
+    return render(request, 'miapp/analitica_tests.html', context)
+
+@presupuesto_consultas(6)
+@role_required('admin')
 def admin_consultas(request):
-    if not hasattr(request.user, 'userprofile') or not request.user.userprofile.es_admin():
-        messages.error(request, 'No tienes permisos para acceder a esta página')
-        return redirect('miapp:index')
-    
-    consultas = FormularioContacto.objects.all().select_related('usuario')
-    
-    if request.method == 'POST':
-        consulta_id = request.POST.get('consulta_id')
-        respuesta = request.POST.get('respuesta')
-        
-        consulta = get_object_or_404(FormularioContacto, id=consulta_id)
-        consulta.respuesta = respuesta
-        consulta.respondido = True
-        consulta.save()
-        messages.success(request, 'Respuesta enviada exitosamente')
-    
-    return render(request, 'miapp/admin/consultas.html', {'consultas': consultas})
+    return _bandeja_consultas(request, 'miapp/admin/consultas.html')
 
 # ==================== PASANTE ====================
 
-@login_required
+@role_required('pasante')
 def pasante_gestion_recursos(request):
-    if not hasattr(request.user, 'userprofile') or not request.user.userprofile.es_pasante():
-        messages.error(request, 'No tienes permisos para acceder a esta página')
-        return redirect('miapp:index')
-    
-    recursos_list = Recurso.objects.all().select_related('categoria', 'creado_por')
-    categorias = CategoriaRecurso.objects.all()
-    
-    if request.method == 'POST':
-        if 'crear_recurso' in request.POST:
-            titulo = request.POST.get('titulo')
-            descripcion = request.POST.get('descripcion')
-            tipo_recurso = request.POST.get('tipo_recurso')
-            categoria_id = request.POST.get('categoria')
-            contenido = request.POST.get('contenido')
-            es_publico = request.POST.get('es_publico') == 'on'
-            
-            recurso = Recurso.objects.create(
-                titulo=titulo,
-                descripcion=descripcion,
-                tipo_recurso=tipo_recurso,
-                categoria_id=categoria_id,
-                contenido=contenido,
-                es_publico=es_publico,
-                creado_por=request.user
-            )
-            messages.success(request, f'Recurso "{titulo}" creado exitosamente')
-            
-        elif 'editar_recurso' in request.POST:
-            recurso_id = request.POST.get('recurso_id')
-            titulo = request.POST.get('titulo')
-            descripcion = request.POST.get('descripcion')
-            tipo_recurso = request.POST.get('tipo_recurso')
-            categoria_id = request.POST.get('categoria')
-            contenido = request.POST.get('contenido')
-            es_publico = request.POST.get('es_publico') == 'on'
-            
-            recurso = get_object_or_404(Recurso, id=recurso_id, creado_por=request.user)
-            recurso.titulo = titulo
-            recurso.descripcion = descripcion
-            recurso.tipo_recurso = tipo_recurso
-            recurso.categoria_id = categoria_id
-            recurso.contenido = contenido
-            recurso.es_publico = es_publico
-            recurso.save()
-            messages.success(request, f'Recurso "{titulo}" actualizado')
-            
-        elif 'eliminar_recurso' in request.POST:
-            recurso_id = request.POST.get('recurso_id')
-            recurso = get_object_or_404(Recurso, id=recurso_id, creado_por=request.user)
-            titulo = recurso.titulo
-            recurso.delete()
-            messages.success(request, f'Recurso "{titulo}" eliminado')
-    
-    return render(request, 'miapp/pasante/gestion_recursos.html', {
-        'recursos': recursos_list,
-        'categorias': categorias
-    })
+    return _gestion_recursos(request, 'miapp/pasante/gestion_recursos.html')
 
-@login_required
+@presupuesto_consultas(6)
+@role_required('pasante')
 def pasante_consultas(request):
-    if not hasattr(request.user, 'userprofile') or not request.user.userprofile.es_pasante():
-        messages.error(request, 'No tienes permisos para acceder a esta página')
-        return redirect('miapp:index')
-    
-    consultas = FormularioContacto.objects.all().select_related('usuario')
-    
+    return _bandeja_consultas(request, 'miapp/pasante/consultas.html')
+
+def _bandeja_consultas(request, template):
+    # Bandeja compartida por admin y pasante: responde, filtra, pagina por
+    # cursor (pendientes primero) y marca como leídas las consultas mostradas
     if request.method == 'POST':
         consulta_id = request.POST.get('consulta_id')
         respuesta = request.POST.get('respuesta')
@@ -319,46 +414,114 @@ def pasante_consultas(request):
         consulta = get_object_or_404(FormularioContacto, id=consulta_id)
         consulta.respuesta = respuesta
         consulta.respondido = True
+        consulta.leido = True
         consulta.save()
         messages.success(request, 'Respuesta enviada exitosamente')
+        return redirect(request.get_full_path())
+    
+    consultas = FormularioContacto.objects.select_related('usuario')
     
-    return render(request, 'miapp/pasante/consultas.html', {'consultas': consultas})
+    # Filtros
+    filtros = {
+        'tipo': request.GET.get('tipo', ''),
+        'lectura': request.GET.get('lectura', ''),
+        'desde': _fecha_o_none(request.GET.get('desde')),
+        'hasta': _fecha_o_none(request.GET.get('hasta')),
+    }
+    if filtros['tipo'] in dict(FormularioContacto.TIPO_CONSULTA_CHOICES):
+        consultas = consultas.filter(tipo_consulta=filtros['tipo'])
+    if filtros['lectura'] == 'no_leidas':
+        consultas = consultas.filter(leido=False)
+    elif filtros['lectura'] == 'leidas':
+        consultas = consultas.filter(leido=True)
+    # Rango de fechas como límites de creado_en (y no creado_en__date) para usar el índice
+    if filtros['desde']:
+        consultas = consultas.filter(creado_en__gte=_inicio_del_dia(filtros['desde']))
+    if filtros['hasta']:
+        consultas = consultas.filter(creado_en__lt=_inicio_del_dia(filtros['hasta'] + timedelta(days=1)))
+    
+    paginador = PaginadorCursor(consultas, ORDEN_CONSULTAS, por_pagina=CONSULTAS_POR_PAGINA)
+    pagina = paginador.pagina(request.GET.get('cursor'))
+    
+    # Las consultas mostradas se marcan como leídas con un solo UPDATE; en esta
+    # página siguen apareciendo como nuevas
+    no_leidas = [consulta.id for consulta in pagina.objetos if not consulta.leido]
+    if no_leidas:
+        FormularioContacto.objects.filter(id__in=no_leidas).update(leido=True)
+        invalidar_metricas(FormularioContacto)
+    
+    context = {
+        'consultas': pagina.objetos,
+        'pagina': pagina,
+        'filtros': filtros,
+        'tipos_consulta': FormularioContacto.TIPO_CONSULTA_CHOICES,
+        'stats': metricas_dashboard(['consultas_sin_responder', 'consultas_sin_leer']),
+    }
+    return render(request, template, context)
+
+def _fecha_o_none(valor):
+    try:
+        return date.fromisoformat(valor)
+    except (TypeError, ValueError):
+        return None
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
 
 # ==================== VISTAS FORO COMUNITARIO ====================# ==================== VISTAS FORO COMUNITARIO ====================
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, Q
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views.decorators.http import require_POST
 from .models import (
     UserProfile, Recurso, CategoriaRecurso, FormularioContacto,
     # AGREGAR ESTAS IMPORTACIONES DEL FORO:
     CategoriaForo, HiloForo, RespuestaForo
 )
 from .forms import RecursoForm, UserForm, UserProfileForm
+from .busqueda import buscar
+from .estadisticas import estadisticas_foro
+from .eventos import canal_hilo, obtener_backend
+from .fragmentos import renderizar_respuestas
+from .visitas import agregador_visitas
+from .votos import TIPOS_VOTO, votar, votos_del_usuario
 
 # ... (tus vistas existentes aquí)
 
+# Roles que moderan el foro (respuestas oficiales, eliminar hilos)
+ROLES_STAFF = ('admin', 'pasante')
+
+HILOS_POR_PAGINA = 20
+RESPUESTAS_POR_PAGINA = 30
+ORDEN_RESPUESTAS = ['creado_en', 'id']
+
+# Segundos entre comentarios de latido en la conexión de eventos, para que
+# los proxies no la corten por inactividad
+EVENTOS_LATIDO = 15
+
+# Ordenamientos del listado del foro. Todos terminan en 'id' para que el
+# cursor sea estable cuando varios hilos comparten los mismos valores.
+ORDENES_FORO = {
+    'recientes': ['-creado_en', '-id'],
+    'populares': ['-puntuacion', '-id'],
+    'antiguos': ['creado_en', 'id'],
+}
+
 # ==================== VISTAS FORO COMUNITARIO SIMPLIFICADAS ==
+@presupuesto_consultas(8)
 @login_required
 def foro_comunitario(request):
     """Vista principal del foro comunitario"""
-    # Crear categorías por defecto si no existen
-    if not CategoriaForo.objects.exists():
-        categorias_default = [
-            {'nombre': 'Experiencias Personales', 'color': '#6C63FF', 'orden': 1},
-            {'nombre': 'Consejos y Estrategias', 'color': '#4CAF50', 'orden': 2},
-            {'nombre': 'Apoyo Emocional', 'color': '#FF6B6B', 'orden': 3},
-            {'nombre': 'Preguntas y Dudas', 'color': '#FFA726', 'orden': 4},
-        ]
-        for cat_data in categorias_default:
-            CategoriaForo.objects.create(
-                nombre=cat_data['nombre'],
-                color=cat_data['color'],
-                orden=cat_data['orden']
-            )
-    
+    # Las categorías por defecto se crean en la migración 0004
     categorias = CategoriaForo.objects.filter(es_activa=True).order_by('orden')
     
     # Filtros - solo se aplican cuando se presiona el botón
@@ -373,23 +536,18 @@ def foro_comunitario(request):
         if categoria_id and categoria_id != 'todas':
             hilos = hilos.filter(categoria_id=categoria_id)
     
-    # Aplicar ordenamiento CORREGIDO
-    if orden == 'populares':
-        hilos = hilos.order_by('-votos_positivos', '-visitas', '-actualizado_en')
-    elif orden == 'antiguos':
-        hilos = hilos.order_by('creado_en')
-    else:  # recientes (POR DEFECTO)
-        hilos = hilos.order_by('-creado_en')  # Cambiado de -actualizado_en a -creado_en
-    
-    # Estadísticas
-    stats = {
-        'total_hilos': HiloForo.objects.count(),
-        'total_respuestas': RespuestaForo.objects.count(),
-        'hilos_abiertos': HiloForo.objects.filter(estado='abierto').count(),
-    }
+    # Aplicar ordenamiento (recientes por defecto) y paginar por cursor
+    if orden not in ORDENES_FORO:
+        orden = 'recientes'
+    paginador = PaginadorCursor(hilos, ORDENES_FORO[orden], por_pagina=HILOS_POR_PAGINA)
+    pagina = paginador.pagina(request.GET.get('cursor'))
+    
+    # Estadísticas (desde caché, mantenidas por señales)
+    stats = estadisticas_foro()
     
     context = {
-        'hilos': hilos,
+        'hilos': pagina.objetos,
+        'pagina': pagina,
         'categorias': categorias,
         'categoria_actual': categoria_id,
         'orden_actual': orden,
@@ -398,6 +556,25 @@ def foro_comunitario(request):
     
     return render(request, 'miapp/foro_comunitario.html', context)
 
+@presupuesto_consultas(5)
+@login_required
+def buscar_foro(request):
+    """Búsqueda de texto completo en hilos y respuestas del foro"""
+    texto = request.GET.get('q', '').strip()
+    en = 'respuestas' if request.GET.get('en') == 'respuestas' else 'hilos'
+    try:
+        pagina = int(request.GET.get('pagina', 1))
+    except ValueError:
+        pagina = 1
+    
+    context = {
+        'q': texto,
+        'en': en,
+        'resultados': buscar(texto, en, pagina),
+    }
+    
+    return render(request, 'miapp/buscar_foro.html', context)
+
 @login_required
 def crear_hilo(request):
     """Vista para crear un nuevo hilo"""
@@ -451,7 +628,9 @@ def editar_hilo(request, hilo_id):
             hilo.contenido = contenido
             hilo.categoria_id = categoria_id
             hilo.es_anonimo = es_anonimo
-            hilo.save()
+            # Sólo los campos editados: los contadores se actualizan con F() en
+            # otras peticiones y el valor en memoria puede estar desactualizado
+            hilo.save(update_fields=['titulo', 'contenido', 'categoria', 'es_anonimo', 'actualizado_en'])
             
             messages.success(request, 'Tu hilo ha sido actualizado exitosamente.')
             return redirect('miapp:detalle_hilo', hilo_id=hilo.id)
@@ -465,6 +644,7 @@ def editar_hilo(request, hilo_id):
     
     return render(request, 'miapp/editar_hilo.html', context)
 
+@presupuesto_consultas(12)
 @login_required
 def detalle_hilo(request, hilo_id):
     """Vista para ver un hilo específico y sus respuestas"""
@@ -473,45 +653,167 @@ def detalle_hilo(request, hilo_id):
         id=hilo_id
     )
     
-    # Incrementar contador de visitas
-    hilo.visitas += 1
-    hilo.save()
+    # Incrementar contador de visitas (se escribe en bloque, sin save())
+    if request.method == 'GET':
+        agregador_visitas.registrar(hilo.id)
+        hilo.visitas += 1
     
-    respuestas = hilo.respuestas.select_related('creado_por', 'creado_por__userprofile').order_by('creado_en')
+    respuestas = hilo.respuestas.select_related('creado_por', 'creado_por__userprofile')
+    paginador = PaginadorCursor(
+        respuestas.filter(es_respuesta_oficial=False), ORDEN_RESPUESTAS, por_pagina=RESPUESTAS_POR_PAGINA
+    )
     
     if request.method == 'POST':
         contenido = request.POST.get('contenido_respuesta')
         es_anonimo = request.POST.get('es_anonimo') == 'on'
+        # Sólo el staff puede publicar respuestas oficiales
+        es_oficial = request.POST.get('es_respuesta_oficial') == 'on' and request.role in ROLES_STAFF
         
         if contenido:
-            RespuestaForo.objects.create(
+            respuesta = RespuestaForo.objects.create(
                 hilo=hilo,
                 contenido=contenido,
                 creado_por=request.user,
-                es_anonimo=es_anonimo
+                es_anonimo=es_anonimo,
+                es_respuesta_oficial=es_oficial
             )
             messages.success(request, 'Tu respuesta ha sido publicada exitosamente.')
-            return redirect('miapp:detalle_hilo', hilo_id=hilo.id)
+            
+            # Se redirige a la página que empieza en la nueva respuesta
+            url = reverse('miapp:detalle_hilo', args=[hilo.id])
+            anterior = (
+                hilo.respuestas.filter(es_respuesta_oficial=False)
+                .filter(Q(creado_en__lt=respuesta.creado_en) |
+                        Q(creado_en=respuesta.creado_en, id__lt=respuesta.id))
+                .order_by('-creado_en', '-id')
+                .first()
+            )
+            if anterior is not None and not es_oficial:
+                url += '?' + urlencode({'cursor': paginador.cursor_despues(anterior)})
+            return redirect(f'{url}#respuesta-{respuesta.id}')
+    
+    # Las respuestas oficiales van fijas arriba con su propia consulta;
+    # el resto se pagina por cursor
+    respuestas_oficiales = list(respuestas.filter(es_respuesta_oficial=True).order_by(*ORDEN_RESPUESTAS))
+    pagina = paginador.pagina(request.GET.get('cursor'))
+    en_pantalla = respuestas_oficiales + pagina.objetos
+    
+    # Votos del usuario actual, para marcar los botones ya presionados
+    voto_hilo, votos_respuestas = votos_del_usuario(request.user, hilo, en_pantalla)
+    for respuesta in en_pantalla:
+        respuesta.voto_usuario = votos_respuestas.get(respuesta.id)
+    
+    # HTML de cada respuesta desde caché (sólo se renderizan las nuevas o editadas)
+    renderizar_respuestas(en_pantalla)
     
     context = {
         'hilo': hilo,
-        'respuestas': respuestas,
+        'respuestas_oficiales': respuestas_oficiales,
+        'respuestas': pagina.objetos,
+        'pagina': pagina,
+        'voto_hilo': voto_hilo,
+        'ultima_respuesta_id': max((respuesta.id for respuesta in en_pantalla), default=0),
+        'eventos_en_vivo': getattr(settings, 'FORO_EVENTOS_EN_VIVO', False),
+        'segundos_sondeo': getattr(settings, 'FORO_EVENTOS_SONDEO', 15),
     }
     
     return render(request, 'miapp/detalle_hilo.html', context)
 
+@presupuesto_consultas(7)
+@login_required
+def respuestas_nuevas(request, hilo_id):
+    """Endpoint AJAX con las respuestas publicadas después de la respuesta ``despues``"""
+    hilo = get_object_or_404(HiloForo, id=hilo_id)
+    try:
+        despues = int(request.GET.get('despues', 0))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetro inválido.'}, status=400)
+    
+    nuevas = list(
+        hilo.respuestas.select_related('creado_por', 'creado_por__userprofile')
+        .filter(id__gt=despues)
+        .order_by('id')[:RESPUESTAS_POR_PAGINA]
+    )
+    _, votos_respuestas = votos_del_usuario(request.user, hilo, nuevas)
+    for respuesta in nuevas:
+        respuesta.voto_usuario = votos_respuestas.get(respuesta.id)
+    renderizar_respuestas(nuevas)
+    
+    html = ''.join(
+        render_to_string('miapp/fragmentos/tarjeta_respuesta.html', {'respuesta': respuesta}, request=request)
+        for respuesta in nuevas
+    )
+    return JsonResponse({
+        'html': html,
+        'ultima': nuevas[-1].id if nuevas else despues,
+        'total_respuestas': hilo.total_respuestas(),
+    })
+
+@login_required
+async def eventos_hilo(request, hilo_id):
+    """Server-sent events del hilo: avisa de respuestas nuevas y cambios de votos.
+    
+    Sólo existe con FORO_EVENTOS_EN_VIVO (servidor ASGI): con WSGI cada conexión
+    abierta ocuparía un worker, y la página consulta respuestas_nuevas en su lugar.
+    """
+    if not getattr(settings, 'FORO_EVENTOS_EN_VIVO', False):
+        raise Http404
+    if not await HiloForo.objects.filter(id=hilo_id).aexists():
+        raise Http404
+    
+    async def flujo():
+        suscripcion = obtener_backend().suscribir(canal_hilo(hilo_id))
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                evento = await suscripcion.recibir(EVENTOS_LATIDO)
+                if evento is None:
+                    yield ': latido\n\n'
+                else:
+                    yield f"event: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+        finally:
+            # Se ejecuta también cuando el cliente se desconecta
+            await suscripcion.cerrar()
+    
+    response = StreamingHttpResponse(flujo(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+@require_POST
+def votar_hilo(request, hilo_id):
+    """Endpoint AJAX para votar un hilo"""
+    return _responder_voto(request, 'hilo', hilo_id)
+
+@login_required
+@require_POST
+def votar_respuesta(request, respuesta_id):
+    """Endpoint AJAX para votar una respuesta"""
+    return _responder_voto(request, 'respuesta', respuesta_id)
+
+def _responder_voto(request, tipo_objeto, objeto_id):
+    # 'ninguno' retira el voto; 'positivo' y 'negativo' lo emiten o lo cambian
+    voto = request.POST.get('voto')
+    if voto == 'ninguno':
+        voto = None
+    elif voto not in TIPOS_VOTO:
+        return JsonResponse({'error': 'Tipo de voto inválido.'}, status=400)
+    
+    try:
+        resultado = votar(tipo_objeto, objeto_id, request.user, voto)
+    except (HiloForo.DoesNotExist, RespuestaForo.DoesNotExist):
+        return JsonResponse({'error': 'El elemento ya no existe.'}, status=404)
+    
+    return JsonResponse(resultado)
+
 @login_required
 def eliminar_hilo(request, hilo_id):
     """Vista para eliminar un hilo (solo admin/pasante)"""
     hilo = get_object_or_404(HiloForo, id=hilo_id)
     
     # Verificar permisos: SOLO admin o pasante pueden eliminar
-    puede_eliminar = (
-        hasattr(request.user, 'userprofile') and 
-        (request.user.userprofile.es_admin() or request.user.userprofile.es_pasante())
-    )
-    
-    if not puede_eliminar:
+    if request.role not in ROLES_STAFF:
         messages.error(request, 'No tienes permisos para eliminar hilos. Solo el staff puede eliminar hilos.')
         return redirect('miapp:detalle_hilo', hilo_id=hilo_id)
     
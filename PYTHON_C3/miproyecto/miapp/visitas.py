@@ -0,0 +1,139 @@
+"""Contador de visitas de los hilos del foro con buffer en memoria.
+
+Cada visita sólo suma en un contador del proceso. Cada cierto tiempo, o cuando
+hay demasiados hilos pendientes, todo se vuelca a la base de datos con un único
+UPDATE ... SET visitas = visitas + CASE ... por lote. El UPDATE no toca
+``actualizado_en``, así que las visitas no reordenan el listado del foro.
+
+El volcado por tiempo lo hace un hilo en segundo plano, así que no depende de
+que lleguen más visitas. Si la base de datos falla, las visitas vuelven al
+buffer y se reintentan en el próximo volcado.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import HiloForo
+from .popularidad import actualizar_popularidad
+
+logger = logging.getLogger(__name__)
+
+
+class AgregadorVisitas:
+    """
+    Acumula visitas por hilo y las vuelca en bloque.
+
+    ``intervalo`` es la cantidad máxima de segundos entre volcados y
+    ``max_pendientes`` la cantidad de hilos distintos que fuerzan un volcado
+    antes de tiempo. Por defecto se leen de ``FORO_VISITAS_INTERVALO`` y
+    ``FORO_VISITAS_MAX_PENDIENTES``. Con ``volcado_periodico`` un hilo en
+    segundo plano vuelca cada ``intervalo`` segundos; arranca con la primera
+    visita.
+    """
+
+    def __init__(self, intervalo=None, max_pendientes=None, volcado_periodico=True):
+        self.intervalo = intervalo if intervalo is not None else getattr(settings, 'FORO_VISITAS_INTERVALO', 10)
+        self.max_pendientes = (
+            max_pendientes if max_pendientes is not None
+            else getattr(settings, 'FORO_VISITAS_MAX_PENDIENTES', 200)
+        )
+        self._pendientes = Counter()
+        self._lock = threading.Lock()
+        self._ultimo_volcado = time.monotonic()
+        self.volcado_periodico = volcado_periodico
+        self._periodico = None
+        self._detener = threading.Event()
+
+    def registrar(self, hilo_id):
+        with self._lock:
+            self._pendientes[hilo_id] += 1
+            if self.volcado_periodico and self._periodico is None:
+                self._periodico = threading.Thread(
+                    target=self._volcar_periodicamente, name='volcado-visitas', daemon=True
+                )
+                self._periodico.start()
+            toca_volcar = (
+                len(self._pendientes) >= self.max_pendientes
+                or time.monotonic() - self._ultimo_volcado >= self.intervalo
+            )
+        if toca_volcar:
+            self.volcar()
+
+    def pendientes(self, hilo_id):
+        with self._lock:
+            return self._pendientes.get(hilo_id, 0)
+
+    def detener(self):
+        """Detiene el volcado periódico (las visitas pendientes quedan en el buffer)."""
+        self._detener.set()
+        if self._periodico is not None:
+            self._periodico.join()
+
+    def _volcar_periodicamente(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.volcar()
+            except Exception:
+                logger.exception('Error en el volcado periódico de visitas')
+            finally:
+                # La conexión es de este hilo; no queda abierta entre volcados
+                connection.close()
+
+    def volcar(self):
+        """Escribe las visitas acumuladas y devuelve cuántos hilos se actualizaron.
+
+        Si la base de datos falla, las visitas vuelven al buffer y devuelve 0:
+        el error no llega a la petición que disparó el volcado.
+        """
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, Counter()
+            self._ultimo_volcado = time.monotonic()
+        if not pendientes:
+            return 0
+
+        # Se agrupan los hilos por cantidad de visitas para que el CASE tenga
+        # una rama por valor distinto y no una por hilo
+        por_cantidad = defaultdict(list)
+        for hilo_id, cantidad in pendientes.items():
+            por_cantidad[cantidad].append(hilo_id)
+        incremento = Case(
+            *[When(pk__in=ids, then=Value(cantidad)) for cantidad, ids in por_cantidad.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+
+        try:
+            actualizados = HiloForo.objects.filter(pk__in=list(pendientes)).update(
+                visitas=F('visitas') + incremento
+            )
+        except DatabaseError:
+            # No se pierden las visitas: vuelven al buffer para el próximo volcado
+            with self._lock:
+                self._pendientes.update(pendientes)
+            logger.exception('No se pudieron volcar las visitas de %d hilos; se reintentará', len(pendientes))
+            return 0
+
+        try:
+            actualizar_popularidad(pendientes)
+        except DatabaseError:
+            # Las visitas ya se guardaron; la popularidad se recalcula en la próxima actualización
+            logger.exception('No se pudo recalcular la popularidad después de volcar las visitas')
+        return actualizados
+
+
+agregador_visitas = AgregadorVisitas()
+
+
+@atexit.register
+def _volcar_al_salir():
+    agregador_visitas._detener.set()
+    try:
+        agregador_visitas.volcar()
+    except Exception:
+        logger.exception('No se pudieron volcar las visitas pendientes al terminar el proceso')
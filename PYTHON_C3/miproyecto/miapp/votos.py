@@ -0,0 +1,93 @@
+"""Votos del foro sobre hilos y respuestas.
+
+Cada voto se registra en una sola transacción: se bloquea la fila del voto del
+usuario (si existe), se inserta, cambia o borra, y los contadores del objeto se
+ajustan con expresiones F(). Nunca se lee un contador para volver a escribirlo.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .eventos import canal_hilo, publicar
+from .models import HiloForo, RespuestaForo, VotoHilo, VotoRespuesta
+from .popularidad import actualizar_popularidad
+
+TIPOS_VOTO = ('positivo', 'negativo')
+
+CAMPO_CONTADOR = {
+    'positivo': 'votos_positivos',
+    'negativo': 'votos_negativos',
+}
+
+# Objeto votable -> (modelo, modelo del voto, nombre del campo en el voto)
+VOTABLES = {
+    'hilo': (HiloForo, VotoHilo, 'hilo'),
+    'respuesta': (RespuestaForo, VotoRespuesta, 'respuesta'),
+}
+
+
+def votar(tipo_objeto, objeto_id, usuario, voto):
+    """
+    Emite, cambia o retira (``voto=None``) el voto de ``usuario``.
+
+    Devuelve un diccionario con los contadores actualizados y el voto vigente.
+    Lanza ``DoesNotExist`` del modelo si el objeto no existe; en ese caso la
+    transacción se deshace completa.
+    """
+    if voto is not None and voto not in TIPOS_VOTO:
+        raise ValueError(f'Tipo de voto inválido: {voto}')
+
+    Modelo, ModeloVoto, campo = VOTABLES[tipo_objeto]
+    filtro = {f'{campo}_id': objeto_id, 'usuario': usuario}
+    votos = ModeloVoto.objects.filter(**filtro)
+
+    with transaction.atomic():
+        anterior = votos.select_for_update().values_list('tipo_voto', flat=True).first()
+
+        if anterior is None and voto is not None:
+            try:
+                with transaction.atomic():
+                    ModeloVoto.objects.create(tipo_voto=voto, **filtro)
+            except IntegrityError:
+                # Otra petición del mismo usuario insertó el voto primero:
+                # se toma ese voto como el anterior y se sigue como un cambio
+                anterior = votos.select_for_update().values_list('tipo_voto', flat=True).get()
+                votos.update(tipo_voto=voto)
+        elif anterior is not None and voto is None:
+            votos.delete()
+        elif anterior != voto:
+            votos.update(tipo_voto=voto)
+
+        deltas = {}
+        if anterior != voto:
+            if anterior is not None:
+                deltas[CAMPO_CONTADOR[anterior]] = F(CAMPO_CONTADOR[anterior]) - 1
+            if voto is not None:
+                deltas[CAMPO_CONTADOR[voto]] = F(CAMPO_CONTADOR[voto]) + 1
+            Modelo.objects.filter(pk=objeto_id).update(**deltas)
+            if tipo_objeto == 'hilo':
+                actualizar_popularidad([objeto_id])
+
+        campo_hilo = 'hilo_id' if tipo_objeto == 'respuesta' else 'id'
+        contadores = Modelo.objects.values('votos_positivos', 'votos_negativos', campo_hilo).get(pk=objeto_id)
+        hilo_id = contadores.pop(campo_hilo)
+
+        if anterior != voto:
+            publicar(canal_hilo(hilo_id), {
+                'tipo': 'votos', 'objeto': tipo_objeto, 'id': objeto_id, **contadores,
+            })
+
+    return {**contadores, 'voto': voto}
+
+
+def votos_del_usuario(usuario, hilo, respuestas):
+    """Devuelve el voto del usuario en el hilo y un dict {respuesta_id: voto}."""
+    voto_hilo = (
+        VotoHilo.objects.filter(hilo=hilo, usuario=usuario)
+        .values_list('tipo_voto', flat=True)
+        .first()
+    )
+    votos_respuestas = dict(
+        VotoRespuesta.objects.filter(usuario=usuario, respuesta__in=[r.id for r in respuestas])
+        .values_list('respuesta_id', 'tipo_voto')
+    )
+    return voto_hilo, votos_respuestas
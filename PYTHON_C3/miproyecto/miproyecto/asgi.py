@@ -3,6 +3,15 @@ ASGI config for miproyecto project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The forum's live updates (``miapp:eventos_hilo``) keep one long-lived
+connection per open thread, so they are only enabled with
+``FORO_EVENTOS_EN_VIVO = True`` and the project served with an ASGI server, e.g.:
+
+    uvicorn miproyecto.asgi:application
+
+Under WSGI leave the setting off: each open connection would hold a worker,
+so the thread page polls ``miapp:respuestas_nuevas`` instead.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -41,11 +41,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'miapp.instrumentacion.InstrumentacionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'miapp.middleware.RolUsuarioMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +56,8 @@ ROOT_URLCONF = 'miproyecto.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que además mide el tiempo de render (miapp/instrumentacion.py)
+        'BACKEND': 'miapp.instrumentacion.PlantillasMedidas',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -86,6 +89,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Los contadores del foro se mantienen con incrementos en caché. Con varios
+# procesos en producción conviene un caché compartido (Redis o Memcached)
+# para que todos vean los mismos valores.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'soulcomfort',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -144,6 +161,79 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Configuración de autenticación
 # Configuración de autenticación
+# Carga el perfil junto con el usuario de la sesión (ver miapp/backends.py).
+# ModelBackend sigue en la lista para que las sesiones iniciadas con él (que
+# guardan su ruta) no se cierren
+AUTHENTICATION_BACKENDS = [
+    'miapp.backends.BackendConPerfil',
+    'django.contrib.auth.backends.ModelBackend',
+]
 LOGIN_REDIRECT_URL = 'miapp:pagina_inicio'  # 👈 Cambia a tu nueva vista
 LOGOUT_REDIRECT_URL = 'miapp:login'
-LOGIN_URL = 'miapp:login'
\ No newline at end of file
+LOGIN_URL = 'miapp:login'
+
+# Foro comunitario
+# Las visitas a los hilos se acumulan en memoria y se escriben en bloque
+FORO_VISITAS_INTERVALO = 10         # Segundos máximos entre volcados
+FORO_VISITAS_MAX_PENDIENTES = 200   # Hilos distintos pendientes que fuerzan un volcado
+FORO_ESTADISTICAS_TTL = 3600        # Segundos antes de recalcular las estadísticas del foro
+FORO_FRAGMENTOS_TTL = 86400         # Segundos que se guarda el HTML de cada respuesta
+FORO_POPULARIDAD_VIDA_MEDIA = 172800  # Segundos en que la popularidad de un hilo pierde la mitad
+
+# Eventos en vivo del foro (server-sent events). Cada hilo abierto mantiene una
+# conexión, así que sólo se activan al servir con ASGI: con WSGI cada conexión
+# ocupa un worker. Desactivados, la página consulta cada FORO_EVENTOS_SONDEO
+# segundos si hay respuestas nuevas. Con varios procesos hay que usar
+# 'miapp.eventos.BackendRedis' para que los eventos lleguen a todos
+FORO_EVENTOS_EN_VIVO = False        # True sólo al servir con ASGI (miproyecto.asgi)
+FORO_EVENTOS_SONDEO = 15            # Segundos entre consultas cuando no hay eventos en vivo
+FORO_EVENTOS_BACKEND = 'miapp.eventos.BackendMemoria'
+FORO_EVENTOS_REDIS_URL = 'redis://localhost:6379/0'
+
+# Dashboards
+DASHBOARD_METRICAS_TTL = 60         # Segundos que se guardan las métricas de las tarjetas
+
+# Catálogo de recursos
+RECURSOS_CATALOGO_TTL = 300         # Segundos que se guarda cada página y los conteos por faceta
+
+# Tests psicológicos
+TESTS_COMPILADOS_TTL = 86400        # Segundos que se guarda en caché la estructura compilada de cada test
+
+# Archivos de los recursos (miapp/archivos.py). Con nginx delante conviene
+# 'x-accel' para que sea nginx quien envíe el archivo
+RECURSOS_ENTREGA = 'django'         # 'django', 'x-accel' o 'x-sendfile'
+RECURSOS_X_ACCEL_PREFIJO = '/protegido/'  # Ubicación interna de nginx que apunta a MEDIA_ROOT
+RECURSOS_ARCHIVO_MAX_BYTES = 500 * 1024 * 1024  # Tamaño máximo de un archivo subido
+
+# Derivados de imágenes y videos (miapp/derivados.py). Pillow y ffmpeg son
+# opcionales; sin ellos sólo se calcula el hash del archivo
+RECURSOS_DERIVADOS_AUTOMATICOS = True  # False: los procesa "manage.py procesar_derivados"
+RECURSOS_DERIVADOS_PROCESOS = 2     # Procesos del pool que genera los derivados
+RECURSOS_DERIVADOS_ANCHOS = (480, 960, 1600)  # Anchos (px) de las versiones reducidas
+RECURSOS_DERIVADOS_CALIDAD = 80     # Calidad WebP/JPEG de las versiones reducidas
+RECURSOS_FFMPEG = 'ffmpeg'          # Ejecutable de ffmpeg para los pósters de los videos
+
+# Las subidas de más de FILE_UPLOAD_MAX_MEMORY_SIZE se escriben por bloques en
+# un archivo temporal en lugar de quedar en memoria
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5 MB
+FILE_UPLOAD_HANDLERS = [
+    'miapp.archivos.LimiteTamanoUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Instrumentación de peticiones (miapp/instrumentacion.py)
+INSTRUMENTACION_SERVER_TIMING = DEBUG  # Cabecera Server-Timing con los tiempos de cada petición
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'consola': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # Una línea por petición con consultas y tiempos; los datos completos
+        # van en el atributo "instrumentacion" del registro
+        'miapp.instrumentacion': {'handlers': ['consola'], 'level': 'INFO' if DEBUG else 'WARNING'},
+    },
+}